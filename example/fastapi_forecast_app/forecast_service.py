@@ -0,0 +1,207 @@
+"""Upload spooling and the forecasting job behind POST /predict.
+
+run_forecast executes in worker processes, so this module must stay importable without the
+web app (no FastAPI, OAuth or settings imports at module level).
+"""
+import io
+import json
+import logging
+import os
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+ARROW_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+MODELS = ('prophet',)
+# Column names tried, in order, when the request does not name the date column
+DATE_COLUMN_CANDIDATES = ('ds', 'date', 'Date', 'DATE', 'timestamp', 'Timestamp', 'time')
+MAX_FIELD_BYTES = 64 * 1024
+MAX_PERIODS = 10000
+# Failures caused by the uploaded data rather than the server. pandas' ParserError and
+# EmptyDataError, bad dates and undecodable bytes are all ValueErrors; KeyError is a missing column.
+INPUT_ERRORS = (ValueError, KeyError)
+
+
+class UploadError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SpooledUpload:
+    """Form fields of a multipart request, with its file part written to a temporary file on disk."""
+
+    def __init__(self, spool_dir=None):
+        self.fields = {}
+        self.path = None
+        self.filename = None
+        self._spool_dir = spool_dir
+        self._file = None
+        self._headers = {}
+        self._field = None
+        self._value = None
+        self._header_field = b''
+        self._header_value = b''
+
+    def discard(self):
+        if self._file is not None:
+            self._file.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def callbacks(self):
+        return {
+            'on_part_begin': self._part_begin,
+            'on_part_data': self._part_data,
+            'on_part_end': self._part_end,
+            'on_header_field': lambda data, start, end: self._append_header('_header_field', data[start:end]),
+            'on_header_value': lambda data, start, end: self._append_header('_header_value', data[start:end]),
+            'on_header_end': self._header_end,
+            'on_headers_finished': self._headers_finished,
+        }
+
+    def _append_header(self, attribute, chunk):
+        setattr(self, attribute, getattr(self, attribute) + chunk)
+
+    def _part_begin(self):
+        self._headers = {}
+
+    def _header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b''
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        self._field = options.get(b'name', b'').decode('latin-1')
+        if b'filename' in options:
+            if self.path is not None:
+                raise UploadError("Only one file may be uploaded")
+            self.filename = options[b'filename'].decode('utf-8', 'replace')
+            self._file = tempfile.NamedTemporaryFile(prefix='predict-', suffix='.csv', dir=self._spool_dir, delete=False)
+            self.path = self._file.name
+            self._value = None
+        else:
+            self._value = bytearray()
+
+    def _part_data(self, data, start, end):
+        if self._value is None:
+            self._file.write(data[start:end])
+            return
+        self._value += data[start:end]
+        if len(self._value) > MAX_FIELD_BYTES:
+            raise UploadError(f"Form field {self._field!r} is larger than {MAX_FIELD_BYTES} bytes", 413)
+
+    def _part_end(self):
+        if self._value is None:
+            self._file.close()
+            self._file = None
+        else:
+            self.fields[self._field] = self._value.decode('utf-8')
+
+
+async def spool_upload(request, max_bytes, spool_dir=None):
+    """
+    Parse a multipart/form-data request as it streams in, writing the file part to disk.
+    :param request: The incoming request; its body is consumed.
+    :param max_bytes: Largest accepted body. Larger requests fail with a 413 UploadError as soon as
+        the limit is crossed, without reading the rest.
+    :return: A SpooledUpload; the caller must discard() it.
+    """
+    content_type, options = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or b'boundary' not in options:
+        raise UploadError("Expected a multipart/form-data request", 415)
+    declared = request.headers.get('content-length')
+    if declared is not None and declared.isdigit() and int(declared) > max_bytes:
+        raise UploadError(f"Request body is larger than {max_bytes} bytes", 413)
+
+    upload = SpooledUpload(spool_dir)
+    parser = MultipartParser(options[b'boundary'], upload.callbacks())
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes:
+                raise UploadError(f"Request body is larger than {max_bytes} bytes", 413)
+            parser.write(chunk)
+        parser.finalize()
+    except BaseException:
+        upload.discard()
+        raise
+    if upload.path is None:
+        upload.discard()
+        raise UploadError("No file part in the request")
+    return upload
+
+
+def _date_column(columns, column, date_column):
+    if date_column:
+        if date_column not in columns:
+            raise ValueError(f"Date column {date_column!r} is not in the file")
+        return date_column
+    for candidate in DATE_COLUMN_CANDIDATES:
+        if candidate in columns and candidate != column:
+            return candidate
+    others = [name for name in columns if name != column]
+    if not others:
+        raise ValueError("The file needs a date column besides the predicted column")
+    return others[0]
+
+
+def read_series(path, column, date_column=None):
+    """The (ds, y) series of one column of an uploaded CSV, reading only the two columns needed."""
+    columns = list(pd.read_csv(path, nrows=0).columns)
+    if column not in columns:
+        raise ValueError(f"Column {column!r} is not in the file; columns are {columns}")
+    date_column = _date_column(columns, column, date_column)
+    df = pd.read_csv(path, usecols=[date_column, column])
+    series = pd.DataFrame({
+        'ds': pd.to_datetime(df[date_column], errors='coerce'),
+        'y': pd.to_numeric(df[column], errors='coerce'),
+    }).dropna()
+    if len(series) < 2:
+        raise ValueError(f"Column {column!r} has fewer than two rows with a valid date and number")
+    return series.groupby('ds', as_index=False)['y'].mean()
+
+
+def _fit_prophet(series, periods, freq):
+    from prophet import Prophet
+
+    model = Prophet()
+    model.fit(series)
+    future = model.make_future_dataframe(periods=periods, freq=freq, include_history=False)
+    return model.predict(future)[['ds', 'yhat', 'yhat_lower', 'yhat_upper']]
+
+
+def run_forecast(path, column, model='prophet', periods=30, freq=None, date_column=None, output_format='json'):
+    """
+    Fit a model to one column of the CSV at path and forecast it. Runs in a worker process.
+    :return: (body, media_type) already serialised, so only bytes travel back to the server.
+    :raises INPUT_ERRORS: For unusable input, reported to the client as 422.
+    """
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+    if model not in MODELS:
+        raise ValueError(f"Unknown model {model!r}; choose one of {list(MODELS)}")
+    if not 1 <= periods <= MAX_PERIODS:
+        raise ValueError(f"periods must be between 1 and {MAX_PERIODS}")
+    series = read_series(path, column, date_column)
+    freq = freq or (pd.infer_freq(series['ds']) if len(series) >= 3 else None) or 'D'
+    forecast = _fit_prophet(series, periods, freq)
+
+    meta = {'column': column, 'model': model, 'freq': freq, 'training_rows': len(series)}
+    if output_format == 'arrow':
+        table = pa.Table.from_pandas(forecast, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               b'forecast': json.dumps(meta).encode()})
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue(), ARROW_MEDIA_TYPE
+    # The records are serialised once by to_json and spliced into the metadata object
+    records = forecast.to_json(orient='records', date_format='iso')
+    return f'{json.dumps(meta)[:-1]}, "forecast": {records}}}'.encode(), 'application/json'
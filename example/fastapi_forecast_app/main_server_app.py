@@ -1,15 +1,27 @@
+import asyncio
+import multiprocessing
 import os
+import random
 import secrets
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 
-import requests
-
+import httpx
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from authlib.integrations.starlette_client import OAuth
 from starlette.config import Config
 from starlette.middleware.sessions import SessionMiddleware
 
+# Shared modules live in the dashboard's utils package
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'forcast_dashboard'))
+
+from forecast_service import ARROW_MEDIA_TYPE, INPUT_ERRORS, UploadError, run_forecast, spool_upload
+from utils.instrumentation import PROMETHEUS_CONTENT_TYPE, registry
+
 
 # Load all the entries from .env file as environment variables
 # The .env file should have the values for GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET
@@ -25,7 +37,45 @@ config_data = {
 }
 config = Config(environ=config_data)
 
-app = FastAPI()
+TOKEN_URL = 'https://oauth2.googleapis.com/token'
+# Vertex AI endpoints used by /get_predictions when a call does not name its own project or region
+VERTEX_PROJECT_ID = os.getenv('VERTEX_PROJECT_ID', '')
+VERTEX_LOCATION = os.getenv('VERTEX_LOCATION', 'us-central1')
+# Prediction requests in flight across all users of this process
+MAX_CONCURRENT_PREDICTIONS = int(os.getenv('MAX_CONCURRENT_PREDICTIONS', '16'))
+PREDICTION_RETRIES = 3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Refresh tokens this long before they expire, so a request does not start with a token about to lapse
+TOKEN_EXPIRY_MARGIN_SECONDS = 60
+# A finished refresh is handed to requests that still carry the old token for this long
+REFRESH_REUSE_SECONDS = 30
+# /predict: worker processes fitting models, and how many jobs may be running or waiting for one.
+# Requests beyond that are turned away with 429 instead of queueing without bound.
+FORECAST_WORKERS = int(os.getenv('FORECAST_WORKERS', str(max(1, (os.cpu_count() or 2) - 1))))
+MAX_PENDING_FORECASTS = int(os.getenv('MAX_PENDING_FORECASTS', str(2 * FORECAST_WORKERS)))
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_MB', '100')) * 1024 * 1024
+# Uploads are spooled here; defaults to the system temp dir
+SPOOL_DIR = os.getenv('SPOOL_DIR') or None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # One pooled client for the token endpoint and Vertex AI, reused across requests
+    app.state.http = httpx.AsyncClient(
+        timeout=httpx.Timeout(60, connect=10),
+        limits=httpx.Limits(max_connections=MAX_CONCURRENT_PREDICTIONS + 4,
+                            max_keepalive_connections=MAX_CONCURRENT_PREDICTIONS))
+    app.state.prediction_slots = asyncio.Semaphore(MAX_CONCURRENT_PREDICTIONS)
+    # spawn: workers start clean instead of forking the server's threads and event loop
+    app.state.forecast_pool = ProcessPoolExecutor(max_workers=FORECAST_WORKERS,
+                                                  mp_context=multiprocessing.get_context('spawn'))
+    app.state.pending_forecasts = 0
+    yield
+    await app.state.http.aclose()
+    app.state.forecast_pool.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Add session middleware to manage user sessions
 app.add_middleware(SessionMiddleware, secret_key=config('SECRET_KEY'))
@@ -47,12 +97,42 @@ oauth.register(
     redirect_uri=config('REDIRECT_URI'),
     client_kwargs={
         'scope': ' '.join(["https://www.googleapis.com/auth/userinfo.profile",
-                           "https://www.googleapis.com/auth/userinfo.email"]),
+                           "https://www.googleapis.com/auth/userinfo.email",
+                           # Needed to call Vertex AI endpoints from /get_predictions
+                           "https://www.googleapis.com/auth/cloud-platform"]),
         'access_type': 'offline'},  # Request offline access to get refresh token
     server_metadata_url='https://accounts.google.com/.well-known/openid-configuration'
 )
 
 
+registry.describe('http_request_seconds', 'Request latency by route')
+registry.describe('http_requests_total', 'Responses by route and status code')
+registry.describe('token_refreshes_total', 'Token refresh calls to Google, by outcome')
+registry.describe('prediction_calls_total', 'Vertex AI predict calls made by /get_predictions, by outcome')
+registry.describe('forecasts_rejected_total', '/predict requests turned away, by reason')
+registry.describe('forecast_job_seconds', 'Time /predict jobs spent in the worker pool, including waiting for a worker')
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # The route template keeps label cardinality bounded, unlike the raw path
+    route = request.scope.get('route')
+    endpoint = route.path if route is not None else 'unmatched'
+    registry.observe('http_request_seconds', time.perf_counter() - start, method=request.method, endpoint=endpoint)
+    registry.inc('http_requests_total', method=request.method, endpoint=endpoint, status=response.status_code)
+    return response
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus scrape endpoint with request latency histograms and counters.
+    """
+    return Response(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 @app.get("/")
 async def homepage():
     return {"message": "Welcome to the FastAPI OAuth2 example. Visit /login to authenticate."}
@@ -92,6 +172,76 @@ async def auth(request: Request):
     return JSONResponse({"user": user, "token": token})
 
 
+class TokenRefreshError(Exception):
+    pass
+
+
+# refresh_token -> task fetching its next access token. Concurrent requests carrying the same
+# expired token await one task instead of each calling Google.
+_refreshes = {}
+
+
+async def _fetch_refreshed_token(refresh_token):
+    payload = {
+        'client_id': config('GOOGLE_CLIENT_ID'),
+        'client_secret': config('GOOGLE_CLIENT_SECRET'),
+        'refresh_token': refresh_token,
+        'grant_type': 'refresh_token',
+    }
+    try:
+        response = await app.state.http.post(TOKEN_URL, data=payload)
+        new_token = response.json()
+        if 'error' in new_token:
+            raise TokenRefreshError(new_token['error'])
+    except Exception:
+        registry.inc('token_refreshes_total', outcome='error')
+        raise
+    registry.inc('token_refreshes_total', outcome='ok')
+    # Retain the refresh token, so we can keep getting access tokens once they expire.
+    new_token['refresh_token'] = refresh_token
+    new_token.setdefault('expires_at', int(time.time()) + int(new_token.get('expires_in', 3600)))
+    return new_token
+
+
+def _forget_refresh(refresh_token, task):
+    if _refreshes.get(refresh_token) is task:
+        del _refreshes[refresh_token]
+
+
+def _schedule_forget(refresh_token, task):
+    # A failure is forgotten at once so the next request retries; a success is reused for a while
+    failed = task.cancelled() or task.exception() is not None
+    asyncio.get_running_loop().call_later(0 if failed else REFRESH_REUSE_SECONDS, _forget_refresh, refresh_token, task)
+
+
+async def refreshed(token):
+    """
+    A new token for this one, shared with every concurrent caller holding the same refresh token.
+    :param token: The session token, which must contain a refresh_token.
+    :return: The new token, keeping the refresh_token.
+    """
+    refresh_token = token['refresh_token']
+    task = _refreshes.get(refresh_token)
+    if task is None:
+        task = _refreshes[refresh_token] = asyncio.ensure_future(_fetch_refreshed_token(refresh_token))
+        task.add_done_callback(lambda done: _schedule_forget(refresh_token, done))
+    # shield: a caller that disconnects must not cancel the refresh the others are waiting on
+    return await asyncio.shield(task)
+
+
+async def fresh_token(request: Request):
+    """
+    The session token, refreshed first if it expires within TOKEN_EXPIRY_MARGIN_SECONDS.
+    :param request: Request object whose session holds the token.
+    :return: A token with a usable access_token, or None when the session has none.
+    """
+    token = request.session.get('token')
+    if token and token.get('refresh_token') and token.get('expires_at', 0) - time.time() < TOKEN_EXPIRY_MARGIN_SECONDS:
+        token = await refreshed(token)
+        request.session['token'] = token
+    return token
+
+
 @app.get("/refresh_token")
 async def refresh_token(request: Request):
     """
@@ -103,41 +253,159 @@ async def refresh_token(request: Request):
     if not token:
         return JSONResponse({"error": "Token not found in session"}, status_code=400)
 
-    refresh_token_url = 'https://oauth2.googleapis.com/token'
-    payload = {
-        'client_id': config('GOOGLE_CLIENT_ID'),
-        'client_secret': config('GOOGLE_CLIENT_SECRET'),
-        'refresh_token': token['refresh_token'],
-        'grant_type': 'refresh_token',
-    }
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-    }
-    response = requests.post(refresh_token_url, data=payload, headers=headers)
-    new_token = response.json()
-
-    if 'error' in new_token:
-        return JSONResponse({"error": new_token['error']}, status_code=400)
-
-    # Retain the refresh token, so we can keep getting access tokens once they expire.
-    new_token['refresh_token'] = token['refresh_token']
+    try:
+        new_token = await refreshed(token)
+    except TokenRefreshError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except httpx.HTTPError as e:
+        return JSONResponse({"error": f"Token endpoint unreachable: {e}"}, status_code=502)
 
     # Update the existing token info with the new one
     request.session['token'] = new_token
     return JSONResponse({"new_token": new_token})
 
 
-@app.get("/get_predictions")
+def predict_url(call):
+    project = call.get('project') or VERTEX_PROJECT_ID
+    location = call.get('location') or VERTEX_LOCATION
+    return (f"https://{location}-aiplatform.googleapis.com/v1/projects/{project}"
+            f"/locations/{location}/endpoints/{call['endpoint_id']}:predict")
+
+
+async def predict_one(call, session_token):
+    """
+    One Vertex AI predict call, retried with backoff on throttling and server errors.
+    :param call: Dict with endpoint_id, instances and optionally series_id, project, location, parameters.
+    :param session_token: {'token': session token} shared by the calls of one request. If the endpoint
+        rejects the access token it is refreshed once and stored back here, so the other calls and the
+        session pick up the new token instead of each refreshing again.
+    :return: Dict with series_id and either predictions or error.
+    """
+    token = session_token['token']
+    body = {'instances': call['instances']}
+    if call.get('parameters'):
+        body['parameters'] = call['parameters']
+    result = {'series_id': call.get('series_id', call['endpoint_id'])}
+    refreshed_once = False
+    for attempt in range(PREDICTION_RETRIES + 1):
+        try:
+            # Only the request itself holds a slot, not the backoff between attempts
+            async with app.state.prediction_slots:
+                response = await app.state.http.post(
+                    predict_url(call), json=body, headers={'Authorization': f"Bearer {token['access_token']}"})
+        except httpx.TransportError as e:
+            response, error = None, str(e)
+        if response is not None:
+            if response.status_code == 200:
+                registry.inc('prediction_calls_total', outcome='ok')
+                return {**result, 'predictions': response.json()['predictions']}
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+            if response.status_code == 401 and not refreshed_once and token.get('refresh_token'):
+                try:
+                    if session_token['token'] is token:
+                        session_token['token'] = await refreshed(token)
+                except (TokenRefreshError, httpx.HTTPError) as e:
+                    error = f"Could not refresh token: {e}"
+                    break
+                token, refreshed_once = session_token['token'], True
+                continue
+            if response.status_code not in RETRY_STATUSES:
+                break
+        if attempt < PREDICTION_RETRIES:
+            await asyncio.sleep(0.5 * 2 ** attempt * random.uniform(0.5, 1.5))
+    registry.inc('prediction_calls_total', outcome='error')
+    return {**result, 'error': error}
+
+
+@app.post("/get_predictions")
 async def get_predictions(request: Request):
     """
-    Your custom API endpoint to fetch results from GCP for any allowed GCP service
-    :param request:
-    :return:
+    Fetch predictions for several series or endpoints at once. The body is
+    {"calls": [{"series_id": ..., "endpoint_id": ..., "instances": [...]}, ...]}; project and
+    location default to VERTEX_PROJECT_ID and VERTEX_LOCATION. Calls run concurrently, at most
+    MAX_CONCURRENT_PREDICTIONS at a time across the process, and one failing call does not fail the others.
+    :param request: Request object containing data related to the incoming request.
+    :return: {"results": [...]} in the order of the calls, each with predictions or an error.
     """
-    token = request.session.get('token')
+    try:
+        token = await fresh_token(request)
+    except (TokenRefreshError, httpx.HTTPError) as e:
+        return JSONResponse({"error": f"Could not refresh token: {e}"}, status_code=401)
     if not token:
         return JSONResponse({"error": "Token not found in session"}, status_code=400)
 
+    try:
+        body = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "Request body is not valid JSON"}, status_code=422)
+    calls = body.get('calls') if isinstance(body, dict) else None
+    if not calls or any(not isinstance(call, dict) or 'endpoint_id' not in call or 'instances' not in call
+                        for call in calls):
+        return JSONResponse({"error": "Expected {\"calls\": [{\"endpoint_id\": ..., \"instances\": [...]}]}"},
+                            status_code=422)
+
+    session_token = {'token': token}
+    results = await asyncio.gather(*(predict_one(call, session_token) for call in calls))
+    if session_token['token'] is not token:
+        request.session['token'] = session_token['token']
+    return JSONResponse({"results": results})
+
+
+@app.post("/predict")
+async def predict(request: Request):
+    """
+    Forecast one column of an uploaded CSV, as in the README:
+    curl -X POST /predict -F file=@dataset.csv -F column=sales -F model=prophet
+    Optional form fields: periods (default 30), freq (inferred), date_column (detected) and
+    format=json|arrow; an Accept header of application/vnd.apache.arrow.stream also selects Arrow.
+    The upload is streamed to disk and the fit runs in a worker process, so the event loop only moves bytes.
+    :param request: A multipart/form-data request.
+    :return: The forecast (ds, yhat, yhat_lower, yhat_upper) as JSON or an Arrow IPC stream;
+        413 for oversized uploads, 422 for unusable input, 429 when the worker pool is saturated.
+    """
+    if app.state.pending_forecasts >= MAX_PENDING_FORECASTS:
+        registry.inc('forecasts_rejected_total', reason='saturated')
+        return JSONResponse({"error": "Forecast workers are busy, retry shortly"}, status_code=429,
+                            headers={'Retry-After': '5'})
+    # Reserved before reading the body, so slow uploads count against the limit too
+    app.state.pending_forecasts += 1
+    upload = None
+    try:
+        try:
+            upload = await spool_upload(request, MAX_UPLOAD_BYTES, SPOOL_DIR)
+        except UploadError as e:
+            registry.inc('forecasts_rejected_total', reason=str(e.status_code))
+            return JSONResponse({"error": str(e)}, status_code=e.status_code)
+
+        fields = upload.fields
+        if not fields.get('column'):
+            return JSONResponse({"error": "The 'column' form field is required"}, status_code=422)
+        output_format = fields.get('format') or (
+            'arrow' if ARROW_MEDIA_TYPE in request.headers.get('accept', '') else 'json')
+        if output_format not in ('json', 'arrow'):
+            return JSONResponse({"error": "format must be 'json' or 'arrow'"}, status_code=422)
+        try:
+            periods = int(fields.get('periods') or 30)
+        except ValueError:
+            return JSONResponse({"error": "periods must be an integer"}, status_code=422)
+
+        start = time.perf_counter()
+        try:
+            body, media_type = await asyncio.get_running_loop().run_in_executor(
+                app.state.forecast_pool, run_forecast, upload.path, fields['column'],
+                fields.get('model') or 'prophet', periods, fields.get('freq') or None,
+                fields.get('date_column') or None, output_format)
+        except INPUT_ERRORS as e:
+            # str(KeyError) is only the quoted key, so name the error type too
+            message = str(e) if isinstance(e, ValueError) else f"{type(e).__name__}: {e}"
+            return JSONResponse({"error": message}, status_code=422)
+        finally:
+            registry.observe('forecast_job_seconds', time.perf_counter() - start)
+        return Response(body, media_type=media_type)
+    finally:
+        app.state.pending_forecasts -= 1
+        if upload is not None:
+            upload.discard()
 
 
 if __name__ == "__main__":
@@ -1,8 +1,11 @@
 import cherrypy
 from requests_oauthlib import OAuth2Session
-import requests
 import json
 import os
+import threading
+from collections import OrderedDict
+
+from utils.prediction_client import ClientClosedError, PredictionClient
 
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
@@ -18,9 +21,15 @@ project_id = ''
 endpoint_id = ''
 predict_url_template = ''
 
+# Sent by /model when no instances are given
+EXAMPLE_INSTANCES = [{"input": [0, 0.3, -0.2], "freq": 2}]
+# Access tokens with a live prediction client; the least recently used is closed beyond this
+MAX_CLIENTS = 16
+
 class OAuth2App:
     def __init__(self):
-        pass
+        self._clients = OrderedDict()
+        self._clients_lock = threading.Lock()
 
     @cherrypy.expose
     def index(self):
@@ -58,39 +67,41 @@ class OAuth2App:
             return f"No authorization code found. Parameters received: state={state}, code={code}, scope={scope}"
 
     @cherrypy.expose
-    def model(self):
+    def model(self, instances=None):
         """Step 3: Accessing the model endpoint.
         Use the access token to retrieve results from the specified model URL.
+        instances is an optional JSON list of instances; they are sent in batches.
         """
         oauth_token = cherrypy.session.get('oauth_token')
         if not oauth_token:
             return "No access token available. Please authenticate first."
 
-        model_url = predict_url_template.format(project_id=project_id, endpoint_id=endpoint_id)
-        headers = {
-            'Authorization': f'Bearer {oauth_token["access_token"]}',
-            'Content-Type': 'application/json'
-        }
-        # Adjust the payload to match the expected format
-        payload = json.dumps({
-            "instances": [
-                {
-                "input": [
-                    0,
-                    0.3,
-                    -0.2
-                ],
-                "freq": 2
-                }
-            ]
-        })
+        instances = json.loads(instances) if instances else EXAMPLE_INSTANCES
+        try:
+            try:
+                predictions = self._client(oauth_token['access_token']).predict_many(instances)
+            except ClientClosedError:
+                # Evicted by another session between lookup and use; a fresh client takes over
+                predictions = self._client(oauth_token['access_token']).predict_many(instances)
+        except Exception as e:
+            return f'Failed to retrieve model response: {e}'
+        return f'Model response: {{"predictions": {json.dumps(predictions)}}}'
 
-        response = requests.post(model_url, headers=headers, data=payload)
-
-        if response.status_code == 200:
-            return f'Model response: {response.json()}'
-        else:
-            return f'Failed to retrieve model response. Status code: {response.status_code}, Response: {response.text}'
+    def _client(self, access_token):
+        """One pooled, batching client per access token, so concurrent sessions share connections."""
+        expired = []
+        with self._clients_lock:
+            client = self._clients.pop(access_token, None)
+            if client is None:
+                model_url = predict_url_template.format(project_id=project_id, endpoint_id=endpoint_id)
+                client = PredictionClient(model_url, token=access_token)
+            self._clients[access_token] = client
+            while len(self._clients) > MAX_CLIENTS:
+                expired.append(self._clients.popitem(last=False)[1])
+        # close() waits for in-flight requests and their retries; other sessions must not wait on that
+        for evicted in expired:
+            evicted.close()
+        return client
 
 if __name__ == '__main__':
     cherrypy.quickstart(OAuth2App(), '/', config={
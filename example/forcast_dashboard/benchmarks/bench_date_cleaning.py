@@ -0,0 +1,65 @@
+"""Compare the old string round-trip date cleaning with the datetime64 pipeline.
+
+Run from example/forcast_dashboard:  python -m benchmarks.bench_date_cleaning --rows 10000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.data_cleaning import DataCleaner
+
+
+def make_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2015-01-01', periods=24 * 365 * 5, freq='h')
+    return pd.DataFrame({
+        'Date': dates[rng.integers(0, len(dates), rows)].strftime('%Y-%m-%d %H:%M:%S'),
+        'value': rng.random(rows),
+    })
+
+
+def legacy_pipeline(df, date_column, target_column):
+    # The pre-datetime64 DataCleaner: parse without a format, format to strings, parse again
+    cleaned_df = df.copy()
+    cleaned_df[date_column] = pd.to_datetime(cleaned_df[date_column], errors='coerce')
+    cleaned_df.dropna(subset=[date_column], inplace=True)
+    cleaned_df[date_column] = cleaned_df[date_column].dt.strftime('%Y-%m-%d')
+    cleaned_df[date_column] = pd.to_datetime(cleaned_df[date_column])
+    return cleaned_df.groupby(date_column).agg({target_column: 'sum'}).reset_index()
+
+
+def current_pipeline(df, date_column, target_column):
+    cleaned_df = DataCleaner(df).clean_data(date_column)
+    return DataCleaner(cleaned_df).aggregate_data(date_column, target_column, [])
+
+
+def time_call(fn, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows)
+    legacy = legacy_pipeline(df, 'Date', 'value')
+    current = current_pipeline(df, 'Date', 'value')
+    np.testing.assert_allclose(legacy['value'].values, current['y'].values)
+
+    legacy_seconds = time_call(legacy_pipeline, df, 'Date', 'value', repeat=args.repeat)
+    current_seconds = time_call(current_pipeline, df, 'Date', 'value', repeat=args.repeat)
+    print(f"rows={args.rows} legacy={legacy_seconds:.3f}s datetime64={current_seconds:.3f}s "
+          f"speedup={legacy_seconds / current_seconds:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
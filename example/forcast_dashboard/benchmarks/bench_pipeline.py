@@ -0,0 +1,143 @@
+"""Time and memory-profile every stage of the single-series forecasting pipeline.
+
+Each scenario generates synthetic sales (see benchmarks.synthetic), then runs the stages
+main.py runs on an upload: load_csv, load_csv_projected, DataCleaner.clean_data,
+filter_data, aggregate_data, forecast_with_prophet, validate_forecast and the
+recommendation analytics behind recommend_actions. Each stage's output feeds the next.
+
+Every stage is timed over --repeat runs, then run once more under tracemalloc for its
+peak allocation. Results are written as JSON for benchmarks.compare.
+
+Run from example/forcast_dashboard:
+    python -m benchmarks.bench_pipeline --suite standard --output bench-$(git rev-parse --short HEAD).json
+    python -m benchmarks.bench_pipeline --series 1000 --rows 10000000 --regressors --output big.json
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import prophet
+
+from benchmarks.synthetic import REGRESSOR_COLUMNS, make_dataset
+from utils.data_cleaning import DataCleaner
+from utils.data_loading import load_csv, load_csv_projected
+from utils.forecasting import forecast_with_prophet, validate_forecast
+from utils.recommendations import recommendations
+
+SEASONALITY = {'yearly': True, 'weekly': True, 'daily': False}
+PERIOD = 90
+
+# (series, rows, regressors) per suite
+SUITES = {
+    'smoke': [(1, 1000, False), (10, 10000, True)],
+    'standard': [(1, 100000, False), (100, 1000000, False), (100, 1000000, True), (10000, 1000000, False)],
+    'large': [(1000, 10000000, False), (10000, 10000000, True)],
+}
+
+
+def measure(fn, *args, repeat=3):
+    """Best and median wall time over repeat runs, peak traced MB of one more run, and the result."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        seconds.append(time.perf_counter() - start)
+    # Tracing slows allocation-heavy code, so memory gets its own untimed run
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': min(seconds), 'median_seconds': statistics.median(seconds), 'peak_mb': peak / 1e6}, result
+
+
+def run_scenario(n_series, n_rows, regressors, repeat=3, seed=0):
+    additional_columns = REGRESSOR_COLUMNS if regressors else []
+    csv_bytes = make_dataset(n_series, n_rows, regressors=regressors, seed=seed).to_csv(index=False).encode()
+    stages = []
+
+    def stage(name, fn):
+        stats, result = measure(fn, repeat=repeat)
+        stages.append({'stage': name, **stats})
+        logging.info("%-22s %8.3fs %9.1f MB", name, stats['seconds'], stats['peak_mb'])
+        return result
+
+    df = stage('load_csv', lambda: load_csv(io.BytesIO(csv_bytes)))
+    usecols = ['Date', 'Sales', 'Store'] + additional_columns
+    stage('load_csv_projected', lambda: load_csv_projected(io.BytesIO(csv_bytes), usecols, date_columns=['Date'],
+                                                           exact_columns=['Sales']))
+    cleaned_df = stage('clean_data', lambda: DataCleaner(df).clean_data('Date'))
+    filtered_df = stage('filter_data', lambda: DataCleaner(cleaned_df).filter_data('Store', 'Store-0'))
+    aggregated_df = stage('aggregate_data',
+                          lambda: DataCleaner(filtered_df).aggregate_data('Date', 'Sales', additional_columns))
+    forecast, model, train_df, test_df = stage(
+        'forecast_with_prophet',
+        lambda: forecast_with_prophet(aggregated_df, 'Date', 'y', PERIOD, SEASONALITY, additional_columns))
+    stage('validate_forecast', lambda: validate_forecast(model, train_df, test_df))
+    stage('recommendations', lambda: recommendations(forecast))
+
+    return {
+        'scenario': f"series={n_series} rows={n_rows}" + (" regressors" if regressors else ""),
+        'series': n_series,
+        'rows': n_rows,
+        'regressors': regressors,
+        'csv_mb': len(csv_bytes) / 1e6,
+        'stages': stages,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'prophet': prophet.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', choices=sorted(SUITES), default='smoke')
+    parser.add_argument('--series', type=int, help="Run one scenario with this many series instead of a suite")
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--regressors', action='store_true')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', required=True, help="JSON file to write")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    for name in ('cmdstanpy', 'prophet', 'utils'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    scenarios = [(args.series, args.rows, args.regressors)] if args.series else SUITES[args.suite]
+    results = []
+    for n_series, n_rows, regressors in scenarios:
+        logging.info("series=%d rows=%d regressors=%s", n_series, n_rows, regressors)
+        results.append(run_scenario(n_series, n_rows, regressors, args.repeat))
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Latency of forecast_with_prophet's prediction step under each scoring and uncertainty mode.
+
+One Prophet model is fitted on a long synthetic daily series, then the same horizon is
+predicted with the whole history included (the old behaviour) and horizon-only, under
+every mode in UNCERTAINTY_MODES. Interval modes are also compared with the 1000-path
+sampled intervals of the same rows: the mean absolute gap of their bounds, as a share of
+the sampled interval width.
+
+Run from example/forcast_dashboard:
+    python -m benchmarks.bench_prediction_modes --days 3650 --period 90
+"""
+import argparse
+import json
+import logging
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_pipeline import SEASONALITY, environment
+from benchmarks.synthetic import make_dataset
+from utils.forecasting import UNCERTAINTY_MODES, fit_prophet, predict
+
+
+def timed(fn, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - start)
+    return result, statistics.median(seconds)
+
+
+def interval_gap(forecast, reference):
+    width = (reference['yhat_upper'] - reference['yhat_lower']).to_numpy()
+    gap = (np.abs(forecast['yhat_lower'].to_numpy() - reference['yhat_lower'].to_numpy())
+           + np.abs(forecast['yhat_upper'].to_numpy() - reference['yhat_upper'].to_numpy())) / 2
+    return float(np.mean(gap / width))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=3650, help="Length of the training series")
+    parser.add_argument('--period', type=int, default=90)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Optional JSON file to write")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    for name in ('cmdstanpy', 'prophet', 'utils'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    raw = make_dataset(1, args.days, args.days, seed=args.seed)
+    train_df = pd.DataFrame({'ds': pd.to_datetime(raw['Date']), 'y': raw['Sales']})
+    start = time.perf_counter()
+    model = fit_prophet(train_df, SEASONALITY, [])
+    fit_seconds = time.perf_counter() - start
+    horizon = model.make_future_dataframe(periods=args.period, include_history=False)
+    full = pd.concat([train_df[['ds']], horizon], ignore_index=True)
+    logging.info("days=%d period=%d fit=%.2fs", args.days, args.period, fit_seconds)
+
+    np.random.seed(args.seed)
+    results = []
+    _, seconds = timed(lambda: predict(model, full, 'samples'), args.repeat)
+    results.append({'rows': 'history+horizon', 'uncertainty': 'samples', 'seconds': seconds, 'interval_gap': None})
+    reference, _ = timed(lambda: predict(model, horizon, 'samples'), 1)
+    for mode in UNCERTAINTY_MODES:
+        forecast, seconds = timed(lambda: predict(model, horizon, mode), args.repeat)
+        gap = interval_gap(forecast, reference) if mode != 'off' else None
+        results.append({'rows': 'horizon', 'uncertainty': mode, 'seconds': seconds, 'interval_gap': gap})
+
+    baseline = results[0]['seconds']
+    print(f"fit: {fit_seconds:.2f}s on {args.days} days; predicting {args.period} days")
+    print(f"{'rows':<16} {'uncertainty':<11} {'seconds':>8} {'speedup':>8} {'interval gap':>13}")
+    for result in results:
+        result['speedup'] = baseline / result['seconds']
+        gap = '-' if result['interval_gap'] is None else f"{result['interval_gap']:.1%}"
+        print(f"{result['rows']:<16} {result['uncertainty']:<11} {result['seconds']:>8.4f} "
+              f"{result['speedup']:>7.1f}x {gap:>13}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'days': args.days, 'period': args.period,
+                       'fit_seconds': fit_seconds, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Throughput of one request per instance versus the micro-batching PredictionClient.
+
+Both are driven by the same number of concurrent callers against the local fake endpoint
+(or a real one with --url and --token):
+
+    python -m benchmarks.bench_predictions --instances 20000 --callers 64 --failure-rate 0.02
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fake_vertex_endpoint import serve
+from utils.prediction_client import PredictionClient
+
+
+def make_instances(n):
+    return [{'input': [i % 7, 0.3, -0.2], 'freq': 2} for i in range(n)]
+
+
+def unbatched(url, instances, callers):
+    # The old GCP_linkv1 pattern: a bare requests.post per instance, no retries
+    def call(instance):
+        response = requests.post(url, data=json.dumps({'instances': [instance]}),
+                                 headers={'Content-Type': 'application/json'}, timeout=60)
+        return response.json()['predictions'][0] if response.status_code == 200 else None
+
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        return list(executor.map(call, instances))
+
+
+def batched(url, token, instances, callers):
+    with PredictionClient(url, token=token) as client:
+        with ThreadPoolExecutor(max_workers=callers) as executor:
+            predictions = list(executor.map(client.predict, instances))
+        return predictions, client.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--instances', type=int, default=5000)
+    parser.add_argument('--callers', type=int, default=64)
+    parser.add_argument('--url', help="Endpoint :predict URL; defaults to a local fake endpoint")
+    parser.add_argument('--token')
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--skip-unbatched', action='store_true')
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        server = serve(latency=args.latency, failure_rate=args.failure_rate)
+        url = f"http://127.0.0.1:{server.server_port}/v1/predict"
+    instances = make_instances(args.instances)
+
+    if not args.skip_unbatched:
+        start = time.perf_counter()
+        predictions = unbatched(url, instances, args.callers)
+        seconds = time.perf_counter() - start
+        failed = sum(prediction is None for prediction in predictions)
+        print(f"unbatched: {len(instances) / seconds:8.0f} instances/s  {len(instances)} requests  {failed} failed")
+
+    start = time.perf_counter()
+    predictions, stats = batched(url, args.token, instances, args.callers)
+    seconds = time.perf_counter() - start
+    print(f"batched:   {len(instances) / seconds:8.0f} instances/s  {stats['requests']} requests "
+          f"(mean batch {stats['mean_batch_size']:.1f}, {stats['retries']} retries)")
+
+
+if __name__ == '__main__':
+    main()
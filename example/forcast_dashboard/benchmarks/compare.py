@@ -0,0 +1,68 @@
+"""Compare two bench_pipeline JSON files stage by stage and flag regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.1
+
+Exits with status 1 when any stage got slower or used more memory than the threshold
+allows, so it can gate a CI job. Stages faster than --min-seconds in both runs are
+reported but never flagged, since their timing is mostly noise.
+"""
+import argparse
+import json
+import sys
+
+
+def _stages(path):
+    with open(path) as f:
+        report = json.load(f)
+    stages = {(result['scenario'], stage['stage']): stage
+              for result in report['results'] for stage in result['stages']}
+    return report['environment'], stages
+
+
+def compare(baseline, candidate, threshold=0.1, min_seconds=0.01):
+    """Rows of (scenario, stage, base s, new s, time ratio, base MB, new MB, memory ratio, regressed)."""
+    rows = []
+    for key in baseline:
+        if key not in candidate:
+            continue
+        old, new = baseline[key], candidate[key]
+        time_ratio = new['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+        memory_ratio = new['peak_mb'] / old['peak_mb'] if old['peak_mb'] else 1.0
+        timed = max(old['seconds'], new['seconds']) >= min_seconds
+        regressed = (timed and time_ratio > 1 + threshold) or memory_ratio > 1 + threshold
+        rows.append((*key, old['seconds'], new['seconds'], time_ratio, old['peak_mb'], new['peak_mb'],
+                     memory_ratio, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.1, help="Allowed relative slowdown or memory growth")
+    parser.add_argument('--min-seconds', type=float, default=0.01)
+    args = parser.parse_args()
+
+    base_env, baseline = _stages(args.baseline)
+    new_env, candidate = _stages(args.candidate)
+    print(f"baseline  {base_env.get('commit')}  {base_env.get('timestamp')}")
+    print(f"candidate {new_env.get('commit')}  {new_env.get('timestamp')}")
+    if (base_env.get('cpu_count'), base_env.get('platform')) != (new_env.get('cpu_count'), new_env.get('platform')):
+        print("warning: the runs come from different machines")
+
+    rows = compare(baseline, candidate, args.threshold, args.min_seconds)
+    print(f"{'scenario':<36} {'stage':<22} {'base s':>9} {'new s':>9} {'ratio':>6} {'base MB':>9} {'new MB':>9} {'ratio':>6}")
+    for scenario, stage, old_s, new_s, time_ratio, old_mb, new_mb, memory_ratio, regressed in rows:
+        print(f"{scenario:<36} {stage:<22} {old_s:>9.3f} {new_s:>9.3f} {time_ratio:>6.2f} "
+              f"{old_mb:>9.1f} {new_mb:>9.1f} {memory_ratio:>6.2f}{'  REGRESSION' if regressed else ''}")
+    missing = sorted(set(baseline) - set(candidate))
+    for scenario, stage in missing:
+        print(f"{scenario:<36} {stage:<22} missing from candidate")
+
+    regressions = sum(row[-1] for row in rows)
+    print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
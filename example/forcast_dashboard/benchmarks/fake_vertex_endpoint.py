@@ -0,0 +1,79 @@
+"""Local stand-in for a Vertex AI endpoint's :predict method.
+
+Answers POST {"instances": [...]} with one prediction per instance (the sum of the
+instance's "input" list), after a fixed per-request latency plus a per-instance cost.
+A share of requests can fail with 503 or 429 to exercise client retries.
+
+    python -m benchmarks.fake_vertex_endpoint --port 8501 --latency 0.05 --failure-rate 0.02
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(latency, per_instance, failure_rate, max_instances):
+    class PredictHandler(BaseHTTPRequestHandler):
+        counts = {'requests': 0, 'instances': 0}
+        lock = threading.Lock()
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            instances = body.get('instances', [])
+            if len(instances) > max_instances:
+                return self._reply(400, {'error': f"at most {max_instances} instances per request"})
+            time.sleep(latency + per_instance * len(instances))
+            if random.random() < failure_rate:
+                return self._reply(random.choice([429, 503]), {'error': 'fake transient failure'})
+            with self.lock:
+                self.counts['requests'] += 1
+                self.counts['instances'] += len(instances)
+            self._reply(200, {'predictions': [sum(instance.get('input', [])) for instance in instances],
+                              'deployedModelId': 'fake'})
+
+        def _reply(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return PredictHandler
+
+
+class _Server(ThreadingHTTPServer):
+    # The default listen backlog of 5 resets connections under a few dozen concurrent callers
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def serve(port=0, latency=0.05, per_instance=0.0001, failure_rate=0.0, max_instances=1000):
+    """Start the endpoint on a background thread; returns the server (server.server_port is the port)."""
+    server = _Server(('127.0.0.1', port), make_handler(latency, per_instance, failure_rate, max_instances))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8501)
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per request")
+    parser.add_argument('--per-instance', type=float, default=0.0001, help="Extra seconds per instance")
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server = serve(args.port, args.latency, args.per_instance, args.failure_rate)
+    print(f"Fake endpoint on http://127.0.0.1:{server.server_port}/v1/predict")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Synthetic sales data shaped like the dashboard's uploads, at any scale.
+
+Rows are transactions spread over n_series stores and n_days days, so the pipeline's
+cleaning, filtering and aggregation stages do real work at every size. Each store has
+its own level, trend, weekly and yearly pattern; regressors are a price and a promo flag
+that move sales.
+
+    python -m benchmarks.synthetic --series 100 --rows 1000000 --regressors --output sales.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+REGRESSOR_COLUMNS = ['Price', 'Promo']
+
+
+def make_dataset(n_series, n_rows, n_days=3 * 365, regressors=False, seed=0, start='2020-01-01'):
+    """DataFrame of Date (text, as uploads are), Store, Sales and optionally Price and Promo."""
+    rng = np.random.default_rng(seed)
+    n_series = max(1, min(n_series, n_rows))
+    n_days = max(1, min(n_days, n_rows // n_series))
+    # Every store gets rows on every day before the rest are spread at random
+    base = np.arange(n_series * n_days)
+    extra = rng.integers(0, n_series * n_days, n_rows - len(base))
+    cell = np.concatenate([base, extra])[:n_rows]
+    store = cell % n_series
+    day = cell // n_series
+
+    level = rng.uniform(50, 500, n_series)[store]
+    trend = rng.normal(0, 0.05, n_series)[store] * day
+    weekly = rng.uniform(0, 0.3, n_series)[store] * np.sin(2 * np.pi * day / 7)
+    yearly = rng.uniform(0, 0.5, n_series)[store] * np.sin(2 * np.pi * day / 365.25)
+    sales = level * (1 + weekly + yearly) + trend + rng.normal(0, 5, n_rows)
+
+    dates = pd.date_range(start, periods=n_days, freq='D').strftime('%Y-%m-%d').to_numpy()
+    df = pd.DataFrame({
+        'Date': dates[day],
+        'Store': np.char.add('Store-', store.astype(str)),
+    })
+    if regressors:
+        price = rng.uniform(1, 10, n_rows).round(2)
+        promo = (rng.random(n_rows) < 0.1).astype(int)
+        sales = sales - 3 * price + 40 * promo
+        df['Price'] = price
+        df['Promo'] = promo
+    df['Sales'] = np.maximum(sales, 0).round(2)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--series', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=3 * 365)
+    parser.add_argument('--regressors', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+    make_dataset(args.series, args.rows, args.days, args.regressors, args.seed).to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
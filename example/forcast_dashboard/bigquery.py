@@ -3,11 +3,13 @@ from requests_oauthlib import OAuth2Session
 import requests
 import json
 import os
-import pandas as pd
+import pyarrow as pa
 from google.oauth2.credentials import Credentials
 from google.cloud import bigquery
 from google.api_core.exceptions import NotFound, Forbidden
 
+from utils.data_loading import csv_to_parquet
+
 # Allow OAuthlib to use HTTP for local testing
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
@@ -24,6 +26,25 @@ project_id = ''
 dataset_id = ''
 table_id = ''
 
+def bigquery_schema(arrow_schema):
+    """BigQuery schema fields matching the column types of the converted Parquet file."""
+    schema = []
+    for field in arrow_schema:
+        if pa.types.is_integer(field.type):
+            field_type = bigquery.enums.SqlTypeNames.INTEGER
+        elif pa.types.is_floating(field.type):
+            field_type = bigquery.enums.SqlTypeNames.FLOAT
+        elif pa.types.is_boolean(field.type):
+            field_type = bigquery.enums.SqlTypeNames.BOOLEAN
+        elif pa.types.is_timestamp(field.type):
+            field_type = bigquery.enums.SqlTypeNames.TIMESTAMP
+        elif pa.types.is_date(field.type):
+            field_type = bigquery.enums.SqlTypeNames.DATE
+        else:
+            field_type = bigquery.enums.SqlTypeNames.STRING
+        schema.append(bigquery.SchemaField(field.name, field_type))
+    return schema
+
 class OAuth2App:
     def __init__(self):
         self.upload_dir = os.path.join(os.getcwd(), 'uploads')
@@ -83,7 +104,7 @@ class OAuth2App:
             </html>
         """
 
-   @cherrypy.expose
+    @cherrypy.expose
     def upload_file(self, csv_file):
         """Process the uploaded CSV file and upload it to BigQuery."""
         oauth_token = cherrypy.session.get('oauth_token')
@@ -99,39 +120,16 @@ class OAuth2App:
                     break
                 out.write(data)
 
-        # Try reading the CSV file with different encodings and handle bad lines
+        # One streaming pass to Parquet: the encoding comes from a byte sample, column types
+        # from the first block, and only one block is in memory at a time whatever the file size
+        parquet_path = os.path.splitext(upload_path)[0] + '.parquet'
         try:
-            df = pd.read_csv(upload_path, encoding='utf-8', on_bad_lines='skip')
-        except UnicodeDecodeError:
-            try:
-                df = pd.read_csv(upload_path, encoding='latin1', on_bad_lines='skip')
-            except UnicodeDecodeError:
-                try:
-                    df = pd.read_csv(upload_path, encoding='iso-8859-1', on_bad_lines='skip')
-                except UnicodeDecodeError:
-                    return "Unable to read the file with utf-8, latin1, or iso-8859-1 encoding."
-
-        # Ensure correct data types
-        for column in df.select_dtypes(include=['float64']).columns:
-            df[column] = df[column].astype('float64')
-        for column in df.select_dtypes(include=['int64']).columns:
-            df[column] = df[column].astype('int64')
-        for column in df.select_dtypes(include=['object']).columns:
-            df[column] = df[column].astype('str')
-
-        # Add user information to the DataFrame
-        df['user_email'] = user_info['email']
-        df['user_id'] = user_info['id']
-
-        # Dynamically create schema based on the DataFrame columns
-        schema = []
-        for column in df.columns:
-            if df[column].dtype == 'float64':
-                schema.append(bigquery.SchemaField(column, bigquery.enums.SqlTypeNames.FLOAT))
-            elif df[column].dtype == 'int64':
-                schema.append(bigquery.SchemaField(column, bigquery.enums.SqlTypeNames.INTEGER))
-            else:
-                schema.append(bigquery.SchemaField(column, bigquery.enums.SqlTypeNames.STRING))
+            arrow_schema, rows = csv_to_parquet(upload_path, parquet_path,
+                                                constant_columns={'user_email': user_info['email'],
+                                                                  'user_id': user_info['id']})
+        except (pa.ArrowInvalid, UnicodeDecodeError) as e:
+            return f"Unable to read {csv_file.filename} as CSV: {str(e)}"
+        schema = bigquery_schema(arrow_schema)
 
         credentials = Credentials(
             token=oauth_token['access_token'],
@@ -166,12 +164,15 @@ class OAuth2App:
         except Exception as e:
             return f"Failed to create table: {str(e)}"
 
-        job_config = bigquery.LoadJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_APPEND)
+        job_config = bigquery.LoadJobConfig(source_format=bigquery.SourceFormat.PARQUET,
+                                            write_disposition=bigquery.WriteDisposition.WRITE_APPEND)
 
-        load_job = bigquery_client.load_table_from_dataframe(df, table_ref, job_config=job_config)
+        with open(parquet_path, 'rb') as parquet_file:
+            load_job = bigquery_client.load_table_from_file(parquet_file, table_ref, job_config=job_config)
         load_job.result()
+        os.remove(parquet_path)
 
-        return f"Successfully uploaded {csv_file.filename} to BigQuery for user {user_info['email']} in table {table_name}."
+        return f"Successfully uploaded {rows} rows of {csv_file.filename} to BigQuery for user {user_info['email']} in table {table_name}."
 
 
 if __name__ == '__main__':
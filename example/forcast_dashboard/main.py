@@ -1,11 +1,27 @@
+import hashlib
 import logging
+import os
+import time
 
+import pandas as pd
 import streamlit as st
 from streamlit_option_menu import option_menu
-from utils.data_loading import load_csv
+from utils.data_loading import load_csv_projected, profile_csv
 from utils.data_cleaning import DataCleaner
-from utils.forecasting import forecast_with_prophet, validate_forecast
-from utils.visualization import plot_forecast, plot_seasonality, plot_validation
+from utils.baselines import BASELINE_MODELS
+from utils.forecasting import UNCERTAINTY_MODES, forecast_with_prophet, in_sample_forecast, validate_forecast
+from utils.hierarchy import RECONCILIATION_METHODS, TOTAL, forecast_hierarchy
+from utils.history import ForecastHistory
+from utils.incremental import ParamStore
+from utils.instrumentation import span, trace
+from utils.model_cache import ModelCache
+from utils.recommendations import recommendations
+from utils.regressors import FUTURE_STRATEGIES
+from utils.parallel_forecasting import ALL_SERIES_MODELS, forecast_all_series
+from utils.backtesting import backtest
+from utils.model_comparison import MODELS, compare_models
+from utils.visualization import (plot_actual_vs_predicted, plot_backtest, plot_comparison, plot_forecast,
+                                 plot_seasonality, plot_validation)
 
 # Configure logging
 logging.basicConfig(
@@ -23,6 +39,78 @@ def local_css(file_name):
     with open(file_name) as f:
         st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
 
+@st.cache_resource
+def get_model_cache():
+    return ModelCache(cache_dir=os.path.join(os.getcwd(), '.model_cache'))
+
+@st.cache_resource
+def get_param_store():
+    return ParamStore(os.path.join(os.getcwd(), '.param_store'))
+
+@st.cache_resource
+def get_history():
+    return ForecastHistory(os.path.join(os.getcwd(), '.history', 'history.db'))
+
+# Streamlit reruns the script on every interaction; these read the whole upload once per session
+def upload_marker(uploaded_file):
+    return (uploaded_file.file_id, uploaded_file.name, uploaded_file.size)
+
+def dataset_hash(uploaded_file):
+    hashes = st.session_state.setdefault('dataset_hashes', {})
+    marker = upload_marker(uploaded_file)
+    if marker not in hashes:
+        hashes[marker] = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+    return hashes[marker]
+
+def filter_values(uploaded_file, filter_column):
+    values = st.session_state.setdefault('filter_values', {})
+    key = upload_marker(uploaded_file) + (filter_column,)
+    if key not in values:
+        filter_df, _ = load_csv_projected(uploaded_file, [filter_column], exact_columns=[filter_column])
+        values[key] = filter_df[filter_column].unique().tolist()
+    return values[key]
+
+def series_label(target_column, filter_column, filter_value):
+    """History series id of one filtered series, shared by single and all-series runs."""
+    return f"{target_column} | {filter_column}={filter_value}"
+
+def show_history():
+    history = get_history()
+    series = history.series()
+    if series.empty:
+        st.info("No forecasts recorded yet. Runs from Auto Forecast appear here.")
+        return
+    series_id = st.selectbox("Series", series['series_id'])
+    runs = history.runs(series_id)
+    run_labels = {None: "Latest prediction for each date"}
+    run_labels.update({row.run_id: f"Run {row.run_id}: {row.run_at:%Y-%m-%d %H:%M:%S} ({row.model}, {row.horizon} periods)" for row in runs.itertuples()})
+    run_id = st.selectbox("Predictions from", list(run_labels), format_func=run_labels.get)
+    first, last = history.date_range(series_id)
+    if first is None:
+        st.info("No dates recorded for this series yet.")
+        return
+    date_range = st.date_input("Date range", value=(first.date(), last.date()), min_value=first.date(), max_value=last.date())
+    if len(date_range) != 2:
+        return
+    start = time.perf_counter()
+    with span('history_query'):
+        # The end date is inclusive, including intraday points on it
+        df = history.actual_vs_predicted(series_id, date_range[0], pd.Timestamp(date_range[1]) + pd.Timedelta(days=1, seconds=-1),
+                                         run_id=run_id)
+    st.caption(f"{len(df)} dates read in {(time.perf_counter() - start) * 1000:.0f} ms")
+    st.plotly_chart(plot_actual_vs_predicted(df, series_id))
+    st.dataframe(df, width=1200)
+    with st.expander(f"{len(runs)} runs of {series_id}"):
+        st.dataframe(runs, width=1200)
+
+def show_stage_timings(spans):
+    spans = sorted(spans, key=lambda entry: entry['start'])
+    logger.info("Stage timings: %s", ", ".join(f"{entry['stage']}={entry['seconds']:.3f}s" for entry in spans))
+    with st.expander("Stage timings"):
+        # Nested stages (fit and predict inside the forecast) are indented under their parent
+        st.dataframe([{'stage': '\u2003' * entry['depth'] + entry['stage'], 'seconds': round(entry['seconds'], 3)}
+                      for entry in spans], width=600)
+
 def toggle_theme():
     
     if st.session_state.theme == "light":
@@ -57,11 +145,16 @@ def main():
         st.subheader("Auto Forecast with Prophet")
         uploaded_file = st.file_uploader("Upload CSV", type=["csv"])
         if uploaded_file is not None:
-            df = load_csv(uploaded_file)
-            st.write(df.head())
-            date_column = st.selectbox("Select date column", df.columns)
-            target_column = st.selectbox("Select column to forecast", df.columns)
-            additional_columns = st.multiselect("Select additional columns for forecasting", df.columns.difference([date_column, target_column]))
+            # Only a sample is read for column selection; the forecast re-reads just the chosen columns
+            sample, _ = profile_csv(uploaded_file)
+            st.write(sample.head())
+            date_column = st.selectbox("Select date column", sample.columns)
+            target_column = st.selectbox("Select column to forecast", sample.columns)
+            additional_columns = st.multiselect("Select additional columns for forecasting", sample.columns.difference([date_column, target_column]))
+            regressor_strategy = 'last'
+            if additional_columns:
+                regressor_strategy = st.selectbox("Future values of additional columns", list(FUTURE_STRATEGIES),
+                                                  help="How additional columns are filled in beyond the last known date")
             period = st.number_input("Forecast Period (days)", min_value=1, value=30)
             seasonality = {
                 'yearly': st.checkbox("Yearly Seasonality", value=True),
@@ -69,25 +162,139 @@ def main():
                 'daily': st.checkbox("Daily Seasonality", value=False)
             }
             
+            hierarchical = st.checkbox("Hierarchical forecast", value=False,
+                                       help="Forecast the total and every level of a hierarchy, reconciled so levels add up")
+            if hierarchical:
+                hierarchy_columns = st.multiselect("Hierarchy columns, top level first", sample.columns.difference([date_column, target_column]))
+                reconciliation = st.selectbox("Reconciliation", RECONCILIATION_METHODS, index=RECONCILIATION_METHODS.index('mint'),
+                                              help="bottom_up fits only the lowest level; the others fit every level and combine them")
+                hierarchy_model = st.selectbox("Model for every node", BASELINE_MODELS)
+
             # Add filter options
-            filter_column = st.selectbox("Select column to filter by", df.columns)
-            filter_values = df[filter_column].unique().tolist()
-            filter_value = st.selectbox("Select value to filter by", filter_values)
-            
-            if st.button("Run Forecast"):
-                cleaner = DataCleaner(df)
-                filtered_df = cleaner.filter_data(filter_column, filter_value)
+            filter_column = st.selectbox("Select column to filter by", sample.columns)
+            forecast_all = not hierarchical and st.checkbox(f"Forecast every value of {filter_column}", value=False)
+            if forecast_all:
+                all_series_model = st.selectbox("Model for all series", ALL_SERIES_MODELS,
+                                                help="'auto' uses Holt-Winters and sends only series worth it to Prophet")
+            elif not hierarchical:
+                filter_value = st.selectbox("Select value to filter by", filter_values(uploaded_file, filter_column))
 
-                cleaned_df = DataCleaner(filtered_df).clean_data(date_column)
-                aggregated_df = DataCleaner(cleaned_df).aggregate_data(date_column, target_column, additional_columns)
+            warm_start = st.checkbox("Warm-start from previous fit", value=True,
+                                     help="Refit faster when rows were only appended since the last run")
+            horizon_only = st.checkbox("Score only the forecast horizon", value=True,
+                                       help="Skip predicting every historical date; much faster on long series")
+            show_fit = horizon_only and st.checkbox("Show in-sample fit", value=False,
+                                                    help="Also predict the history, for the chart and the seasonal components")
+            uncertainty = st.selectbox("Uncertainty intervals", UNCERTAINTY_MODES,
+                                       help="samples: 1000 simulated paths; reduced: 100; analytic: closed-form approximation; off: none")
+            run_backtest = st.checkbox("Run rolling-origin backtest", value=False)
+            if run_backtest:
+                backtest_horizon = st.number_input("Backtest horizon (rows)", min_value=1, value=int(period))
+                backtest_step = st.number_input("Backtest step between cutoffs (rows)", min_value=1, value=int(period))
 
-                forecast, model, train_df, test_df = forecast_with_prophet(aggregated_df, date_column, 'y', period, seasonality, additional_columns)
-                st.plotly_chart(plot_forecast(model, forecast))
-                st.plotly_chart(plot_seasonality(model, forecast))
-                
-                min_error, max_error, actual, predicted = validate_forecast(model, train_df, test_df)
-                st.write(f"Validation Error Range: {min_error:.2f}% - {max_error:.2f}%")
-                st.plotly_chart(plot_validation(test_df['ds'], actual, predicted))
+            run_forecast = st.button("Run Forecast")
+            with trace() as spans:
+                if run_forecast:
+                    with span('load'):
+                        load_columns = [date_column, target_column, filter_column] + additional_columns + (hierarchy_columns if hierarchical else [])
+                        df, load_report = load_csv_projected(uploaded_file, list(dict.fromkeys(load_columns)),
+                                                             date_columns=[date_column],
+                                                             exact_columns=[target_column, filter_column] + (hierarchy_columns if hierarchical else []))
+                    st.caption(f"Loaded {load_report['rows']} rows into {load_report['bytes_after'] / 1e6:.1f} MB "
+                               f"(~{load_report['bytes_before'] / 1e6:.1f} MB with a default read)")
+
+                if run_forecast and hierarchical and not hierarchy_columns:
+                    st.error("Select at least one hierarchy column.")
+
+                elif run_forecast and hierarchical:
+                    try:
+                        with st.spinner("Forecasting the hierarchy..."), span('forecast_hierarchy'):
+                            hierarchy_df, hierarchy = forecast_hierarchy(df, hierarchy_columns, date_column, target_column, period,
+                                                                         method=reconciliation, model=hierarchy_model,
+                                                                         season=7 if seasonality['weekly'] else 1)
+                    except ValueError as e:
+                        st.error(str(e))
+                        st.stop()
+                    st.write(f"Forecast {hierarchy.n_nodes} nodes ({hierarchy.n_leaves} at the lowest level) with {reconciliation} reconciliation")
+                    total = hierarchy_df[hierarchy_df['series_id'] == TOTAL]
+                    st.plotly_chart(plot_comparison(pd.DataFrame({'ds': hierarchy.dates, 'y': hierarchy.history[0]}), total, f"Total ({reconciliation})"))
+                    st.dataframe(hierarchy_df, width=1200)
+                    st.download_button("Download forecasts", hierarchy_df.to_csv(index=False), file_name="hierarchy_forecasts.csv", mime="text/csv")
+
+                elif run_forecast and forecast_all:
+                    try:
+                        with st.spinner("Forecasting all series..."), span('forecast_all'):
+                            forecast_df, summary_df = forecast_all_series(df, filter_column, date_column, target_column, period, seasonality, additional_columns, model=all_series_model,
+                                                                          uncertainty=uncertainty)
+                    except ValueError as e:
+                        st.error(str(e))
+                        st.stop()
+                    st.write(f"Forecast {(summary_df['status'] == 'ok').sum()} of {len(summary_df)} series")
+                    st.dataframe(summary_df, width=1200)
+                    st.dataframe(forecast_df, width=1200)
+                    if not forecast_df.empty:
+                        with span('record_history'):
+                            actuals = (df.groupby([filter_column, date_column], observed=True)[target_column].sum().reset_index()
+                                       .rename(columns={filter_column: 'series_id', date_column: 'ds', target_column: 'y'}))
+                            label = lambda value: series_label(target_column, filter_column, value)
+                            get_history().record_runs(dataset_hash(uploaded_file),
+                                                      forecast_df.assign(series_id=forecast_df['series_id'].map(label)),
+                                                      actuals.assign(series_id=actuals['series_id'].map(label)), horizon=period,
+                                                      model=all_series_model, params={'seasonality': seasonality})
+                        extremes, changes = recommendations(forecast_df, 'series_id')
+                        st.write("Peak and trough months per series:")
+                        st.dataframe(extremes, width=1200)
+                        st.write(f"{len(changes)} significant day-to-day changes across all series:")
+                        st.dataframe(changes, width=1200)
+                    st.download_button("Download forecasts", forecast_df.to_csv(index=False), file_name="forecasts.csv", mime="text/csv")
+
+                elif run_forecast:
+                    with span('filter'):
+                        cleaner = DataCleaner(df)
+                        filtered_df = cleaner.filter_data(filter_column, filter_value)
+
+                    with span('clean'):
+                        cleaned_df = DataCleaner(filtered_df).clean_data(date_column)
+                    with span('aggregate'):
+                        aggregated_df = DataCleaner(cleaned_df).aggregate_data(date_column, target_column, additional_columns)
+
+                    series_key = "|".join(map(str, [uploaded_file.name, filter_column, filter_value, target_column,
+                                                     sorted(additional_columns), sorted(k for k, v in seasonality.items() if v)]))
+                    with span('forecast'):
+                        forecast, model, train_df, test_df = forecast_with_prophet(aggregated_df, date_column, 'y', period, seasonality, additional_columns, cache=get_model_cache(),
+                                                                                   param_store=get_param_store() if warm_start else None, series_key=series_key,
+                                                                                   regressor_strategy=regressor_strategy, horizon_only=horizon_only,
+                                                                                   uncertainty=uncertainty)
+                    with span('record_history'):
+                        # In-sample fitted values are not forecasts; they would win "latest prediction" over real ones
+                        get_history().record_run(dataset_hash(uploaded_file), series_label(target_column, filter_column, filter_value),
+                                                 forecast[forecast['ds'] > train_df['ds'].max()], aggregated_df.rename(columns={date_column: 'ds'}), horizon=period,
+                                                 params={'additional_columns': additional_columns, 'seasonality': seasonality,
+                                                         'horizon_only': horizon_only, 'uncertainty': uncertainty})
+                    plotted = forecast
+                    if show_fit:
+                        with span('in_sample'):
+                            plotted = pd.concat([in_sample_forecast(model, train_df), forecast], ignore_index=True)
+                    with span('plot'):
+                        forecast_figure = plot_forecast(model, plotted)
+                        seasonality_figure = plot_seasonality(model, plotted)
+                    st.plotly_chart(forecast_figure)
+                    st.plotly_chart(seasonality_figure)
+
+                    with span('validate'):
+                        min_error, max_error, actual, predicted = validate_forecast(model, train_df, test_df)
+                    st.write(f"Validation Error Range: {min_error:.2f}% - {max_error:.2f}%")
+                    st.plotly_chart(plot_validation(test_df['ds'], actual, predicted))
+
+                    if run_backtest:
+                        with st.spinner("Backtesting..."), span('backtest'):
+                            predictions, scores = backtest(aggregated_df, date_column, 'y', backtest_horizon, backtest_step, seasonality, additional_columns)
+                        st.write("Backtest metrics by cutoff:")
+                        st.dataframe(scores, width=1200)
+                        st.write(f"Mean sMAPE: {scores['smape'].mean():.2f}%, mean MASE: {scores['mase'].mean():.2f}, interval coverage: {scores['coverage'].mean():.0%}")
+                        st.plotly_chart(plot_backtest(predictions, scores))
+            if run_forecast:
+                show_stage_timings(spans)
                 # error, actual, predicted = validate_forecast(model, train_df, test_df)
                 # st.write(f"Validation MAE: {error}")
                 # st.plotly_chart(plot_validation(test_df['ds'], actual, predicted))
@@ -98,45 +305,54 @@ def main():
         st.subheader("Compare Forecast")
         uploaded_file = st.file_uploader("Upload CSV", type=["csv"])
         if uploaded_file is not None:
-            df = load_csv(uploaded_file)
-            st.write(df.head())
-            date_column = st.selectbox("Select date column", df.columns)
-            target_column = st.selectbox("Select column to forecast", df.columns)
-            additional_columns = st.multiselect("Select additional columns for forecasting", df.columns.difference([date_column, target_column]))
+            sample, _ = profile_csv(uploaded_file)
+            st.write(sample.head())
+            date_column = st.selectbox("Select date column", sample.columns)
+            target_column = st.selectbox("Select column to forecast", sample.columns)
+            additional_columns = st.multiselect("Select additional columns for forecasting", sample.columns.difference([date_column, target_column]),
+                                                key="compare_additional_columns", help="Used by Prophet only; the other models use the target alone")
+            regressor_strategy = 'last'
+            if additional_columns:
+                regressor_strategy = st.selectbox("Future values of additional columns", list(FUTURE_STRATEGIES),
+                                                  key="compare_regressor_strategy")
             period = st.number_input("Forecast Period (days)", min_value=1, value=30)
-            models_to_compare = st.multiselect("Select Models to Compare", ["ARIMA", "Prophet"], default=["ARIMA", "Prophet"], key="models")
+            seasonality = {
+                'yearly': st.checkbox("Yearly Seasonality", value=True, key="compare_yearly"),
+                'weekly': st.checkbox("Weekly Seasonality", value=True, key="compare_weekly"),
+                'daily': st.checkbox("Daily Seasonality", value=False, key="compare_daily")
+            }
+            models_to_compare = st.multiselect("Select Models to Compare", MODELS, default=MODELS, key="models")
+            timeout = st.number_input("Per-model time limit (seconds)", min_value=1, value=120)
             
             # Add filter options
-            filter_column = st.selectbox("Select column to filter by", df.columns)
-            filter_values = df[filter_column].unique().tolist()
-            filter_value = st.selectbox("Select value to filter by", filter_values)
+            filter_column = st.selectbox("Select column to filter by", sample.columns)
+            filter_value = st.selectbox("Select value to filter by", filter_values(uploaded_file, filter_column))
             
-            if len(models_to_compare) == 2 and st.button("Run Forecast"):
+            if models_to_compare and st.button("Run Forecast"):
+                df, _ = load_csv_projected(uploaded_file, list(dict.fromkeys([date_column, target_column, filter_column] + additional_columns)),
+                                           date_columns=[date_column], exact_columns=[target_column, filter_column])
                 cleaner = DataCleaner(df)
                 filtered_df = cleaner.filter_data(filter_column, filter_value)
-                cleaned_df = cleaner.clean_data(date_column)
-                aggregated_df = cleaner.aggregate_data(date_column, target_column, additional_columns)
-                
-                for model_choice in models_to_compare:
-                    if model_choice == "ARIMA":
-                        arima_model, arima_forecast = forecast_with_arima(aggregated_df, date_column, 'y', period)
-                    elif model_choice == "Prophet":
-                        seasonality = {
-                            'yearly': st.checkbox("Yearly Seasonality", value=True),
-                            'weekly': st.checkbox("Weekly Seasonality", value=True),
-                            'daily': st.checkbox("Daily Seasonality", value=False)
-                        }
-                        prophet_model, prophet_forecast = forecast_with_prophet(aggregated_df, date_column, 'y', period, seasonality, additional_columns)
-                
-                if "ARIMA" in models_to_compare:
-                    st.write("ARIMA Forecast:")
-                    st.write(arima_forecast)
-                if "Prophet" in models_to_compare:
-                    st.write("Prophet Forecast:")
-                    st.write(prophet_forecast)
+                cleaned_df = DataCleaner(filtered_df).clean_data(date_column)
+                aggregated_df = DataCleaner(cleaned_df).aggregate_data(date_column, target_column, additional_columns)
+                aggregated_df = aggregated_df.rename(columns={date_column: 'ds'})
+
+                with st.spinner("Fitting models..."):
+                    leaderboard, winning_forecast = compare_models(aggregated_df, period, models_to_compare, timeout=timeout,
+                                                                   season=7 if seasonality['weekly'] else 1, seasonality=seasonality,
+                                                                   regressors=additional_columns, regressor_strategy=regressor_strategy)
+                st.write("Leaderboard (holdout scores):")
+                st.dataframe(leaderboard, width=1200)
+                if winning_forecast is None:
+                    st.error("No model produced a forecast.")
+                else:
+                    st.write(f"{leaderboard['model'].iloc[0]} Forecast:")
+                    st.plotly_chart(plot_comparison(aggregated_df, winning_forecast, leaderboard['model'].iloc[0]))
+                    st.dataframe(winning_forecast, width=1200)
                 
     elif selected == "History":
-        st.subheader("History (Coming Soon)")
+        st.subheader("History")
+        show_history()
 
 if __name__ == '__main__':
     main()
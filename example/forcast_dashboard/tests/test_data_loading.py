@@ -0,0 +1,24 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.data_loading import csv_to_parquet
+
+
+def test_csv_to_parquet_reads_late_text_in_typed_columns_as_text(tmp_path):
+    src = tmp_path / 'late_text.csv'
+    rows = ['Date,Store,Sales,Price,Promo'] + [f'2024-01-{day % 28 + 1:02d},{day % 5},{day},{day / 2},true'
+                                               for day in range(5000)]
+    # Every typed column inferred from the first block gets text in the last one
+    rows.append('2024-02-01,unknown,tbd,free,maybe')
+    src.write_text('\n'.join(rows) + '\n')
+    dest = tmp_path / 'late_text.parquet'
+
+    schema, n_rows = csv_to_parquet(str(src), str(dest), block_size=4096)
+
+    table = pq.read_table(dest)
+    assert n_rows == table.num_rows == 5001
+    for column in ('Store', 'Sales', 'Price', 'Promo'):
+        assert schema.field(column).type == pa.string()
+    last = table.slice(5000).to_pylist()[0]
+    assert (last['Store'], last['Sales'], last['Price'], last['Promo']) == ('unknown', 'tbd', 'free', 'maybe')
+    assert table.column('Sales')[0].as_py() == '0'
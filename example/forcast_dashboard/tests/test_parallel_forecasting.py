@@ -0,0 +1,46 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from utils.parallel_forecasting import forecast_all_series
+
+SEASONALITY = {'yearly': False, 'weekly': True, 'daily': False}
+
+logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+
+
+def make_panel(n_days=120, seed=0):
+    """Two daily stores; B stops 10 days before A."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2022-07-01', periods=n_days, freq='D')
+    frames = []
+    for store, end in (('A', n_days), ('B', n_days - 10)):
+        weekly = 10 * np.sin(2 * np.pi * np.arange(end) / 7)
+        frames.append(pd.DataFrame({'Date': dates[:end].strftime('%Y-%m-%d'), 'Store': store,
+                                    'Sales': 100 + weekly + rng.normal(0, 5, end)}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_prophet_forecasts_start_after_each_series_history():
+    df = make_panel()
+    forecast, summary = forecast_all_series(df, 'Store', 'Date', 'Sales', 14, SEASONALITY, [], max_workers=1,
+                                            uncertainty='off')
+    assert (summary['status'] == 'ok').all()
+    history_end = pd.to_datetime(df['Date']).groupby(df['Store']).max()
+    for store, series in forecast.groupby('series_id'):
+        assert series['ds'].min() > history_end[store]
+        assert len(series) == 14
+
+
+def test_auto_gives_prophet_and_baseline_series_one_window():
+    df = make_panel()
+    # Too short for Prophet, so 'auto' keeps it on Holt-Winters
+    short = df[df['Store'] == 'A'].tail(30).assign(Store='C')
+    df = pd.concat([df, short], ignore_index=True)
+    forecast, summary = forecast_all_series(df, 'Store', 'Date', 'Sales', 14, SEASONALITY, [], max_workers=1,
+                                            model='auto', uncertainty='off')
+    assert set(summary['model']) == {'prophet', 'holt_winters'}
+    windows = forecast.groupby('series_id')['ds'].agg(['min', 'max', 'count'])
+    assert len(windows.drop_duplicates()) == 1
+    assert windows['min'].iloc[0] > pd.to_datetime(df['Date']).max()
@@ -0,0 +1,95 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils import metrics
+from utils.forecasting import encode_regressors, fit_prophet, prepare_data
+from utils.parallel_forecasting import quiet_worker
+from utils.regressors import RegressorEncoder
+
+logger = logging.getLogger(__name__)
+
+PREDICTION_COLUMNS = ['cutoff', 'ds', 'horizon_step', 'y', 'yhat', 'yhat_lower', 'yhat_upper']
+
+
+def make_cutoffs(n_rows, horizon, step, initial=None, max_cutoffs=None):
+    """Row positions at which to cut training data, each followed by a full horizon."""
+    initial = initial if initial is not None else max(2 * horizon, n_rows // 2)
+    positions = list(range(initial, n_rows - horizon + 1, step))
+    if max_cutoffs:
+        positions = positions[-max_cutoffs:]
+    return positions
+
+
+def _fit_cutoff(train_df, test_df, seasonality, additional_columns):
+    # Categorical regressors become indicators, as in forecast_with_prophet; the encoding is learnt
+    # from the training window only and the test rows keep their actual regressor values
+    encoder = RegressorEncoder().fit(train_df, additional_columns)
+    model = fit_prophet(encode_regressors(train_df, encoder), seasonality, encoder.output_columns)
+    forecast = model.predict(pd.concat([test_df[['ds']], encoder.transform(test_df)], axis=1))
+    return forecast[['yhat', 'yhat_lower', 'yhat_upper']].to_numpy()
+
+
+def backtest(cleaned_df, date_column, target_column, horizon, step, seasonality, additional_columns=(),
+             initial=None, max_cutoffs=None, season=7, max_workers=None):
+    """Rolling-origin backtest of Prophet over many cutoffs, fitted in parallel.
+
+    horizon, step and initial count rows of the (date-aggregated) frame. Returns a tidy
+    prediction frame with one row per cutoff and horizon step, and a per-cutoff metrics
+    frame (MAE, RMSE, sMAPE, MASE against a seasonal-naive scale, interval coverage).
+    """
+    additional_columns = list(additional_columns)
+    df = prepare_data(cleaned_df, date_column, target_column, additional_columns)
+    df = df.sort_values('ds').reset_index(drop=True)
+    cutoffs = make_cutoffs(len(df), horizon, step, initial, max_cutoffs)
+    if not cutoffs:
+        raise ValueError(f"Need more than {horizon} rows after the initial training window to backtest")
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(cutoffs))
+    tasks = [(df.iloc[:position], df.iloc[position:position + horizon]) for position in cutoffs]
+    start = time.perf_counter()
+    if max_workers == 1:
+        results = [_fit_cutoff(train_df, test_df, seasonality, additional_columns) for train_df, test_df in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=quiet_worker) as executor:
+            futures = [executor.submit(_fit_cutoff, train_df, test_df, seasonality, additional_columns)
+                       for train_df, test_df in tasks]
+            results = [future.result() for future in futures]
+    logger.info("Backtested %d cutoffs in %.2fs on %d workers", len(cutoffs), time.perf_counter() - start, max_workers)
+
+    # (cutoffs x horizon) arrays so every window is scored in one vectorised pass
+    windows = np.asarray(cutoffs)[:, None] + np.arange(horizon)
+    y = df['y'].to_numpy(dtype=float)
+    actual = y[windows]
+    yhat, lower, upper = np.moveaxis(np.stack(results), -1, 0)
+
+    # Seasonal-naive MASE scale of each training window from one cumulative sum
+    abs_diffs = np.abs(y[season:] - y[:-season]) if len(y) > season else np.array([])
+    cumulative = np.concatenate([[0.0], np.cumsum(abs_diffs)])
+    n_diffs = np.asarray(cutoffs) - season
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(n_diffs > 0, cumulative[np.clip(n_diffs, 0, None)] / n_diffs, np.nan)
+
+    cutoff_dates = df['ds'].to_numpy()[np.asarray(cutoffs) - 1]
+    predictions = pd.DataFrame({
+        'cutoff': np.repeat(cutoff_dates, horizon),
+        'ds': df['ds'].to_numpy()[windows.ravel()],
+        'horizon_step': np.tile(np.arange(1, horizon + 1), len(cutoffs)),
+        'y': actual.ravel(),
+        'yhat': yhat.ravel(),
+        'yhat_lower': lower.ravel(),
+        'yhat_upper': upper.ravel(),
+    }, columns=PREDICTION_COLUMNS)
+    scores = pd.DataFrame({
+        'cutoff': cutoff_dates,
+        'mae': metrics.mae(actual, yhat, axis=1),
+        'rmse': metrics.rmse(actual, yhat, axis=1),
+        'smape': metrics.smape(actual, yhat, axis=1),
+        'mase': metrics.mase(actual, yhat, scale, axis=1),
+        'coverage': metrics.coverage(actual, lower, upper, axis=1),
+    })
+    return predictions, scores
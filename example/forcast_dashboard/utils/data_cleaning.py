@@ -1,25 +1,89 @@
+import warnings
+
 import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype, is_numeric_dtype
+
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:  # pandas < 2.2
+    from pandas._libs.tslibs.parsing import guess_datetime_format
+
+
+def _guess(value, dayfirst):
+    # pandas warns when the guess contradicts dayfirst; both readings are tried on purpose
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        return guess_datetime_format(value, dayfirst=dayfirst)
+
+
+def _parses_all(series, non_null, fmt):
+    parsed = pd.to_datetime(series, format=fmt, errors='coerce')
+    return parsed if parsed.notna().sum() == len(non_null) else None
+
+
+def parse_dates(series, column=None, formats=None):
+    """
+    Parse series to datetime64 with a single format inferred from its first value.
+    A format is only used when every non-null value parses with it; otherwise the day-first
+    reading is tried, then per-value inference.
+    :param formats: Optional dict of column -> format shared by the chunks of one upload, so
+        later chunks skip inference. Never share it between uploads.
+    """
+    if is_datetime64_any_dtype(series):
+        return series
+    column = series.name if column is None else column
+    non_null = series.dropna()
+    if non_null.empty:
+        return pd.to_datetime(series, errors='coerce')
+
+    first = str(non_null.iloc[0])
+    known = formats.get(column) if formats is not None else None
+    candidates = (known, lambda: _guess(first, False), lambda: _guess(first, True))
+    tried = set()
+    for candidate in candidates:
+        fmt = candidate() if callable(candidate) else candidate
+        if fmt is None or fmt in tried:
+            continue
+        tried.add(fmt)
+        parsed = _parses_all(series, non_null, fmt)
+        if parsed is not None:
+            if formats is not None:
+                formats[column] = fmt
+            return parsed
+    return pd.to_datetime(series, format='mixed', errors='coerce')
+
+
+def _modes(keys, values):
+    # Most frequent value per key, ties going to the value seen first; all-null keys are left out
+    counts = values.groupby([keys, values], observed=True, sort=False).size().rename('count')
+    counts = counts.sort_values(ascending=False, kind='stable').reset_index(level=1)
+    return counts.loc[~counts.index.duplicated(), values.name]
+
 
 class DataCleaner:
     def __init__(self, df):
         self.df = df
-    
+
     def clean_data(self, date_column):
-        cleaned_df = self.df.copy()
-        cleaned_df[date_column] = pd.to_datetime(cleaned_df[date_column], errors='coerce')
+        # Dates stay datetime64, truncated to the day, for filtering, aggregation and prepare_data
+        dates = parse_dates(self.df[date_column], date_column).dt.normalize()
+        cleaned_df = self.df.assign(**{date_column: dates})
         cleaned_df.dropna(subset=[date_column], inplace=True)
-        cleaned_df[date_column] = cleaned_df[date_column].dt.strftime('%Y-%m-%d')
         return cleaned_df
 
     def filter_data(self, column, value):
-        self.df[self.df[column] == value]
-
         return self.df[self.df[column] == value]
 
     def aggregate_data(self, date_column, target_column, additional_columns):
-        self.df[date_column] = pd.to_datetime(self.df[date_column])
-        grouped_df = self.df.groupby(date_column).agg(
-            {target_column: 'sum', **{col: 'sum' for col in additional_columns}}).reset_index()
+        dates = parse_dates(self.df[date_column], date_column)
+        # Numeric (and boolean) regressors are summed per date; categorical ones cannot be, so they
+        # take their most frequent level that date and are encoded later by RegressorEncoder
+        summed = [col for col in additional_columns if is_numeric_dtype(self.df[col])]
+        grouped_df = self.df.groupby(dates).agg({target_column: 'sum', **{col: 'sum' for col in summed}})
+        for col in additional_columns:
+            if col not in summed:
+                grouped_df[col] = _modes(dates, self.df[col]).reindex(grouped_df.index)
+        grouped_df = grouped_df[[target_column] + list(additional_columns)].reset_index()
         grouped_df = grouped_df.rename(columns={target_column: 'y'})
         return grouped_df
         # self.df[date_column] = pd.to_datetime(self.df[date_column])
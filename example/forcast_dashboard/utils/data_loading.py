@@ -1,4 +1,209 @@
+import codecs
+import logging
+import os
+import re
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from pandas.api.types import (is_bool_dtype, is_float_dtype, is_integer_dtype, is_string_dtype,
+                              union_categoricals)
+
+from utils.data_cleaning import parse_dates
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_ROWS = 10000
+CHUNK_ROWS = 500000
+# Text columns with at most this share of distinct values are loaded as categoricals
+CATEGORY_RATIO = 0.5
+ENCODING_SAMPLE_BYTES = 1024 * 1024
+# Bytes of CSV converted per streamed block; types are inferred from the first block
+PARQUET_BLOCK_BYTES = 16 * 1024 * 1024
+# How Arrow names the column a CSV conversion error is in
+_CSV_COLUMN = re.compile(r"In CSV column #(\d+)")
+
 
 def load_csv(file):
     return pd.read_csv(file)
+
+
+def _rewind(file):
+    if hasattr(file, 'seek'):
+        file.seek(0)
+
+
+def profile_csv(file, sample_rows=SAMPLE_ROWS):
+    """Read the first sample_rows rows of file and suggest a compact dtype per column.
+
+    Only float columns are suggested float32; integer columns are left to load_csv_projected,
+    which downcasts them losslessly (float32 cannot hold integers above 2**24 exactly).
+    """
+    _rewind(file)
+    sample = pd.read_csv(file, nrows=sample_rows)
+    _rewind(file)
+    dtypes = {}
+    for col in sample.columns:
+        if is_float_dtype(sample[col]):
+            dtypes[col] = 'float32'
+        elif is_string_dtype(sample[col]) and sample[col].nunique() <= CATEGORY_RATIO * len(sample):
+            dtypes[col] = 'category'
+    return sample, dtypes
+
+
+def memory_usage(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def load_csv_projected(file, usecols, date_columns=(), exact_columns=(), sample_rows=SAMPLE_ROWS,
+                       chunksize=CHUNK_ROWS):
+    """Load only usecols from file in chunks with compact dtypes.
+
+    Float columns become float32 and integer columns the smallest integer type that holds
+    them, unless listed in exact_columns (targets, and ID or filter columns whose values must
+    survive unchanged). Repetitive text columns become categoricals and date_columns are
+    parsed to datetime64. Returns the frame and a report comparing its memory with an
+    estimate for a default full read.
+    """
+    usecols = list(dict.fromkeys(usecols))
+    sample, suggested = profile_csv(file, sample_rows)
+    dtypes = {col: dtype for col, dtype in suggested.items()
+              if col in usecols and col not in date_columns
+              and not (dtype == 'float32' and col in exact_columns)}
+    # Integers are downcast per chunk: a later chunk with missing values reads as float64
+    integers = [col for col in usecols if col not in exact_columns and col not in date_columns
+                and is_integer_dtype(sample[col]) and not is_bool_dtype(sample[col])]
+
+    chunks = []
+    rows = 0
+    # Date formats found in the first chunk, reused by the rest of this upload only
+    formats = {}
+    with pd.read_csv(file, usecols=usecols, dtype=dtypes, chunksize=chunksize) as reader:
+        for chunk in reader:
+            for col in date_columns:
+                chunk[col] = parse_dates(chunk[col], col, formats)
+            for col in integers:
+                if is_integer_dtype(chunk[col]):
+                    chunk[col] = pd.to_numeric(chunk[col], downcast='integer')
+            rows += len(chunk)
+            chunks.append(chunk)
+    _rewind(file)
+
+    if not chunks:
+        return sample.iloc[:0][usecols], {'rows': 0, 'bytes_before': 0, 'bytes_after': 0}
+
+    # Chunks see different category sets; align them so concat keeps the categorical dtype
+    for col, dtype in dtypes.items():
+        if dtype == 'category' and len(chunks) > 1:
+            categories = union_categoricals([chunk[col] for chunk in chunks]).categories
+            for chunk in chunks:
+                chunk[col] = chunk[col].cat.set_categories(categories)
+    df = pd.concat(chunks, ignore_index=True)
+
+    report = {
+        'rows': rows,
+        'bytes_before': int(memory_usage(sample) / max(len(sample), 1) * rows),
+        'bytes_after': memory_usage(df),
+    }
+    logger.info("Loaded %d rows x %d columns: ~%.1f MB default read, %.1f MB projected",
+                rows, len(usecols), report['bytes_before'] / 1e6, report['bytes_after'] / 1e6)
+    return df, report
+
+
+def detect_encoding(path, sample_bytes=ENCODING_SAMPLE_BYTES):
+    """Encoding of a CSV file judged from its first sample_bytes: UTF-8 (with or without BOM) or Latin-1.
+
+    Latin-1 maps every byte to a character, so it is the fallback for anything that is not
+    valid UTF-8 (ISO-8859-1 is the same codec).
+    """
+    with open(path, 'rb') as f:
+        sample = f.read(sample_bytes)
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # Not final: the sample may end inside a multi-byte character
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin1'
+
+
+def _widened(schema):
+    # Types a later block can contradict: integers that turn fractional, dates that stop parsing
+    fields = []
+    for field in schema:
+        if pa.types.is_integer(field.type):
+            field = field.with_type(pa.float64())
+        elif pa.types.is_temporal(field.type):
+            field = field.with_type(pa.string())
+        fields.append(field)
+    return pa.schema(fields)
+
+
+def _failing_column(error, schema):
+    # Arrow reports the failing column by position; None when the message does not say
+    match = _CSV_COLUMN.search(str(error))
+    if match is None or int(match.group(1)) >= len(schema):
+        return None
+    return schema.field(int(match.group(1))).name
+
+
+def _write_parquet(src_path, dest_path, encoding, constant_columns, block_size, column_types=None):
+    read_options = pa_csv.ReadOptions(encoding=encoding, block_size=block_size)
+    # Skip malformed rows instead of failing the whole file
+    parse_options = pa_csv.ParseOptions(invalid_row_handler=lambda row: 'skip')
+    convert_options = pa_csv.ConvertOptions(column_types=column_types)
+    rows = 0
+    with pa_csv.open_csv(src_path, read_options=read_options, parse_options=parse_options,
+                         convert_options=convert_options) as reader:
+        schema = reader.schema
+        for name, value in constant_columns.items():
+            schema = schema.append(pa.field(name, pa.string()))
+        with pq.ParquetWriter(dest_path, schema) as writer:
+            for batch in reader:
+                columns = batch.columns + [pa.nulls(batch.num_rows, pa.string()).fill_null(str(value))
+                                           for value in constant_columns.values()]
+                writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=schema))
+                rows += batch.num_rows
+    return reader.schema, schema, rows
+
+
+def csv_to_parquet(src_path, dest_path, encoding=None, constant_columns=None, block_size=PARQUET_BLOCK_BYTES):
+    """Convert a CSV file to Parquet in one streaming pass, holding one block in memory at a time.
+
+    Column types are inferred from the first block. If a later block contradicts them, the
+    file is converted again with integer columns widened to float and dates kept as text, and
+    then with every column that still fails read as text (all of them if Arrow does not say
+    which one failed). constant_columns (name -> value) are appended to every row as strings. Returns the Arrow
+    schema written and the number of rows.
+    """
+    encoding = encoding or detect_encoding(src_path)
+    constant_columns = constant_columns or {}
+    try:
+        _, schema, rows = _write_parquet(src_path, dest_path, encoding, constant_columns, block_size)
+    except pa.ArrowInvalid as e:
+        logger.info("Types inferred from the first block of %s did not hold (%s); widening", src_path, e)
+        with pa_csv.open_csv(src_path, read_options=pa_csv.ReadOptions(encoding=encoding, block_size=block_size),
+                             parse_options=pa_csv.ParseOptions(invalid_row_handler=lambda row: 'skip')) as reader:
+            inferred = reader.schema
+        column_types = {field.name: field.type for field in _widened(inferred)}
+        while True:
+            try:
+                _, schema, rows = _write_parquet(src_path, dest_path, encoding, constant_columns, block_size,
+                                                 column_types=column_types)
+                break
+            except pa.ArrowInvalid as e:
+                name = _failing_column(e, inferred)
+                if name is not None and not pa.types.is_string(column_types[name]):
+                    logger.info("Column %s of %s holds text past the first block; reading it as text", name, src_path)
+                    column_types[name] = pa.string()
+                elif any(not pa.types.is_string(column_type) for column_type in column_types.values()):
+                    logger.info("Could not tell which column of %s failed (%s); reading every column as text",
+                                src_path, e)
+                    column_types = dict.fromkeys(column_types, pa.string())
+                else:
+                    raise
+    logger.info("Converted %d rows of %s (%s) to %.1f MB of Parquet", rows, os.path.basename(src_path), encoding,
+                os.path.getsize(dest_path) / 1e6)
+    return schema, rows
@@ -1,8 +1,23 @@
+import copy
+import logging
+from statistics import NormalDist
 
 import pandas as pd
 import numpy as np
 from prophet import Prophet
 
+from utils.incremental import incremental_fit
+from utils.instrumentation import registry, span
+from utils.metrics import percentage_errors
+from utils.regressors import RegressorEncoder
+
+logger = logging.getLogger(__name__)
+
+# How predict() gets yhat_lower/yhat_upper: Prophet's default 1000 simulated paths per row,
+# REDUCED_SAMPLES paths, a closed-form normal approximation of the same simulation, or none
+UNCERTAINTY_MODES = ['samples', 'reduced', 'analytic', 'off']
+REDUCED_SAMPLES = 100
+
 def prepare_data(df, date_column, target_column, additional_columns):
     df = df.rename(columns={date_column: 'ds', target_column: 'y'})
     return df[['ds', 'y'] + additional_columns]
@@ -14,9 +29,7 @@ def split_data(df, date_column, train_size=0.8):
     test_df = df[split_idx:]
     return train_df, test_df
 
-def forecast_with_prophet(cleaned_df, date_column, target_column, period, seasonality, additional_columns):
-    df = prepare_data(cleaned_df, date_column, target_column, additional_columns)
-    train_df, test_df = split_data(df, 'ds')
+def fit_prophet(train_df, seasonality, additional_columns, init=None):
     model = Prophet(yearly_seasonality=seasonality['yearly'], 
                     weekly_seasonality=seasonality['weekly'], 
                     daily_seasonality=seasonality['daily'])
@@ -24,22 +37,155 @@ def forecast_with_prophet(cleaned_df, date_column, target_column, period, season
     for col in additional_columns:
         model.add_regressor(col)
     
-    model.fit(train_df)
-    future = model.make_future_dataframe(periods=period)
-    
-    for col in additional_columns:
-        future[col] = df[col].sum()  # assuming mean of the column for future values
-    
-    forecast = model.predict(future)
+    # init only sets the optimizer's starting point, e.g. a previous fit's parameters
+    if init is not None:
+        model.fit(train_df, init=init)
+    else:
+        model.fit(train_df)
+    return model
+
+def encode_regressors(df, encoder):
+    return pd.concat([df[['ds', 'y']], encoder.transform(df)], axis=1)
+
+def _trend_cumulants(model, t):
+    """
+    Variance and fourth cumulant, in scaled units, of the future trend shifts Prophet simulates
+    at scaled times t. Slope changes arrive at each future step with probability
+    p = len(changepoints_t) * step and Laplace(0, b) sizes (b the mean |delta|), are smoothed
+    over two steps and integrated twice, so the point h steps ahead is sum_{k<h} (k + 1/2) X_k
+    times step, with X_k an independent Bernoulli(p) * Laplace(0, b) shift.
+    """
+    future_t = t[t > 1]
+    if model.growth == 'flat' or len(future_t) == 0:
+        return np.zeros(len(t)), np.zeros(len(t))
+    step = np.diff(future_t).mean() if len(future_t) > 1 else np.diff(model.history['t']).mean()
+    p = min(len(model.changepoints_t) * step, 1.0)
+    b = np.mean(np.abs(model.params['delta'][0])) + 1e-8
+    h = np.maximum(np.round((t - 1) / step), 0).astype(int)
+    weights = np.arange(h.max()) + 0.5
+    # Sums of the squared and fourth-power weights up to each horizon; index 0 is no shift yet
+    w2 = np.concatenate([[0.0], np.cumsum(weights ** 2)])[h]
+    w4 = np.concatenate([[0.0], np.cumsum(weights ** 4)])[h]
+    variance = step ** 2 * 2 * p * b ** 2 * w2
+    fourth = step ** 4 * 12 * p * (2 - p) * b ** 4 * w4
+    return variance, fourth
+
+def _quantile(z, variance, fourth):
+    """Standardised quantile of a symmetric distribution with excess kurtosis fourth / variance^2
+    (Cornish-Fisher), kept between z/2 and z because the expansion breaks down for heavy tails."""
+    kurtosis = np.divide(fourth, variance ** 2, out=np.zeros_like(variance), where=variance > 0)
+    return np.clip(z + kurtosis / 24 * (z ** 3 - 3 * z), z / 2, z)
+
+def analytic_intervals(model, forecast):
+    """
+    yhat and trend intervals from the first moments of Prophet's simulation, computed in one
+    vectorised pass instead of uncertainty_samples paths per row. Observation noise and the
+    variance and kurtosis of linear trend shifts are exact; the quantiles come from a
+    Cornish-Fisher expansion, and MCMC parameter uncertainty is ignored.
+    """
+    z = NormalDist().inv_cdf(0.5 + model.interval_width / 2)
+    t = ((forecast['ds'] - model.start) / model.t_scale).to_numpy()
+    trend_variance, trend_fourth = _trend_cumulants(model, t)
+    noise_variance = np.mean(model.params['sigma_obs']) ** 2
+    # Multiplicative terms scale the trend, and with it the trend's uncertainty
+    scale = 1 + forecast['multiplicative_terms'].to_numpy()
+    yhat_variance = trend_variance * scale ** 2 + noise_variance
+    yhat_spread = _quantile(z, yhat_variance, trend_fourth * scale ** 4) * np.sqrt(yhat_variance) * model.y_scale
+    trend_spread = _quantile(z, trend_variance, trend_fourth) * np.sqrt(trend_variance) * model.y_scale
+    forecast = forecast.copy()
+    forecast['yhat_lower'] = forecast['yhat'] - yhat_spread
+    forecast['yhat_upper'] = forecast['yhat'] + yhat_spread
+    forecast['trend_lower'] = forecast['trend'] - trend_spread
+    forecast['trend_upper'] = forecast['trend'] + trend_spread
+    return forecast
+
+def predict(model, future, uncertainty='samples', samples=REDUCED_SAMPLES):
+    """
+    model.predict(future) with the intervals computed as uncertainty says (see UNCERTAINTY_MODES).
+    The model itself is never modified, so a cached model keeps its own settings. Every mode
+    returns the same columns; 'off' leaves the intervals NaN.
+    """
+    if uncertainty not in UNCERTAINTY_MODES:
+        raise ValueError(f"Unknown uncertainty mode {uncertainty!r}; expected one of {UNCERTAINTY_MODES}")
+    if uncertainty == 'samples' or not model.uncertainty_samples:
+        return model.predict(future)
+    if uncertainty == 'analytic' and model.growth == 'logistic':
+        # Logistic trend shifts saturate at the cap and have no simple closed form
+        logger.info("No analytic intervals for logistic growth; sampling %d paths instead", samples)
+        uncertainty = 'reduced'
+    scorer = copy.copy(model)
+    scorer.uncertainty_samples = samples if uncertainty == 'reduced' else 0
+    forecast = scorer.predict(future)
+    if uncertainty == 'analytic':
+        return analytic_intervals(model, forecast)
+    if uncertainty == 'off':
+        forecast = forecast.assign(yhat_lower=np.nan, yhat_upper=np.nan, trend_lower=np.nan, trend_upper=np.nan)
+    return forecast
+
+def in_sample_forecast(model, train_df, uncertainty='off'):
+    """Fitted values over the training rows, for when a horizon-only forecast needs them after all."""
+    return predict(model, train_df.drop(columns='y'), uncertainty)
+
+def forecast_with_prophet(cleaned_df, date_column, target_column, period, seasonality, additional_columns, cache=None,
+                          param_store=None, series_key=None, regressor_strategy='last', horizon_only=False,
+                          uncertainty='samples', train_size=0.8, future_dates=None):
+    """
+    Fit (or reuse) a Prophet model on the first 80% of the rows and forecast period days past it.
+    :param horizon_only: Score only the period future dates. Otherwise every training row is
+        scored too, which on a long series costs more than the horizon; in_sample_forecast()
+        gives those fitted values later if they are needed.
+    :param uncertainty: One of UNCERTAINTY_MODES.
+    :param train_size: Share of the rows to fit on; 1.0 fits every row and leaves test_df empty.
+    :param future_dates: Dates to forecast instead of the period days past the training rows.
+    :return: (forecast, model, train_df, test_df)
+    """
+    df = prepare_data(cleaned_df, date_column, target_column, additional_columns)
+    raw_train_df, raw_test_df = split_data(df, 'ds', train_size)
+    # Categorical regressors become a capped set of indicators; the returned frames are encoded
+    encoder = RegressorEncoder().fit(raw_train_df, additional_columns)
+    regressors = encoder.output_columns
+    train_df, test_df = encode_regressors(raw_train_df, encoder), encode_regressors(raw_test_df, encoder)
+
+    # The horizon is not part of the key, so a horizon-only change reuses the fitted model
+    if cache is not None:
+        key = cache.key(train_df, {'seasonality': seasonality, 'additional_columns': list(additional_columns)})
+        model = cache.get(key)
+        registry.inc('model_cache_lookups_total', result='miss' if model is None else 'hit')
+    else:
+        model = None
+    if model is None:
+        with span('fit'):
+            if param_store is not None and series_key is not None:
+                model, _ = incremental_fit(train_df, series_key, param_store,
+                                           lambda init: fit_prophet(train_df, seasonality, regressors, init))
+            else:
+                model = fit_prophet(train_df, seasonality, regressors)
+        if cache is not None:
+            cache.put(key, model)
+
+    # History rows keep their observed regressors; only the horizon is filled in, from the
+    # encoder's summary and the held-out rows' known values, without merging on the history
+    if future_dates is None:
+        future_dates = model.make_future_dataframe(periods=period, include_history=False)['ds']
+    future = encoder.future_frame(future_dates, regressor_strategy, known=raw_test_df)
+    if not horizon_only:
+        future = pd.concat([train_df[['ds'] + regressors], future], ignore_index=True)
+
+    with span('predict'):
+        forecast = predict(model, future, uncertainty)
     return forecast, model, train_df, test_df
 
 def validate_forecast(model, train_df, test_df):
-    forecast = model.predict(test_df[['ds']])
+    # Regressor columns are needed to predict when the model has them; only yhat is scored
+    forecast = predict(model, test_df.drop(columns='y'), 'off')
     actual = test_df['y'].values
     predicted = forecast['yhat'].values
-    percentage_errors = np.abs((actual - predicted) / actual) * 100
-    min_error = np.min(percentage_errors)
-    max_error = np.max(percentage_errors)
+    # Zero actuals have no percentage error; skip them instead of reporting infinity
+    errors = percentage_errors(actual, predicted)
+    if np.isnan(errors).all():
+        return np.nan, np.nan, actual, predicted
+    min_error = np.nanmin(errors)
+    max_error = np.nanmax(errors)
     return min_error, max_error, actual, predicted
 
 # def validate_forecast(model, train_df, test_df):
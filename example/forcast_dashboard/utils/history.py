@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    dataset_hash TEXT NOT NULL,
+    series_id TEXT NOT NULL,
+    run_at REAL NOT NULL,
+    horizon INTEGER NOT NULL,
+    cutoff INTEGER,
+    model TEXT NOT NULL,
+    params TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS runs_by_dataset ON runs (dataset_hash, series_id, run_at, model);
+CREATE INDEX IF NOT EXISTS runs_by_series ON runs (series_id, run_at);
+CREATE INDEX IF NOT EXISTS runs_by_horizon ON runs (series_id, horizon, run_at);
+
+-- Clustered on (series_id, ds) so a date range of one series is a single index range scan
+CREATE TABLE IF NOT EXISTS predictions (
+    series_id TEXT NOT NULL,
+    ds INTEGER NOT NULL,
+    run_id INTEGER NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    yhat REAL,
+    yhat_lower REAL,
+    yhat_upper REAL,
+    PRIMARY KEY (series_id, ds, run_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS predictions_by_run ON predictions (run_id);
+
+-- The latest observed value of each series and date, whichever upload it came from
+CREATE TABLE IF NOT EXISTS actuals (
+    series_id TEXT NOT NULL,
+    ds INTEGER NOT NULL,
+    y REAL,
+    dataset_hash TEXT NOT NULL,
+    PRIMARY KEY (series_id, ds)
+) WITHOUT ROWID;
+"""
+
+
+def _to_seconds(values):
+    """Dates as integer seconds since the epoch, the storage and index key of every ds column."""
+    return pd.to_datetime(pd.Series(values)).to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+
+def _from_seconds(values):
+    return pd.to_datetime(np.asarray(values, dtype=np.int64), unit='s')
+
+
+def _optional(df, column):
+    return df[column].astype(float).tolist() if column in df.columns else [None] * len(df)
+
+
+class ForecastHistory:
+    """Every forecast run, its predictions and the actuals it was trained on, in one SQLite file.
+
+    Runs are indexed by dataset hash, series id, run time and horizon. Predictions and actuals
+    are keyed by (series_id, ds), so actual_vs_predicted() for one series and date range reads
+    only the rows in that range and answers in milliseconds without any network access.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self._connect() as conn:
+            # WAL lets the History page read while a forecast run is being written
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call: Streamlit reruns the script on different threads
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as conn:
+            conn.execute('PRAGMA foreign_keys=ON')
+            with conn:
+                yield conn
+
+    def record_run(self, dataset_hash, series_id, forecast, actuals=None, horizon=0, model='prophet', params=None,
+                   run_at=None):
+        """
+        Store one forecast run, replacing an earlier run with the same dataset, series, time and model.
+        :param forecast: Frame with ds and yhat, and optionally yhat_lower and yhat_upper.
+        :param actuals: Optional frame with ds and y, upserted as the series' observed values.
+        :param horizon: Number of future periods in the forecast.
+        :return: The run id.
+        """
+        run_at = time.time() if run_at is None else run_at
+        cutoff = int(_to_seconds(actuals['ds']).max()) if actuals is not None and len(actuals) else None
+        with self._connect() as conn:
+            conn.execute('DELETE FROM runs WHERE dataset_hash = ? AND series_id = ? AND run_at = ? AND model = ?',
+                         (dataset_hash, series_id, run_at, model))
+            run_id = conn.execute(
+                'INSERT INTO runs (dataset_hash, series_id, run_at, horizon, cutoff, model, params) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (dataset_hash, series_id, run_at, int(horizon), cutoff, model,
+                 json.dumps(params, default=str) if params is not None else None)).lastrowid
+            conn.executemany(
+                'INSERT OR REPLACE INTO predictions (series_id, ds, run_id, yhat, yhat_lower, yhat_upper) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                zip([series_id] * len(forecast), _to_seconds(forecast['ds']).tolist(), [run_id] * len(forecast),
+                    _optional(forecast, 'yhat'), _optional(forecast, 'yhat_lower'), _optional(forecast, 'yhat_upper')))
+            if actuals is not None and len(actuals):
+                self._upsert_actuals(conn, dataset_hash, series_id, actuals)
+        logger.info("Recorded run %d: %d predictions for %s", run_id, len(forecast), series_id)
+        return run_id
+
+    def record_actuals(self, dataset_hash, series_id, actuals):
+        """Upsert observed values (a frame with ds and y) of a series without recording a run."""
+        with self._connect() as conn:
+            self._upsert_actuals(conn, dataset_hash, series_id, actuals)
+
+    def _upsert_actuals(self, conn, dataset_hash, series_id, actuals):
+        conn.executemany(
+            'INSERT OR REPLACE INTO actuals (series_id, ds, y, dataset_hash) VALUES (?, ?, ?, ?)',
+            zip([series_id] * len(actuals), _to_seconds(actuals['ds']).tolist(),
+                actuals['y'].astype(float).tolist(), [dataset_hash] * len(actuals)))
+
+    def record_runs(self, dataset_hash, forecasts, actuals=None, horizon=0, model='prophet', params=None,
+                    id_column='series_id'):
+        """record_run() for each series of a long-format forecast frame, all with the same run time."""
+        run_at = time.time()
+        actuals_by_series = dict(tuple(actuals.groupby(id_column))) if actuals is not None else {}
+        return [self.record_run(dataset_hash, str(series_id), forecast, actuals_by_series.get(series_id), horizon,
+                                model, params, run_at)
+                for series_id, forecast in forecasts.groupby(id_column)]
+
+    def series(self):
+        """Series with at least one run: series_id, runs, last_run_at."""
+        with self._connect() as conn:
+            df = pd.read_sql_query('SELECT series_id, COUNT(*) AS runs, MAX(run_at) AS last_run_at FROM runs '
+                                   'GROUP BY series_id ORDER BY last_run_at DESC', conn)
+        df['last_run_at'] = pd.to_datetime(df['last_run_at'], unit='s')
+        return df
+
+    def runs(self, series_id=None, dataset_hash=None, horizon=None, limit=100):
+        """The most recent runs, optionally of one series, dataset or horizon."""
+        filters = {'series_id': series_id, 'dataset_hash': dataset_hash, 'horizon': horizon}
+        clauses = [f'{column} = ?' for column, value in filters.items() if value is not None]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._connect() as conn:
+            df = pd.read_sql_query(
+                f'SELECT run_id, dataset_hash, series_id, run_at, horizon, cutoff, model, params FROM runs {where} '
+                'ORDER BY run_at DESC LIMIT ?', conn, params=[value for value in filters.values() if value is not None] + [limit])
+        df['run_at'] = pd.to_datetime(df['run_at'], unit='s')
+        df['cutoff'] = pd.to_datetime(df['cutoff'], unit='s')
+        return df
+
+    def date_range(self, series_id):
+        """(first, last) date with an actual or a prediction for the series, or (None, None)."""
+        with self._connect() as conn:
+            low, high = conn.execute(
+                'SELECT MIN(low), MAX(high) FROM ('
+                'SELECT MIN(ds) AS low, MAX(ds) AS high FROM predictions WHERE series_id = ? '
+                'UNION ALL SELECT MIN(ds), MAX(ds) FROM actuals WHERE series_id = ?)', (series_id, series_id)).fetchone()
+        if low is None:
+            return None, None
+        return _from_seconds([low])[0], _from_seconds([high])[0]
+
+    def actual_vs_predicted(self, series_id, start=None, end=None, run_id=None, dataset_hash=None):
+        """
+        Actuals and predictions of one series between start and end (inclusive), one row per date.
+        :param run_id: Predictions of this run only. By default each date takes the prediction of
+            the latest run that covered it, optionally limited to runs on dataset_hash.
+        :return: Frame with ds, y, yhat, yhat_lower, yhat_upper and run_id.
+        """
+        low = int(_to_seconds([start])[0]) if start is not None else np.iinfo(np.int64).min
+        high = int(_to_seconds([end])[0]) if end is not None else np.iinfo(np.int64).max
+        run_filter, run_params = '', []
+        if run_id is not None:
+            run_filter, run_params = 'AND p.run_id = ?', [run_id]
+        elif dataset_hash is not None:
+            run_filter, run_params = 'AND r.dataset_hash = ?', [dataset_hash]
+        with self._connect() as conn:
+            predicted = pd.read_sql_query(
+                'SELECT ds, yhat, yhat_lower, yhat_upper, run_id FROM ('
+                'SELECT p.ds, p.yhat, p.yhat_lower, p.yhat_upper, p.run_id, '
+                'ROW_NUMBER() OVER (PARTITION BY p.ds ORDER BY r.run_at DESC) AS latest '
+                'FROM predictions p JOIN runs r ON r.run_id = p.run_id '
+                f'WHERE p.series_id = ? AND p.ds BETWEEN ? AND ? {run_filter}) WHERE latest = 1',
+                conn, params=[series_id, low, high] + run_params)
+            actual = pd.read_sql_query('SELECT ds, y FROM actuals WHERE series_id = ? AND ds BETWEEN ? AND ?',
+                                       conn, params=[series_id, low, high])
+        merged = actual.merge(predicted, on='ds', how='outer').sort_values('ds', ignore_index=True)
+        merged['ds'] = _from_seconds(merged['ds'])
+        return merged[['ds', 'y', 'yhat', 'yhat_lower', 'yhat_upper', 'run_id']]
+
+    def delete_run(self, run_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM runs WHERE run_id = ?', (run_id,))
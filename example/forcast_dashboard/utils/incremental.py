@@ -0,0 +1,108 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from utils.model_cache import hash_frame
+
+logger = logging.getLogger(__name__)
+
+# Warm starts only pay off when a short tail was appended to unchanged history
+MAX_TAIL_SHARE = 0.1
+# Largest shift of the appended tail's mean, in history standard deviations
+MAX_SHIFT = 3.0
+
+
+def warm_start_params(model):
+    """Fitted Prophet parameters in the form Prophet.fit(init=...) accepts."""
+    return {
+        'k': float(model.params['k'][0][0]),
+        'm': float(model.params['m'][0][0]),
+        'sigma_obs': float(model.params['sigma_obs'][0][0]),
+        'delta': model.params['delta'][0].tolist(),
+        'beta': model.params['beta'][0].tolist(),
+    }
+
+
+class ParamStore:
+    """Last fitted parameters per series, one JSON file per series key."""
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        if not os.path.exists(root_dir):
+            os.makedirs(root_dir)
+
+    def _path(self, series_key):
+        return os.path.join(self.root_dir, hashlib.sha256(series_key.encode()).hexdigest() + '.json')
+
+    def get(self, series_key):
+        path = self._path(series_key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, series_key, state):
+        tmp_path = self._path(series_key) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._path(series_key))
+
+
+def cold_fit_reason(state, train_df, max_tail_share=MAX_TAIL_SHARE, max_shift=MAX_SHIFT):
+    """Why train_df needs a cold fit given the stored state, or None if a warm start fits."""
+    if state is None:
+        return 'no previous fit'
+    n_previous = state['rows']
+    if len(train_df) < n_previous:
+        return 'history shrank'
+    if hash_frame(train_df.iloc[:n_previous]) != state['history_hash']:
+        return 'earlier history changed'
+    tail = train_df['y'].to_numpy(dtype=float)[n_previous:]
+    if len(tail) > max_tail_share * len(train_df):
+        return f'{len(tail)} new rows is more than {max_tail_share:.0%} of history'
+    if len(tail) and state['y_std'] > 0 and abs(tail.mean() - state['y_mean']) > max_shift * state['y_std']:
+        return 'new rows shifted the level'
+    return None
+
+
+def incremental_fit(train_df, series_key, store, fit):
+    """Fit a model, warm-starting from the series' last parameters when only a short tail was added.
+
+    fit(init) fits Prophet on train_df, with init=None for a cold fit. Returns the model
+    and 'warm' or 'cold'. The warm start only changes the optimizer's starting
+    point, so the fitted model is the same as a cold fit up to optimizer tolerance.
+    """
+    state = store.get(series_key)
+    reason = cold_fit_reason(state, train_df)
+    start = time.perf_counter()
+    mode = 'cold'
+    if reason is None:
+        try:
+            model = fit({name: np.asarray(value) if isinstance(value, list) else value
+                         for name, value in state['params'].items()})
+            mode = 'warm'
+        except Exception as e:
+            # e.g. a different number of changepoints or regressors than the stored parameters
+            reason = f'warm start failed: {e}'
+    if mode == 'cold':
+        model = fit(None)
+    logger.info("%s fit for %s in %.2fs%s", mode.capitalize(), series_key, time.perf_counter() - start,
+                f" ({reason})" if reason else "")
+
+    y = train_df['y'].to_numpy(dtype=float)
+    store.put(series_key, {
+        'params': warm_start_params(model),
+        'rows': len(train_df),
+        'history_hash': hash_frame(train_df),
+        'y_mean': float(np.mean(y)),
+        'y_std': float(np.std(y)),
+        'fitted_at': time.time(),
+    })
+    return model, mode
@@ -0,0 +1,146 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Histogram buckets in seconds, from a cache hit to a long Prophet fit
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Spans recorded by the innermost active trace() in this thread or task, and the open span depth
+_active_trace = contextvars.ContextVar('active_trace', default=None)
+_depth = contextvars.ContextVar('span_depth', default=0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Thread-safe counters, gauges and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = _Histogram(self.buckets)
+            series[key].observe(value)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for kind, metrics in (('counter', self._counters), ('gauge', self._gauges)):
+                for name, series in sorted(metrics.items()):
+                    lines.extend(self._header(name, kind))
+                    lines.extend(f'{name}{_format_labels(key)} {value}' for key, value in sorted(series.items()))
+            for name, series in sorted(self._histograms.items()):
+                lines.extend(self._header(name, 'histogram'))
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_format_labels(key, [("le", bound)])} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {histogram.sum}')
+                    lines.append(f'{name}_count{_format_labels(key)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, name, kind):
+        if name in self._help:
+            yield f'# HELP {name} {self._help[name]}'
+        yield f'# TYPE {name} {kind}'
+
+
+registry = Registry()
+registry.describe('stage_seconds', 'Wall time of instrumented pipeline stages')
+registry.describe('stage_errors_total', 'Instrumented stages that raised')
+
+
+@contextmanager
+def span(stage, registry=registry, **labels):
+    """Time a block as one stage: a stage_seconds observation, plus an entry in the active trace."""
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        registry.inc('stage_errors_total', stage=stage, **labels)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _depth.reset(token)
+        registry.observe('stage_seconds', seconds, stage=stage, **labels)
+        spans = _active_trace.get()
+        if spans is not None:
+            spans.append({'stage': stage, 'start': start, 'seconds': seconds, 'depth': depth})
+
+
+def timed(stage, **labels):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def trace():
+    """Collect the spans finished inside the block, e.g. to show one run's stage breakdown.
+
+    Yields a list that fills with {'stage', 'start', 'seconds', 'depth'} dicts in completion
+    order, so a nested span appears before the span containing it; sort by start for a timeline.
+    """
+    spans = []
+    token = _active_trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _active_trace.reset(token)
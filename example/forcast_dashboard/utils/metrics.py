@@ -0,0 +1,48 @@
+import numpy as np
+
+# Vectorised forecast error metrics. Inputs broadcast, so a 2-D (cutoffs x horizon)
+# array scores every backtest window at once with axis=-1. Zero actuals never
+# produce infinities: percentage errors skip them and sMAPE counts 0/0 as exact.
+
+
+def mae(actual, predicted, axis=None):
+    return np.mean(np.abs(np.asarray(actual) - np.asarray(predicted)), axis=axis)
+
+
+def rmse(actual, predicted, axis=None):
+    return np.sqrt(np.mean((np.asarray(actual) - np.asarray(predicted)) ** 2, axis=axis))
+
+
+def percentage_errors(actual, predicted):
+    actual = np.asarray(actual, dtype=float)
+    predicted = np.asarray(predicted, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(actual != 0, np.abs((actual - predicted) / actual) * 100, np.nan)
+
+
+def smape(actual, predicted, axis=None):
+    actual = np.asarray(actual, dtype=float)
+    predicted = np.asarray(predicted, dtype=float)
+    denominator = np.abs(actual) + np.abs(predicted)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        errors = np.where(denominator == 0, 0.0, 200 * np.abs(actual - predicted) / denominator)
+    return np.mean(errors, axis=axis)
+
+
+def naive_scale(insample, season=1):
+    """Mean absolute seasonal-naive error of insample, the MASE denominator."""
+    insample = np.asarray(insample, dtype=float)
+    if len(insample) <= season:
+        return np.nan
+    return np.mean(np.abs(insample[season:] - insample[:-season]))
+
+
+def mase(actual, predicted, scale, axis=None):
+    scale = np.asarray(scale, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(scale > 0, mae(actual, predicted, axis=axis) / scale, np.nan)
+
+
+def coverage(actual, lower, upper, axis=None):
+    actual = np.asarray(actual)
+    return np.mean((actual >= np.asarray(lower)) & (actual <= np.asarray(upper)), axis=axis)
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+from prophet.serialize import model_from_json, model_to_json
+
+logger = logging.getLogger(__name__)
+
+
+def hash_frame(df):
+    """Content hash of a DataFrame: values, column names and dtypes."""
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    digest.update(json.dumps([[str(col), str(dtype)] for col, dtype in df.dtypes.items()]).encode())
+    return digest.hexdigest()
+
+
+class ModelCache:
+    """Two-tier cache of fitted Prophet models keyed by training data and fit parameters.
+
+    The memory tier is an LRU of at most max_entries models. The optional disk tier
+    stores serialized models in cache_dir and is trimmed to max_disk_bytes, oldest
+    access first. Entries older than max_age_seconds are treated as misses.
+    """
+
+    def __init__(self, max_entries=32, cache_dir=None, max_disk_bytes=512 * 1024 * 1024,
+                 max_age_seconds=7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age_seconds = max_age_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    @staticmethod
+    def key(train_df, params):
+        digest = hashlib.sha256(hash_frame(train_df).encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _expired(self, created_at):
+        return self.max_age_seconds is not None and time.time() - created_at > self.max_age_seconds
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                model, created_at = entry
+                if not self._expired(created_at):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return model
+                del self._memory[key]
+
+        model = self._load(key)
+        with self._lock:
+            if model is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, model, os.path.getmtime(self._path(key)))
+        return model
+
+    def put(self, key, model):
+        with self._lock:
+            self._remember(key, model, time.time())
+        if self.cache_dir:
+            try:
+                with open(self._path(key), 'w') as f:
+                    f.write(model_to_json(model))
+                self._evict_disk()
+            except (OSError, ValueError) as e:
+                logger.warning("Could not write model %s to disk cache: %s", key, e)
+
+    def _remember(self, key, model, created_at):
+        self._memory[key] = (model, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _load(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        if self._expired(os.path.getmtime(path)):
+            os.remove(path)
+            return None
+        try:
+            with open(path) as f:
+                model = model_from_json(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning("Discarding unreadable cached model %s: %s", key, e)
+            os.remove(path)
+            return None
+        # Record the access so disk eviction is least-recently-used; mtime stays the creation time.
+        os.utime(path, (time.time(), os.path.getmtime(path)))
+        return model
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            if self._expired(stat.st_mtime):
+                os.remove(path)
+            else:
+                entries.append((stat.st_atime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'memory_entries': len(self._memory)}
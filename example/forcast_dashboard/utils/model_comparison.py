@@ -0,0 +1,169 @@
+import logging
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+MODELS = ["Prophet", "ARIMA", "ETS", "Seasonal Naive"]
+LEADERBOARD_COLUMNS = ['model', 'status', 'fit_seconds', 'mae', 'rmse', 'smape', 'mase', 'error']
+DEFAULT_TIMEOUT = 120
+# z-score of an 80% interval, matching Prophet's default interval_width
+Z_80 = 1.2816
+AUTO_SEASONALITY = {'yearly': 'auto', 'weekly': 'auto', 'daily': 'auto'}
+
+
+def _prophet(ds, y, future_ds, season, seasonality=None, regressors=None, future_regressors=None,
+             regressor_strategy='last'):
+    from utils.forecasting import encode_regressors, fit_prophet
+    from utils.regressors import RegressorEncoder
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+    history = pd.DataFrame({'ds': ds.to_numpy(), 'y': y})
+    columns = []
+    if regressors is not None:
+        history = pd.concat([history, regressors.reset_index(drop=True)], axis=1)
+        columns = list(regressors.columns)
+    encoder = RegressorEncoder().fit(history, columns)
+    model = fit_prophet(encode_regressors(history, encoder), seasonality or AUTO_SEASONALITY, encoder.output_columns)
+    # Regressor values observed over the holdout are used as known; the real future is filled by the strategy
+    known = None
+    if future_regressors is not None:
+        known = future_regressors.reset_index(drop=True).assign(ds=pd.DatetimeIndex(future_ds))
+    forecast = model.predict(encoder.future_frame(future_ds, regressor_strategy, known=known))
+    return forecast['yhat'].to_numpy(), forecast['yhat_lower'].to_numpy(), forecast['yhat_upper'].to_numpy()
+
+
+def _arima(ds, y, future_ds, season, **options):
+    from statsmodels.tsa.arima.model import ARIMA
+    fitted = ARIMA(y, order=(1, 1, 1)).fit()
+    frame = fitted.get_forecast(len(future_ds)).summary_frame(alpha=0.2)
+    return frame['mean'].to_numpy(), frame['mean_ci_lower'].to_numpy(), frame['mean_ci_upper'].to_numpy()
+
+
+def _ets(ds, y, future_ds, season, **options):
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+    seasonal = 'add' if len(y) >= 2 * season else None
+    fitted = ExponentialSmoothing(y, trend='add', seasonal=seasonal,
+                                  seasonal_periods=season if seasonal else None).fit()
+    yhat = np.asarray(fitted.forecast(len(future_ds)))
+    # Approximate interval: residual spread growing with the square root of the step
+    spread = Z_80 * np.std(fitted.resid) * np.sqrt(np.arange(1, len(future_ds) + 1))
+    return yhat, yhat - spread, yhat + spread
+
+
+def _seasonal_naive(ds, y, future_ds, season, **options):
+    season = min(season, len(y))
+    steps = np.arange(len(future_ds))
+    yhat = y[-season:][steps % season]
+    diffs = y[season:] - y[:-season] if len(y) > season else np.zeros(1)
+    spread = Z_80 * np.std(diffs) * np.sqrt(steps // season + 1)
+    return yhat, yhat - spread, yhat + spread
+
+
+MODEL_FUNCTIONS = {
+    "Prophet": _prophet,
+    "ARIMA": _arima,
+    "ETS": _ets,
+    "Seasonal Naive": _seasonal_naive,
+}
+
+
+def _run_model(name, train, test, history, future_ds, season, options, results):
+    start = time.perf_counter()
+    try:
+        fit = MODEL_FUNCTIONS[name]
+        holdout = fit(train['ds'], train['y'], test['ds'], season, regressors=train['X'], future_regressors=test['X'],
+                      **options)[0]
+        forecast = fit(history['ds'], history['y'], future_ds, season, regressors=history['X'], **options)
+        results.put((name, 'ok', holdout, forecast, time.perf_counter() - start, None))
+    except Exception as e:
+        results.put((name, 'failed', None, None, time.perf_counter() - start, str(e)))
+
+
+def _future_dates(ds, period):
+    tail = ds[-min(len(ds), 30):]
+    # infer_freq raises rather than returning None on fewer than three dates
+    freq = (pd.infer_freq(tail) if len(tail) >= 3 else None) or 'D'
+    return pd.date_range(ds.iloc[-1], periods=period + 1, freq=freq)[1:]
+
+
+def compare_models(df, period, models=MODELS, holdout=None, season=7, timeout=DEFAULT_TIMEOUT, rank_by='smape',
+                   seasonality=None, regressors=(), regressor_strategy='last'):
+    """Fit each model in its own process and score them on the same holdout.
+
+    df has 'ds' and 'y' columns, plus any regressors columns. Prophet uses the seasonality
+    dict (yearly/weekly/daily, default 'auto') and the regressors, encoded by RegressorEncoder
+    and filled in beyond the data with regressor_strategy; the other models use only y. Each model is fitted once on the training part to score
+    the last holdout rows and once on the full history to forecast period steps ahead.
+    A model still running after its timeout (seconds, or a dict of seconds per model) is
+    terminated and reported as 'timeout', so a slow model never holds up the others.
+    Returns the leaderboard sorted by rank_by and the winning model's forecast (None if
+    every model failed).
+    """
+    df = df.assign(ds=pd.to_datetime(df['ds'])).sort_values('ds').reset_index(drop=True)
+    holdout = holdout or max(1, min(period, len(df) // 5))
+    X = df[list(regressors)] if regressors else None
+    train = {'ds': df['ds'].iloc[:-holdout], 'y': df['y'].to_numpy(dtype=float)[:-holdout],
+             'X': X.iloc[:-holdout] if X is not None else None}
+    history = {'ds': df['ds'], 'y': df['y'].to_numpy(dtype=float), 'X': X}
+    test = {'ds': df['ds'].iloc[-holdout:], 'X': X.iloc[-holdout:] if X is not None else None}
+    options = {'seasonality': seasonality, 'regressor_strategy': regressor_strategy}
+    actual = df['y'].to_numpy(dtype=float)[-holdout:]
+    future_ds = _future_dates(df['ds'], period)
+    scale = metrics.naive_scale(train['y'], season)
+    start = time.monotonic()
+
+    results = multiprocessing.Queue()
+    processes = {}
+    deadlines = {}
+    for name in models:
+        process = multiprocessing.Process(target=_run_model, daemon=True,
+                                          args=(name, train, test, history, future_ds, season, options, results))
+        process.start()
+        processes[name] = process
+        deadlines[name] = time.monotonic() + (timeout.get(name, DEFAULT_TIMEOUT) if isinstance(timeout, dict) else timeout)
+
+    rows = {}
+    forecasts = {}
+    while len(rows) < len(processes):
+        pending = [name for name in processes if name not in rows]
+        now = time.monotonic()
+        for name in pending:
+            if deadlines[name] <= now:
+                # Stop waiting on a slow model; the others keep running
+                processes[name].terminate()
+                rows[name] = {'model': name, 'status': 'timeout', 'fit_seconds': deadlines[name] - start,
+                              'error': f"no result within {deadlines[name] - start:.1f}s"}
+                logger.warning("Model %s timed out", name)
+        pending = [name for name in processes if name not in rows]
+        if not pending:
+            break
+        try:
+            name, status, holdout_yhat, forecast, seconds, error = results.get(
+                timeout=max(0.0, min(deadlines[name] for name in pending) - now))
+        except queue.Empty:
+            continue
+        if name in rows:
+            continue  # Arrived just after its timeout
+        row = {'model': name, 'status': status, 'fit_seconds': seconds, 'error': error}
+        if status == 'ok':
+            row.update(mae=metrics.mae(actual, holdout_yhat), rmse=metrics.rmse(actual, holdout_yhat),
+                       smape=metrics.smape(actual, holdout_yhat), mase=float(metrics.mase(actual, holdout_yhat, scale)))
+            yhat, lower, upper = forecast
+            forecasts[name] = pd.DataFrame({'ds': future_ds, 'yhat': yhat, 'yhat_lower': lower, 'yhat_upper': upper})
+        rows[name] = row
+
+    for process in processes.values():
+        process.join()
+
+    leaderboard = pd.DataFrame(list(rows.values()), columns=LEADERBOARD_COLUMNS)
+    leaderboard['ok'] = leaderboard['status'] == 'ok'
+    leaderboard = (leaderboard.sort_values(['ok', rank_by], ascending=[False, True])
+                   .drop(columns='ok').reset_index(drop=True))
+    winner = leaderboard['model'].iloc[0] if leaderboard['status'].iloc[0] == 'ok' else None
+    return leaderboard, (forecasts[winner] if winner else None)
@@ -0,0 +1,168 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from utils.baselines import BASELINE_MODELS, baseline_forecast_frame, infer_frequency, pivot_series, route_to_prophet
+from utils.data_cleaning import DataCleaner
+from utils.forecasting import forecast_with_prophet
+
+logger = logging.getLogger(__name__)
+
+FORECAST_COLUMNS = ['ds', 'yhat', 'yhat_lower', 'yhat_upper']
+SUMMARY_COLUMNS = ['series_id', 'model', 'status', 'rows', 'fit_seconds', 'error']
+ALL_SERIES_MODELS = ['prophet', 'auto'] + BASELINE_MODELS
+
+# Several batches per worker keep the pool busy when series differ in length,
+# while still amortising the per-task pickling overhead.
+BATCHES_PER_WORKER = 4
+
+
+def quiet_worker():
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+    logging.getLogger('prophet').setLevel(logging.WARNING)
+
+
+def split_series(df, id_column, columns):
+    """Split df once by id_column, keeping only the columns needed for fitting."""
+    projected = df[[id_column] + [col for col in columns if col != id_column]]
+    return [(series_id, group.drop(columns=id_column))
+            for series_id, group in projected.groupby(id_column, sort=False, observed=True)]
+
+
+def _batches(items, n_batches):
+    n_batches = max(1, min(n_batches, len(items)))
+    return [items[i::n_batches] for i in range(n_batches)]
+
+
+def _series_frequency(dates):
+    # Prophet copes with irregular dates, so a series without a regular frequency gets daily steps
+    try:
+        return infer_frequency(dates)
+    except ValueError:
+        return 'D'
+
+
+def _forecast_series(series_id, series_df, date_column, target_column, period, seasonality, additional_columns,
+                     uncertainty, future_dates):
+    start = time.perf_counter()
+    status = {'series_id': series_id, 'model': 'prophet', 'status': 'ok', 'rows': len(series_df), 'fit_seconds': 0.0, 'error': None}
+    forecast = None
+    try:
+        cleaned_df = DataCleaner(series_df).clean_data(date_column)
+        aggregated_df = DataCleaner(cleaned_df).aggregate_data(date_column, target_column, additional_columns)
+        if len(aggregated_df) < 2:
+            status['status'] = 'skipped'
+            status['error'] = 'fewer than 2 dated observations'
+        else:
+            if future_dates is None:
+                dates = aggregated_df[date_column]
+                future_dates = pd.date_range(dates.max(), periods=period + 1, freq=_series_frequency(dates))[1:]
+            # Fitted on every row and scored on the future dates only, like the baselines
+            forecast, _, _, _ = forecast_with_prophet(aggregated_df, date_column, 'y', period, seasonality,
+                                                      additional_columns, horizon_only=True, uncertainty=uncertainty,
+                                                      train_size=1.0, future_dates=future_dates)
+            forecast = forecast[FORECAST_COLUMNS]
+            forecast.insert(0, 'series_id', series_id)
+    except Exception as e:
+        status['status'] = 'failed'
+        status['error'] = str(e)
+    status['fit_seconds'] = time.perf_counter() - start
+    return forecast, status
+
+
+def _forecast_batch(batch, date_column, target_column, period, seasonality, additional_columns, uncertainty,
+                    future_dates):
+    return [_forecast_series(series_id, series_df, date_column, target_column, period, seasonality, additional_columns,
+                             uncertainty, future_dates)
+            for series_id, series_df in batch]
+
+
+def _forecast_with_baselines(df, id_column, date_column, target_column, period, seasonality, model,
+                             max_workers, uncertainty):
+    start = time.perf_counter()
+    season = 7 if seasonality.get('weekly') else 1
+    cleaned_df = DataCleaner(df[[id_column, date_column, target_column]]).clean_data(date_column)
+    # Missing periods are zero-filled on the data's own grid, not on a daily one
+    freq = infer_frequency(cleaned_df[date_column])
+    Y, series_ids, dates = pivot_series(cleaned_df, id_column, date_column, target_column, freq=freq)
+    rows = cleaned_df.groupby(id_column, observed=True).size()
+
+    use_prophet = route_to_prophet(Y, season) if model == 'auto' else np.zeros(len(series_ids), dtype=bool)
+    baseline_model = 'holt_winters' if model == 'auto' else model
+    forecast_df = baseline_forecast_frame(Y[~use_prophet], series_ids[~use_prophet], dates, period,
+                                          baseline_model, season, freq)
+    baseline_ids = series_ids[~use_prophet]
+    summary_df = pd.DataFrame({
+        'series_id': baseline_ids,
+        'model': baseline_model,
+        'status': 'ok',
+        'rows': rows.reindex(baseline_ids).to_numpy(),
+        'fit_seconds': (time.perf_counter() - start) / max(len(baseline_ids), 1),
+        'error': None,
+    }, columns=SUMMARY_COLUMNS)
+
+    if use_prophet.any():
+        prophet_df = df[df[id_column].isin(series_ids[use_prophet])]
+        # Routed series are forecast on the baselines' dates, so every row of the result shares one window
+        prophet_forecast, prophet_summary = forecast_all_series(
+            prophet_df, id_column, date_column, target_column, period, seasonality, [], max_workers,
+            uncertainty=uncertainty, future_dates=pd.date_range(dates[-1], periods=period + 1, freq=freq)[1:])
+        forecast_df = pd.concat([forecast_df, prophet_forecast], ignore_index=True)
+        summary_df = pd.concat([summary_df, prophet_summary], ignore_index=True)
+    logger.info("Forecast %d series with %s (%d routed to Prophet) in %.2fs",
+                len(summary_df), model, use_prophet.sum(), time.perf_counter() - start)
+    return forecast_df, summary_df
+
+
+def forecast_all_series(df, id_column, date_column, target_column, period, seasonality, additional_columns,
+                        max_workers=None, model='prophet', uncertainty='samples', future_dates=None):
+    """Forecast every value of id_column.
+
+    With model='prophet' one Prophet model per series is fitted, on all its rows, on a process
+    pool. The batched baselines ('holt_winters', 'seasonal_naive', 'drift') forecast all series
+    in one vectorised pass and ignore additional_columns; 'auto' uses Holt-Winters and sends
+    only the series that route_to_prophet selects to Prophet. uncertainty is passed to
+    forecast_with_prophet for the series Prophet forecasts.
+
+    Prophet forecasts period steps of each series' own frequency (daily when it has none)
+    after its last date, or future_dates when given. The baselines, and the series 'auto'
+    routes to Prophet, forecast period steps of the panel's frequency after its last date and
+    raise ValueError when it cannot be inferred.
+
+    Returns a long-format forecast frame (series_id, ds, yhat, yhat_lower, yhat_upper) and a
+    per-series summary frame with model, status and timing.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if model != 'prophet':
+        return _forecast_with_baselines(df, id_column, date_column, target_column, period, seasonality, model,
+                                        max_workers, uncertainty)
+
+    series = split_series(df, id_column, [date_column, target_column] + list(additional_columns))
+    args = (date_column, target_column, period, seasonality, list(additional_columns), uncertainty, future_dates)
+    start = time.perf_counter()
+
+    results = []
+    if max_workers == 1 or len(series) == 1:
+        results.extend(_forecast_batch(series, *args))
+    else:
+        batches = _batches(series, max_workers * BATCHES_PER_WORKER)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=quiet_worker) as executor:
+            futures = [executor.submit(_forecast_batch, batch, *args) for batch in batches]
+            for future in as_completed(futures):
+                results.extend(future.result())
+
+    order = {series_id: i for i, (series_id, _) in enumerate(series)}
+    results.sort(key=lambda result: order[result[1]['series_id']])
+    forecasts = [forecast for forecast, _ in results if forecast is not None]
+    forecast_df = (pd.concat(forecasts, ignore_index=True) if forecasts
+                   else pd.DataFrame(columns=['series_id'] + FORECAST_COLUMNS))
+    summary_df = pd.DataFrame([status for _, status in results], columns=SUMMARY_COLUMNS)
+
+    logger.info("Forecast %d series (%d failed) in %.2fs on %d workers",
+                len(summary_df), (summary_df['status'] == 'failed').sum(),
+                time.perf_counter() - start, max_workers)
+    return forecast_df, summary_df
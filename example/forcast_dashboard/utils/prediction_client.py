@@ -0,0 +1,189 @@
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Vertex AI rejects request bodies over 1.5 MB; stay well under it
+MAX_BATCH_BYTES = 1000000
+MAX_BATCH_INSTANCES = 500
+# How long the first instance of a batch waits for others to join it
+MAX_WAIT_SECONDS = 0.01
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Queued after the last instance by close()
+_CLOSE = object()
+
+
+class PredictionError(Exception):
+    pass
+
+
+class ClientClosedError(RuntimeError):
+    pass
+
+
+class PredictionClient:
+    """Vertex AI endpoint client that coalesces concurrent predict() calls into batched requests.
+
+    Every call queues one instance and returns its prediction. A dispatcher thread groups queued
+    instances into one {"instances": [...]} request once MAX_BATCH_INSTANCES or MAX_BATCH_BYTES
+    is reached or the oldest has waited MAX_WAIT_SECONDS, sends up to max_in_flight requests at a
+    time over one pooled session, and hands each caller its own element of "predictions".
+    Throttling and server errors are retried with exponential backoff and jitter.
+
+    token is a string or a callable returning the current access token.
+    """
+
+    def __init__(self, url, token=None, max_batch_instances=MAX_BATCH_INSTANCES, max_batch_bytes=MAX_BATCH_BYTES,
+                 max_wait=MAX_WAIT_SECONDS, max_in_flight=8, max_retries=5, backoff=0.5, timeout=60):
+        self.url = url
+        self.token = token
+        self.max_batch_instances = max_batch_instances
+        self.max_batch_bytes = max_batch_bytes
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # Bounds the requests in flight; the dispatcher blocks on it so queued instances keep batching
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._senders = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='predict')
+        self._queue = queue.Queue()
+        self._closed = False
+        # Makes submit()'s closed check and enqueue atomic with close(), so no instance lands after _CLOSE
+        self._close_lock = threading.Lock()
+        self._metrics = {'instances': 0, 'requests': 0, 'retries': 0, 'failed_requests': 0}
+        self._metrics_lock = threading.Lock()
+        self._dispatcher = threading.Thread(target=self._dispatch, name='predict-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, instance):
+        """Queue one instance; the returned Future resolves to its prediction."""
+        future = Future()
+        # Serialised once here; the batch body is these strings joined
+        encoded = json.dumps(instance)
+        with self._close_lock:
+            if self._closed:
+                raise ClientClosedError("PredictionClient is closed")
+            self._queue.put((encoded, future))
+        return future
+
+    def predict(self, instance):
+        return self.submit(instance).result()
+
+    def predict_many(self, instances):
+        futures = [self.submit(instance) for instance in instances]
+        return [future.result() for future in futures]
+
+    def stats(self):
+        with self._metrics_lock:
+            stats = dict(self._metrics)
+        stats['mean_batch_size'] = stats['instances'] / stats['requests'] if stats['requests'] else 0.0
+        return stats
+
+    def close(self):
+        """Send everything already queued, then stop. Later submit() calls raise ClientClosedError."""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_CLOSE)
+        self._dispatcher.join()
+        self._senders.shutdown(wait=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _dispatch(self):
+        carried = None
+        while True:
+            item = carried if carried is not None else self._queue.get()
+            carried = None
+            if item is _CLOSE:
+                self._fail_queued()
+                return
+            batch, size = [item], len(item[0]) + 1
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_instances:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _CLOSE or size + len(item[0]) + 1 > self.max_batch_bytes:
+                    carried = item  # Starts the next batch, or ends the loop after this one
+                    break
+                batch.append(item)
+                size += len(item[0]) + 1
+            self._slots.acquire()
+            self._senders.submit(self._send, batch)
+
+    def _fail_queued(self):
+        # Nothing can be queued after _CLOSE while submit() holds the close lock; this is a safety
+        # net so a caller never waits forever on a future no dispatcher will resolve
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _CLOSE:
+                item[1].set_exception(ClientClosedError("PredictionClient closed before the instance was sent"))
+
+    def _headers(self):
+        headers = {'Content-Type': 'application/json'}
+        token = self.token() if callable(self.token) else self.token
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        return headers
+
+    def _post(self, body):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.url, data=body, headers=self._headers(), timeout=self.timeout)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response.json()
+                error = PredictionError(f"HTTP {response.status_code}: {response.text[:200]}")
+                retry_after = response.headers.get('Retry-After')
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error, retry_after = e, None
+            if attempt == self.max_retries:
+                raise error
+            with self._metrics_lock:
+                self._metrics['retries'] += 1
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * 2 ** attempt
+            time.sleep(delay * random.uniform(0.5, 1.5))
+
+    def _send(self, batch):
+        try:
+            body = '{"instances": [' + ','.join(encoded for encoded, _ in batch) + ']}'
+            predictions = self._post(body)['predictions']
+            if len(predictions) != len(batch):
+                raise PredictionError(f"Sent {len(batch)} instances but got {len(predictions)} predictions")
+            for (_, future), prediction in zip(batch, predictions):
+                future.set_result(prediction)
+            with self._metrics_lock:
+                self._metrics['instances'] += len(batch)
+                self._metrics['requests'] += 1
+        except Exception as e:
+            logger.warning("Prediction request for %d instances failed: %s", len(batch), e)
+            with self._metrics_lock:
+                self._metrics['failed_requests'] += 1
+            for _, future in batch:
+                future.set_exception(e)
+        finally:
+            self._slots.release()
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+# Day-to-day changes above/below these quantiles of a series' changes count as significant
+INCREASE_QUANTILE = 0.95
+DECREASE_QUANTILE = 0.05
+EXTREME_COLUMNS = ['series_id', 'peak_month', 'peak_yhat', 'trough_month', 'trough_yhat']
+CHANGE_COLUMNS = ['series_id', 'ds', 'yhat', 'yhat_diff', 'direction']
+
+# Pure analytics behind the recommended actions. Every function reads only the ds and yhat
+# columns (plus id_column for many series), never adds columns to the forecast it is given,
+# and handles any number of series in one grouped pass. Rendering is left to the caller.
+
+
+def _series_keys(forecast, id_column):
+    if id_column is None:
+        return pd.Series(np.zeros(len(forecast), dtype=int), index=forecast.index)
+    return forecast[id_column]
+
+
+def monthly_extremes(forecast, id_column=None):
+    """Per series, the calendar month with the highest and lowest mean forecast."""
+    keys = _series_keys(forecast, id_column)
+    month = pd.to_datetime(forecast['ds']).dt.month
+    monthly = forecast['yhat'].groupby([keys, month], observed=True).mean().unstack()
+    values = monthly.to_numpy()
+    peak = np.nanargmax(values, axis=1)
+    trough = np.nanargmin(values, axis=1)
+    rows = np.arange(len(values))
+    return pd.DataFrame({
+        'series_id': monthly.index.to_numpy() if id_column is not None else None,
+        'peak_month': monthly.columns.to_numpy()[peak],
+        'peak_yhat': values[rows, peak],
+        'trough_month': monthly.columns.to_numpy()[trough],
+        'trough_yhat': values[rows, trough],
+    }, columns=EXTREME_COLUMNS)
+
+
+def significant_changes(forecast, id_column=None, increase_quantile=INCREASE_QUANTILE,
+                        decrease_quantile=DECREASE_QUANTILE):
+    """Rows whose change from the previous row is extreme relative to the same series' changes.
+
+    forecast must be sorted by ds within each series, as Prophet and the batched forecasts are.
+    """
+    keys = _series_keys(forecast, id_column)
+    codes, _ = pd.factorize(keys)
+    yhat_diff = forecast['yhat'].groupby(codes).diff()
+    # Both quantiles of every series in one grouped pass, broadcast back to the rows by code
+    bounds = yhat_diff.groupby(codes).quantile([decrease_quantile, increase_quantile]).unstack().to_numpy()
+    lower, upper = bounds[codes, 0], bounds[codes, 1]
+    increase = yhat_diff.to_numpy() > upper
+    decrease = yhat_diff.to_numpy() < lower
+    selected = increase | decrease
+    return pd.DataFrame({
+        'series_id': keys.to_numpy()[selected] if id_column is not None else None,
+        'ds': forecast['ds'].to_numpy()[selected],
+        'yhat': forecast['yhat'].to_numpy()[selected],
+        'yhat_diff': yhat_diff.to_numpy()[selected],
+        'direction': np.where(increase[selected], 'increase', 'decrease'),
+    }, columns=CHANGE_COLUMNS)
+
+
+def recommendations(forecast, id_column=None):
+    """Monthly extremes and significant changes for one forecast or a long frame of many."""
+    return monthly_extremes(forecast, id_column), significant_changes(forecast, id_column)
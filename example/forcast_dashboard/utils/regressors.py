@@ -0,0 +1,154 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype
+
+logger = logging.getLogger(__name__)
+
+# Levels of a categorical regressor that get their own indicator column; the rest share OTHER
+MAX_CATEGORIES = 20
+# Levels rarer than this share of rows go to OTHER even below MAX_CATEGORIES
+MIN_SHARE = 0.01
+OTHER = '__other__'
+# Trailing values kept per regressor for the seasonal_naive strategy
+SEASON = 7
+
+
+def _last(state, horizon):
+    return np.repeat(state['tail'][-1:], horizon)
+
+
+def _mean(state, horizon):
+    # Categoricals have no mean; their most frequent level is the typical value
+    return np.repeat(state['mean'] if state['kind'] == 'numeric' else state['reference'], horizon)
+
+
+def _zero(state, horizon):
+    # The reference level encodes as all-zero indicators
+    return np.repeat(0.0 if state['kind'] == 'numeric' else state['reference'], horizon)
+
+
+def _seasonal_naive(state, horizon):
+    tail = state['tail']
+    return tail[np.arange(horizon) % len(tail)]
+
+
+# Future-value strategies: fn(state, horizon) -> horizon raw values of one regressor. A callable
+# with this signature can be passed anywhere a strategy name is accepted.
+FUTURE_STRATEGIES = {
+    'last': _last,
+    'mean': _mean,
+    'zero': _zero,
+    'seasonal_naive': _seasonal_naive,
+}
+
+
+class RegressorEncoder:
+    """Encodes regressor columns for Prophet and builds their future values.
+
+    Numeric and boolean columns pass through. Categorical columns become indicator columns for at
+    most max_categories levels, with the most frequent level as the all-zero reference and rare
+    levels pooled into one OTHER indicator, so a high-cardinality column adds a bounded number of
+    regressors. Constant and datetime columns are dropped.
+
+    fit() keeps only a small summary per column (last values, mean, levels), so future_frame()
+    builds the future design matrix in O(horizon) without touching the history again.
+    """
+
+    def __init__(self, max_categories=MAX_CATEGORIES, min_share=MIN_SHARE, season=SEASON):
+        self.max_categories = max_categories
+        self.min_share = min_share
+        self.season = season
+        self.states = {}
+        self.output_columns = []
+
+    def fit(self, df, columns):
+        """Learn the encoding of columns from df, sorted by ds when it has one."""
+        if 'ds' in df.columns and not df['ds'].is_monotonic_increasing:
+            df = df.sort_values('ds', kind='stable')
+        self.states = {}
+        for column in columns:
+            values = df[column]
+            if is_datetime64_any_dtype(values):
+                logger.warning("Ignoring datetime column %s as a regressor", column)
+                continue
+            if values.nunique(dropna=False) <= 1:
+                logger.info("Ignoring constant regressor %s", column)
+                continue
+            if is_numeric_dtype(values) or is_bool_dtype(values):
+                numeric = values.astype(float)
+                self.states[column] = {
+                    'kind': 'numeric',
+                    'outputs': [column],
+                    'mean': float(numeric.mean()),
+                    'tail': numeric.to_numpy()[-self.season:],
+                }
+                continue
+            counts = values.astype(str).value_counts()
+            shares = counts / counts.sum()
+            # The most frequent level is always kept, as the reference
+            reference = shares.index[0]
+            candidates = shares.iloc[1:self.max_categories + 1]
+            levels = candidates.index[candidates >= self.min_share].tolist()
+            pooled = len(levels) + 1 < len(counts)
+            self.states[column] = {
+                'kind': 'categorical',
+                'reference': reference,
+                'levels': levels + ([OTHER] if pooled else []),
+                'outputs': [f"{column}[{level}]" for level in levels + ([OTHER] if pooled else [])],
+                'tail': values.astype(str).to_numpy()[-self.season:],
+            }
+            if pooled:
+                logger.info("Regressor %s: %d of %d levels kept, the rest pooled into %s",
+                            column, len(levels), len(counts) - 1, OTHER)
+        self.output_columns = [name for state in self.states.values() for name in state['outputs']]
+        return self
+
+    def _encode(self, column, values):
+        state = self.states[column]
+        if state['kind'] == 'numeric':
+            # Prophet rejects missing regressor values; the training mean is a neutral fill
+            return {column: pd.to_numeric(values, errors='coerce').astype(float).fillna(state['mean']).to_numpy()}
+        values = pd.Series(values).astype(str)
+        levels = state['levels']
+        codes = pd.Categorical(values, categories=levels).codes
+        if levels and levels[-1] == OTHER:
+            # Anything that is neither the reference nor a kept level, including unseen levels
+            codes = np.where((codes == -1) & (values.to_numpy() != state['reference']), len(levels) - 1, codes)
+        indicators = (codes[:, None] == np.arange(len(levels))).astype(np.uint8)
+        return dict(zip(state['outputs'], indicators.T))
+
+    def transform(self, df):
+        """The encoded regressor columns of df, aligned with its index."""
+        encoded = {}
+        for column in self.states:
+            encoded.update(self._encode(column, df[column]))
+        return pd.DataFrame(encoded, index=df.index, columns=self.output_columns)
+
+    def future_values(self, dates, strategy='last', known=None):
+        """
+        Raw future values of every fitted regressor.
+        :param dates: The future dates.
+        :param strategy: A FUTURE_STRATEGIES name or callable, or a dict of them by column.
+        :param known: Optional frame with ds and regressor columns whose non-null values
+            (e.g. planned promotions) override the strategy on matching dates.
+        :return: Frame with ds and one raw column per regressor.
+        """
+        dates = pd.DatetimeIndex(dates)
+        future = pd.DataFrame({'ds': dates})
+        if known is not None:
+            known = known.drop_duplicates('ds', keep='last').set_index('ds')
+        for column, state in self.states.items():
+            column_strategy = strategy.get(column, 'last') if isinstance(strategy, dict) else strategy
+            fill = FUTURE_STRATEGIES[column_strategy] if isinstance(column_strategy, str) else column_strategy
+            values = pd.Series(fill(state, len(dates)), index=dates)
+            if known is not None and column in known.columns:
+                values = known[column].reindex(dates).combine_first(values)
+            future[column] = values.to_numpy()
+        return future
+
+    def future_frame(self, dates, strategy='last', known=None):
+        """The future design matrix: ds and the encoded regressor columns, one row per date."""
+        future = self.future_values(dates, strategy, known)
+        return pd.concat([future[['ds']], self.transform(future)], axis=1)
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUOTA_BYTES = 2 * 1024 * 1024 * 1024
+
+
+class UploadStore:
+    """Content-addressed registry of uploads converted to Parquet once.
+
+    put() hashes the uploaded bytes and only converts a CSV that has not been seen
+    before; read() decodes just the requested columns into a new DataFrame, which is a
+    copy of the data even though the Parquet file is memory-mapped.
+    The directory is kept under quota_bytes by evicting the least recently read files.
+    Reads only touch the in-memory index; index.json is rewritten when an upload is added,
+    exported or evicted, which also persists the recency of earlier reads.
+    """
+
+    def __init__(self, root_dir, quota_bytes=DEFAULT_QUOTA_BYTES):
+        self.root_dir = root_dir
+        self.quota_bytes = quota_bytes
+        self._index_path = os.path.join(root_dir, 'index.json')
+        self._lock = threading.Lock()
+        if not os.path.exists(root_dir):
+            os.makedirs(root_dir)
+        self._index = self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self._index_path):
+            return {}
+        try:
+            with open(self._index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            logger.warning("Upload index %s is unreadable, starting a new one", self._index_path)
+            return {}
+
+    def _save_index(self):
+        tmp_path = f"{self._index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path)
+
+    def path(self, key):
+        return os.path.join(self.root_dir, f"{key}.parquet")
+
+    def __contains__(self, key):
+        return key in self._index and os.path.exists(self.path(key))
+
+    def put(self, data, name):
+        """Register uploaded CSV bytes and return their content key."""
+        data = bytes(data)
+        key = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if key in self:
+                self._index[key]['last_used'] = time.time()
+                return key
+
+            table = pa_csv.read_csv(pa.BufferReader(data))
+            tmp_path = f"{self.path(key)}.tmp"
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, self.path(key))
+            self._index[key] = {
+                'name': name,
+                'rows': table.num_rows,
+                'columns': table.column_names,
+                'bytes': os.path.getsize(self.path(key)),
+                'last_used': time.time(),
+            }
+            self._evict(keep=key)
+            self._save_index()
+        logger.info("Converted upload %s (%d rows) to %s", name, table.num_rows, self.path(key))
+        return key
+
+    def columns(self, key):
+        return self._index[key]['columns']
+
+    def read(self, key, columns=None):
+        """Read the requested columns of the upload into a DataFrame (a copy; only the file is memory-mapped)."""
+        with self._lock:
+            self._index[key]['last_used'] = time.time()
+        table = pq.read_table(self.path(key), columns=columns, memory_map=True)
+        return table.to_pandas()
+
+    def csv_path(self, key):
+        return os.path.join(self.root_dir, f"{key}.csv")
+
+    def export_csv(self, key):
+        """Write the upload back out as CSV once, for consumers that only accept CSV files."""
+        with self._lock:
+            entry = self._index[key]
+            if not os.path.exists(self.csv_path(key)):
+                table = pq.read_table(self.path(key), memory_map=True)
+                tmp_path = f"{self.csv_path(key)}.tmp"
+                pa_csv.write_csv(table, tmp_path)
+                os.replace(tmp_path, self.csv_path(key))
+                entry['bytes'] += os.path.getsize(self.csv_path(key))
+            entry['last_used'] = time.time()
+            self._evict(keep=key)
+            self._save_index()
+        return self.csv_path(key)
+
+    def _evict(self, keep=None):
+        total = sum(entry['bytes'] for entry in self._index.values())
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.quota_bytes:
+                break
+            if key == keep:
+                continue
+            for path in (self.path(key), self.csv_path(key)):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= entry['bytes']
+            del self._index[key]
+            logger.info("Evicted upload %s (%s)", key, entry['name'])
@@ -1,52 +1,205 @@
+import numpy as np
 import plotly.graph_objects as go
 import pandas as pd
 from plotly.subplots import make_subplots
-from prophet.plot import plot_plotly, plot_components_plotly
 import streamlit as st
 
-def plot_forecast(model, forecast):
-    fig = plot_plotly(model, forecast)
-    return fig
+from utils.recommendations import recommendations
+
+# Points drawn per trace, about one per horizontal pixel of a wide chart. Longer series
+# are downsampled with LTTB and drawn with WebGL traces, so the payload and render time
+# stay flat however long the history is.
+MAX_POINTS = 2000
+FORECAST_COLOR = '#0072B2'
+INTERVAL_COLOR = 'rgba(0, 114, 178, 0.2)'
+
+
+def _numeric(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def lttb(x, y, n_out=MAX_POINTS):
+    """Indices of the n_out points Largest-Triangle-Three-Buckets keeps to draw y against x.
+
+    The first and last points are always kept; every bucket in between keeps the point
+    forming the largest triangle with the previous pick and the next bucket's mean, which
+    preserves peaks and troughs that plain striding would drop.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = _numeric(x)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x[:n - 1], edges[:-1]) / sizes
+    mean_y = np.add.reduceat(y[:n - 1], edges[:-1]) / sizes
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        ax, ay = x[selected[i]], y[selected[i]]
+        area = np.abs((ax - mean_x[i]) * (y[start:stop] - ay) - (ax - x[start:stop]) * (mean_y[i] - ay))
+        selected[i + 1] = start + np.argmax(area)
+    return selected
+
+
+def downsample(df, x_column, y_column, max_points=MAX_POINTS):
+    return df.iloc[lttb(df[x_column], df[y_column], max_points)]
+
+
+def _line(df, x_column, y_column, name, color, max_points=MAX_POINTS):
+    df = downsample(df, x_column, y_column, max_points)
+    return go.Scattergl(x=df[x_column], y=df[y_column], mode='lines', name=name, line=dict(color=color))
+
+
+# Figures are cached as plain JSON-ready dicts per input frame, so a rerun of the page
+# (any widget change) reuses them instead of rebuilding the traces. The public plot_*
+# functions turn them back into go.Figure, so every one of them returns a Figure.
+def _figure(spec):
+    return go.Figure(spec)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _forecast_figure(history, forecast, max_points):
+    band = downsample(forecast, 'ds', 'yhat', max_points)
+    actual = downsample(history.dropna(), 'ds', 'y', max_points)
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(x=band['ds'], y=band['yhat_upper'], mode='lines', line=dict(width=0),
+                               showlegend=False, hoverinfo='skip'))
+    fig.add_trace(go.Scattergl(x=band['ds'], y=band['yhat_lower'], mode='lines', line=dict(width=0),
+                               fill='tonexty', fillcolor=INTERVAL_COLOR, name='Interval'))
+    fig.add_trace(go.Scattergl(x=band['ds'], y=band['yhat'], mode='lines', name='Predicted',
+                               line=dict(color=FORECAST_COLOR)))
+    fig.add_trace(go.Scattergl(x=actual['ds'], y=actual['y'], mode='markers', name='Actual',
+                               marker=dict(color='black', size=3)))
+    fig.update_layout(title="Forecast", xaxis_title="Date", yaxis_title="Values", height=600)
+    return fig.to_plotly_json()
+
+
+def plot_forecast(model, forecast, max_points=MAX_POINTS):
+    return _figure(_forecast_figure(model.history[['ds', 'y']], forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']], max_points))
+
 
-def plot_seasonality(model, forecast):
-    fig_seasonality = plot_components_plotly(model, forecast)
-    return fig_seasonality
+# One cycle of each seasonality: (column, grouping of the dates, x-axis title)
+SEASONAL_CYCLES = [
+    ('weekly', lambda ds: ds.dt.dayofweek, "Day of week"),
+    ('yearly', lambda ds: ds.dt.dayofyear, "Day of year"),
+    ('daily', lambda ds: ds.dt.hour + ds.dt.minute / 60, "Hour of day"),
+]
 
-def plot_trend_and_seasonality(forecast):
+
+def _regressor_components(model):
+    """Holiday and extra-regressor component columns of the model's forecasts, as Prophet plots them."""
+    components = ['holidays'] if model.train_holiday_names is not None else []
+    modes = {props['mode'] for props in model.extra_regressors.values()}
+    return components + [f'extra_regressors_{mode}' for mode in ('additive', 'multiplicative') if mode in modes]
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _components_figure(forecast, regressor_components, max_points):
+    cycles = [(column, group, title) for column, group, title in SEASONAL_CYCLES if column in forecast]
+    titles = (["Trend"] + [column.capitalize() for column, _, _ in cycles]
+              + [column.replace('_', ' ').capitalize() for column in regressor_components])
+    fig = make_subplots(rows=len(titles), cols=1, subplot_titles=titles)
+    fig.add_trace(_line(forecast, 'ds', 'trend', 'Trend', FORECAST_COLOR, max_points), row=1, col=1)
+    for row, (column, group, title) in enumerate(cycles, start=2):
+        # The component repeats every cycle, so its mean per position in the cycle is one period
+        cycle = forecast[column].groupby(group(forecast['ds'])).mean()
+        fig.add_trace(go.Scattergl(x=cycle.index, y=cycle.values, mode='lines', name=column.capitalize(),
+                                   line=dict(color=FORECAST_COLOR)), row=row, col=1)
+        fig.update_xaxes(title_text=title, row=row, col=1)
+    # Holiday and regressor effects do not repeat, so they are drawn over time like the trend
+    for row, column in enumerate(regressor_components, start=2 + len(cycles)):
+        fig.add_trace(_line(forecast, 'ds', column, titles[row - 1], FORECAST_COLOR, max_points), row=row, col=1)
+    fig.update_layout(height=250 * len(titles), showlegend=False)
+    return fig.to_plotly_json()
+
+
+def plot_seasonality(model, forecast, max_points=MAX_POINTS):
+    regressor_components = [column for column in _regressor_components(model) if column in forecast]
+    columns = ['ds', 'trend'] + [column for column, _, _ in SEASONAL_CYCLES if column in forecast] + regressor_components
+    return _figure(_components_figure(forecast[columns], regressor_components, max_points))
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _trend_and_seasonality_figure(forecast, max_points):
     fig = make_subplots(rows=2, cols=1, subplot_titles=("Trend Over Time", "Seasonal Components"))
-    fig.add_trace(go.Scatter(x=forecast['ds'], y=forecast['trend'], mode='lines', name='Trend', line=dict(color='blue')), row=1, col=1)
+    fig.add_trace(_line(forecast, 'ds', 'trend', 'Trend', 'blue', max_points), row=1, col=1)
     seasonal_components = forecast[['ds', 'yearly', 'weekly']].dropna()
-    fig.add_trace(go.Scatter(x=seasonal_components['ds'], y=seasonal_components['yearly'], mode='lines', name='Yearly Seasonality', line=dict(color='green')), row=2, col=1)
-    fig.add_trace(go.Scatter(x=seasonal_components['ds'], y=seasonal_components['weekly'], mode='lines', name='Weekly Seasonality', line=dict(color='red')), row=2, col=1)
+    fig.add_trace(_line(seasonal_components, 'ds', 'yearly', 'Yearly Seasonality', 'green', max_points), row=2, col=1)
+    fig.add_trace(_line(seasonal_components, 'ds', 'weekly', 'Weekly Seasonality', 'red', max_points), row=2, col=1)
     fig.update_layout(height=600, width=800, title_text="Trend and Seasonality Analysis", title_x=0.5, title_y=0.9, title_font_size=24, title_font_family='Arial', title_font_color='black')
-    st.plotly_chart(fig)
+    return fig.to_plotly_json()
+
+
+def plot_trend_and_seasonality(forecast, max_points=MAX_POINTS):
+    return _figure(_trend_and_seasonality_figure(forecast[['ds', 'trend', 'yearly', 'weekly']], max_points))
+
 
-def plot_validation(dates, actual, predicted):
+@st.cache_data(max_entries=16, show_spinner=False)
+def _validation_figure(validation, max_points):
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=dates, y=actual, mode='lines', name='Actual', line=dict(color='blue')))
-    fig.add_trace(go.Scatter(x=dates, y=predicted, mode='lines', name='Predicted', line=dict(color='red')))
+    fig.add_trace(_line(validation, 'ds', 'actual', 'Actual', 'blue', max_points))
+    fig.add_trace(_line(validation, 'ds', 'predicted', 'Predicted', 'red', max_points))
     fig.update_layout(title="Validation Results", xaxis_title="Date", yaxis_title="Values")
-    # st.plotly_chart(fig)
+    return fig.to_plotly_json()
+
+
+def plot_validation(dates, actual, predicted, max_points=MAX_POINTS):
+    validation = pd.DataFrame({'ds': np.asarray(dates), 'actual': np.asarray(actual), 'predicted': np.asarray(predicted)})
+    return _figure(_validation_figure(validation, max_points))
+
+def plot_comparison(history, forecast, model_name):
+    fig = go.Figure()
+    forecast = downsample(forecast, 'ds', 'yhat')
+    fig.add_trace(_line(history, 'ds', 'y', 'Actual', 'blue'))
+    fig.add_trace(go.Scattergl(x=forecast['ds'], y=forecast['yhat'], mode='lines', name=model_name, line=dict(color='red')))
+    fig.add_trace(go.Scattergl(x=forecast['ds'], y=forecast['yhat_upper'], mode='lines', line=dict(width=0), showlegend=False))
+    fig.add_trace(go.Scattergl(x=forecast['ds'], y=forecast['yhat_lower'], mode='lines', line=dict(width=0), fill='tonexty', name='Interval'))
+    fig.update_layout(title=f"{model_name} Forecast", xaxis_title="Date", yaxis_title="Values")
+    return fig
+
+def plot_actual_vs_predicted(df, series_id):
+    fig = go.Figure()
+    predicted = df.dropna(subset=['yhat'])
+    if predicted['yhat_lower'].notna().any():
+        fig.add_trace(_line(predicted, 'ds', 'yhat_upper', 'Upper bound', 'lightgrey'))
+        fig.add_trace(_line(predicted, 'ds', 'yhat_lower', 'Lower bound', 'lightgrey'))
+        fig.data[-1].update(fill='tonexty')
+    fig.add_trace(_line(df.dropna(subset=['y']), 'ds', 'y', 'Actual', 'blue'))
+    fig.add_trace(_line(predicted, 'ds', 'yhat', 'Predicted', 'red'))
+    fig.update_layout(title=f"Actual vs Predicted: {series_id}", xaxis_title="Date", yaxis_title="Values")
+    return fig
+
+def plot_backtest(predictions, scores):
+    fig = make_subplots(rows=2, cols=1, subplot_titles=("Error by Cutoff", "Error by Horizon Step"))
+    fig.add_trace(go.Scatter(x=scores['cutoff'], y=scores['mae'], mode='lines+markers', name='MAE', line=dict(color='blue')), row=1, col=1)
+    fig.add_trace(go.Scatter(x=scores['cutoff'], y=scores['rmse'], mode='lines+markers', name='RMSE', line=dict(color='red')), row=1, col=1)
+    abs_error = (predictions['y'] - predictions['yhat']).abs()
+    by_step = abs_error.groupby(predictions['horizon_step']).mean()
+    fig.add_trace(go.Scatter(x=by_step.index, y=by_step.values, mode='lines', name='MAE by step', line=dict(color='green')), row=2, col=1)
+    fig.update_layout(height=600, title="Backtest Results", title_x=0.5)
     return fig
 
 def recommend_actions(forecast):
+    extremes, changes = recommendations(forecast)
     st.write("Recommended Actions:")
-    forecast['month'] = pd.to_datetime(forecast['ds']).dt.month
-    avg_monthly = forecast.groupby('month')['yhat'].mean()
-    max_month = avg_monthly.idxmax()
-    min_month = avg_monthly.idxmin()
-    st.write(f"Highest predicted value in month: {max_month}. Consider ramping up production or stock in this period.")
-    st.write(f"Lowest predicted value in month: {min_month}. Consider running promotions or discounts during this period.")
-    forecast['yhat_diff'] = forecast['yhat'].diff()
-    significant_increase = forecast[forecast['yhat_diff'] > forecast['yhat_diff'].quantile(0.95)]
-    significant_decrease = forecast[forecast['yhat_diff'] < forecast['yhat_diff'].quantile(0.05)]
-    if not significant_increase.empty:
-        st.write("Significant Increases Detected:")
-        st.dataframe(significant_increase[['ds', 'yhat', 'yhat_diff']], width=1200)
-    if not significant_decrease.empty:
-        st.write("Significant Decreases Detected:")
-        st.dataframe(significant_decrease[['ds', 'yhat', 'yhat_diff']], width=1200)
-    plot_trend_and_seasonality(forecast)
+    st.write(f"Highest predicted value in month: {extremes['peak_month'].iloc[0]}. Consider ramping up production or stock in this period.")
+    st.write(f"Lowest predicted value in month: {extremes['trough_month'].iloc[0]}. Consider running promotions or discounts during this period.")
+    for direction, label in (('increase', "Significant Increases Detected:"), ('decrease', "Significant Decreases Detected:")):
+        selected = changes[changes['direction'] == direction]
+        if not selected.empty:
+            st.write(label)
+            st.dataframe(selected[['ds', 'yhat', 'yhat_diff']], width=1200)
+    st.plotly_chart(plot_trend_and_seasonality(forecast))
 
 
 
@@ -1,15 +1,31 @@
 import os
+import sys
 
 import streamlit as st
 import pandas as pd
 from prophet import Prophet
 
+# Shared modules live in the dashboard's utils package (copied next to the app in the Docker image)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'forcast_dashboard'))
+
+from plotting import plot_components, plot_forecast
+from utils.upload_store import UploadStore
+
 # Set the directory to save uploaded files
 UPLOAD_DIR = "uploads"
 
-# Create the directory if it doesn't exist
-if not os.path.exists(UPLOAD_DIR):
-    os.makedirs(UPLOAD_DIR)
+# Uploads are converted to Parquet once per distinct file and kept under a disk quota
+@st.cache_resource
+def get_upload_store():
+    return UploadStore(UPLOAD_DIR)
+
+# Streamlit reruns the script on every interaction; hash and convert each upload once per session
+def stored_upload_key(upload_store, uploaded_file):
+    keys = st.session_state.setdefault('upload_keys', {})
+    marker = (uploaded_file.file_id, uploaded_file.name, uploaded_file.size)
+    if keys.get(marker) not in upload_store:
+        keys[marker] = upload_store.put(uploaded_file.getbuffer(), uploaded_file.name)
+    return keys[marker]
 
 st.title("Lets make some predictions")
 
@@ -17,14 +33,13 @@ st.title("Lets make some predictions")
 uploaded_file = st.file_uploader("Upload dataset CSV file", type="csv")
 
 if uploaded_file is not None:
-    # Save uploaded file to the specified directory
-    file_path = os.path.join(UPLOAD_DIR, uploaded_file.name)
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    # Register the upload; reruns with the same file skip hashing and the CSV parse entirely
+    upload_store = get_upload_store()
+    upload_key = stored_upload_key(upload_store, uploaded_file)
     st.success(f"File '{uploaded_file.name}' saved to '{UPLOAD_DIR}' successfully!")
 
-    # Load the CSV file into a DataFrame
-    df = pd.read_csv(file_path)
+    # Load the stored upload into a DataFrame
+    df = upload_store.read(upload_key)
 
     # Display the uploaded data
     st.write("Uploaded Data:")
@@ -53,9 +68,7 @@ if uploaded_file is not None:
         st.write(forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail())
 
         # Plot the forecast
-        fig1 = model.plot(forecast)
-        st.pyplot(fig1)
+        st.plotly_chart(plot_forecast(model, forecast), use_container_width=True)
 
         # Plot the forecast components
-        fig2 = model.plot_components(forecast)
-        st.pyplot(fig2)
+        st.plotly_chart(plot_components(forecast), use_container_width=True)
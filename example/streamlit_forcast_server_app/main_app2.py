@@ -1,14 +1,32 @@
 import os
+import sys
+
 import streamlit as st
 import pandas as pd
 from prophet import Prophet
 
+# Shared modules live in the dashboard's utils package (copied next to the app in the Docker image)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'forcast_dashboard'))
+
+from plotting import plot_components, plot_forecast
+from utils.regressors import RegressorEncoder
+from utils.upload_store import UploadStore
+
 # Set the directory to save uploaded files
 UPLOAD_DIR = "uploads"
 
-# Create the directory if it doesn't exist
-if not os.path.exists(UPLOAD_DIR):
-    os.makedirs(UPLOAD_DIR)
+# Uploads are converted to Parquet once per distinct file and kept under a disk quota
+@st.cache_resource
+def get_upload_store():
+    return UploadStore(UPLOAD_DIR)
+
+# Streamlit reruns the script on every interaction; hash and convert each upload once per session
+def stored_upload_key(upload_store, uploaded_file):
+    keys = st.session_state.setdefault('upload_keys', {})
+    marker = (uploaded_file.file_id, uploaded_file.name, uploaded_file.size)
+    if keys.get(marker) not in upload_store:
+        keys[marker] = upload_store.put(uploaded_file.getbuffer(), uploaded_file.name)
+    return keys[marker]
 
 # Custom CSS for modern, colorful styling and sidebar
 st.markdown("""
@@ -88,14 +106,13 @@ with st.sidebar:
 
 # Main area for displaying results
 if uploaded_file is not None:
-    # Save uploaded file to the specified directory
-    file_path = os.path.join(UPLOAD_DIR, uploaded_file.name)
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    # Register the upload; reruns with the same file skip the CSV parse entirely
+    upload_store = get_upload_store()
+    upload_key = stored_upload_key(upload_store, uploaded_file)
     st.success(f"File '{uploaded_file.name}' saved to '{UPLOAD_DIR}' successfully!")
 
-    # Load the CSV file into a DataFrame
-    df = pd.read_csv(file_path)
+    # Load the stored upload into a DataFrame
+    df = upload_store.read(upload_key)
 
     # Display the uploaded data
     st.write("Uploaded Data:")
@@ -120,33 +137,26 @@ if uploaded_file is not None:
             df = df.rename(columns={'Date': 'ds', forecast_col: 'y'})
             df['ds'] = pd.to_datetime(df['ds'])
 
-            # One-hot encode categorical variables
-            df = pd.get_dummies(df, drop_first=True)
+            # Every other column is a regressor; categoricals become a capped set of indicators
+            # instead of one dummy per level, so high-cardinality columns stay cheap
+            regressor_columns = [col for col in df.columns if col not in ['ds', 'y']]
+            encoder = RegressorEncoder().fit(df, regressor_columns)
+            regressors = encoder.output_columns
+            train_df = pd.concat([df[['ds', 'y']], encoder.transform(df)], axis=1)
 
             # Initialize the Prophet model
             model = Prophet()
-
-            # Add all other columns as regressors
-            regressors = [col for col in df.columns if col not in ['ds', 'y']]
             for regressor in regressors:
                 model.add_regressor(regressor)
 
             # Fit the model
-            model.fit(df)
+            model.fit(train_df)
 
-            # Prepare future dataframe
-            future = model.make_future_dataframe(periods=365)
-
-            # Ensure all regressor columns are present in the future dataframe
-            future = future.merge(df[['ds'] + regressors], how='left', on='ds')
-
-            # Fill NaN values with forward fill method, then fill remaining NaN values with 0
-            future = future.ffill().bfill()
-
-            # Check for any missing regressors and fill with zero
-            for regressor in regressors:
-                if regressor not in future.columns:
-                    future[regressor] = 0
+            # History rows keep their observed regressors; the 365 future rows are built from the
+            # encoder's summary (last observed values) without merging against the history
+            future_dates = model.make_future_dataframe(periods=365, include_history=False)['ds']
+            future = pd.concat([train_df[['ds'] + regressors], encoder.future_frame(future_dates, 'last')],
+                               ignore_index=True)
 
             # Predict the future values
             forecast = model.predict(future)
@@ -156,12 +166,10 @@ if uploaded_file is not None:
             st.dataframe(forecast[['ds', 'yhat']], width=1200)  # Adjust the width as needed
 
             # Plot the forecast
-            fig1 = model.plot(forecast)
-            st.pyplot(fig1)
+            st.plotly_chart(plot_forecast(model, forecast), use_container_width=True)
 
             # Plot the forecast components
-            fig2 = model.plot_components(forecast)
-            st.pyplot(fig2)
+            st.plotly_chart(plot_components(forecast), use_container_width=True)
         else:
             st.error("The specified column name is not found in the dataset.")
     else:
@@ -0,0 +1,95 @@
+import numpy as np
+import plotly.graph_objects as go
+import streamlit as st
+from plotly.subplots import make_subplots
+
+# Points drawn per trace, about one per horizontal pixel of a wide chart. Longer series
+# are downsampled with LTTB and drawn with WebGL traces instead of matplotlib images.
+MAX_POINTS = 2000
+FORECAST_COLOR = '#0072B2'
+INTERVAL_COLOR = 'rgba(0, 114, 178, 0.2)'
+
+# One cycle of each seasonality: (column, grouping of the dates, x-axis title)
+SEASONAL_CYCLES = [
+    ('weekly', lambda ds: ds.dt.dayofweek, "Day of week"),
+    ('yearly', lambda ds: ds.dt.dayofyear, "Day of year"),
+    ('daily', lambda ds: ds.dt.hour + ds.dt.minute / 60, "Hour of day"),
+]
+
+
+def _numeric(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def lttb(x, y, n_out=MAX_POINTS):
+    """Indices of the n_out points Largest-Triangle-Three-Buckets keeps to draw y against x."""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = _numeric(x)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    sizes = np.diff(edges)
+    mean_x = np.append((np.add.reduceat(x[:n - 1], edges[:-1]) / sizes)[1:], x[-1])
+    mean_y = np.append((np.add.reduceat(y[:n - 1], edges[:-1]) / sizes)[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        ax, ay = x[selected[i]], y[selected[i]]
+        area = np.abs((ax - mean_x[i]) * (y[start:stop] - ay) - (ax - x[start:stop]) * (mean_y[i] - ay))
+        selected[i + 1] = start + np.argmax(area)
+    return selected
+
+
+def downsample(df, x_column, y_column, max_points=MAX_POINTS):
+    return df.iloc[lttb(df[x_column], df[y_column], max_points)]
+
+
+# Figures are cached as JSON-ready dicts per input frame, so widget reruns reuse them
+@st.cache_data(max_entries=16, show_spinner=False)
+def _forecast_figure(history, forecast, max_points):
+    band = downsample(forecast, 'ds', 'yhat', max_points)
+    actual = downsample(history.dropna(), 'ds', 'y', max_points)
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(x=band['ds'], y=band['yhat_upper'], mode='lines', line=dict(width=0),
+                               showlegend=False, hoverinfo='skip'))
+    fig.add_trace(go.Scattergl(x=band['ds'], y=band['yhat_lower'], mode='lines', line=dict(width=0),
+                               fill='tonexty', fillcolor=INTERVAL_COLOR, name='Interval'))
+    fig.add_trace(go.Scattergl(x=band['ds'], y=band['yhat'], mode='lines', name='Predicted',
+                               line=dict(color=FORECAST_COLOR)))
+    fig.add_trace(go.Scattergl(x=actual['ds'], y=actual['y'], mode='markers', name='Actual',
+                               marker=dict(color='black', size=3)))
+    fig.update_layout(title="Forecast", xaxis_title="Date", yaxis_title="Values", height=600)
+    return fig.to_plotly_json()
+
+
+def plot_forecast(model, forecast, max_points=MAX_POINTS):
+    return _forecast_figure(model.history[['ds', 'y']], forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']], max_points)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _components_figure(forecast, max_points):
+    cycles = [(column, group, title) for column, group, title in SEASONAL_CYCLES if column in forecast]
+    fig = make_subplots(rows=1 + len(cycles), cols=1, subplot_titles=["Trend"] + [column.capitalize() for column, _, _ in cycles])
+    trend = downsample(forecast, 'ds', 'trend', max_points)
+    fig.add_trace(go.Scattergl(x=trend['ds'], y=trend['trend'], mode='lines', name='Trend',
+                               line=dict(color=FORECAST_COLOR)), row=1, col=1)
+    for row, (column, group, title) in enumerate(cycles, start=2):
+        # The component repeats every cycle, so its mean per position in the cycle is one period
+        cycle = forecast[column].groupby(group(forecast['ds'])).mean()
+        fig.add_trace(go.Scattergl(x=cycle.index, y=cycle.values, mode='lines', name=column.capitalize(),
+                                   line=dict(color=FORECAST_COLOR)), row=row, col=1)
+        fig.update_xaxes(title_text=title, row=row, col=1)
+    fig.update_layout(height=250 * (1 + len(cycles)), showlegend=False)
+    return fig.to_plotly_json()
+
+
+def plot_components(forecast, max_points=MAX_POINTS):
+    columns = ['ds', 'trend'] + [column for column, _, _ in SEASONAL_CYCLES if column in forecast]
+    return _components_figure(forecast[columns], max_points)
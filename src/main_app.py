@@ -8,6 +8,19 @@ from streamlit_option_menu import option_menu  # Make sure this package is insta
 from statsmodels.tsa.arima.model import ARIMA
 from statsmodels.tsa.holtwinters import ExponentialSmoothing
 import datetime
+import hashlib
+import os
+import sys
+import time
+
+# Shared modules live in the dashboard's utils package
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example', 'forcast_dashboard'))
+
+from utils.data_cleaning import parse_dates
+from utils.data_loading import load_csv_projected, profile_csv
+from utils.history import ForecastHistory
+from utils.model_comparison import MODELS, compare_models
+from utils.recommendations import recommendations
 
 # Custom CSS function
 def local_css(file_name):
@@ -23,16 +36,13 @@ class DataCleaner:
         self.df = df
     
     def clean_data(self, date_column):
-        cleaned_df = self.df.copy()
-        # Convert the date column to datetime format
-        cleaned_df[date_column] = pd.to_datetime(cleaned_df[date_column], errors='coerce')
+        # Parse the date column once and keep it as datetime64, truncated to the day
+        dates = parse_dates(self.df[date_column], date_column).dt.normalize()
+        cleaned_df = self.df.assign(**{date_column: dates})
 
         # Drop rows with missing dates
         cleaned_df.dropna(subset=[date_column], inplace=True)
 
-        # Convert the date column to Y-M-D format
-        cleaned_df[date_column] = cleaned_df[date_column].dt.strftime('%Y-%m-%d')
-
         return cleaned_df
 
 # Prepare data for Prophet
@@ -54,6 +64,16 @@ def forecast_with_prophet(cleaned_df, date_column, target_column, period, season
     fig_seasonality = plot_components_plotly(model, forecast)
     return forecast, fig, fig_seasonality
 
+# Fitted models are cached on the content of the training frame and the seasonality
+# flags, so reruns and horizon-only changes skip model.fit and only call predict.
+@st.cache_resource(max_entries=32, ttl=24 * 3600, show_spinner=False)
+def fit_prophet(df, seasonality):
+    model = Prophet(yearly_seasonality=seasonality['yearly'], 
+                    weekly_seasonality=seasonality['weekly'], 
+                    daily_seasonality=seasonality['daily'])
+    model.fit(df)
+    return model
+
 def forecast_with_prophet(cleaned_df, date_column, target_column, period, seasonality, additional_filter_col=None, additional_filter_value=None):
     df = prepare_data(cleaned_df, date_column, target_column)
     
@@ -65,10 +85,7 @@ def forecast_with_prophet(cleaned_df, date_column, target_column, period, season
             st.error(f"The specified column '{additional_filter_col}' is not found in the dataset.")
             return None, None, None  # Return None if additional filter column is not found
     
-    model = Prophet(yearly_seasonality=seasonality['yearly'], 
-                    weekly_seasonality=seasonality['weekly'], 
-                    daily_seasonality=seasonality['daily'])
-    model.fit(df)
+    model = fit_prophet(df, seasonality)
     future = model.make_future_dataframe(periods=period)
     forecast = model.predict(future)
     
@@ -78,30 +95,19 @@ def forecast_with_prophet(cleaned_df, date_column, target_column, period, season
     return forecast, fig, fig_seasonality
 
 def recommend_actions(forecast):
+    extremes, changes = recommendations(forecast)
     st.write("Recommended Actions:")
 
-    # Monthly analysis
-    forecast['month'] = pd.to_datetime(forecast['ds']).dt.month
-    avg_monthly = forecast.groupby('month')['yhat'].mean()
-    
     # Example recommendations based on average monthly values
-    max_month = avg_monthly.idxmax()
-    min_month = avg_monthly.idxmin()
-    
-    st.write(f"Highest predicted value in month: {max_month}. Consider ramping up production or stock in this period.")
-    st.write(f"Lowest predicted value in month: {min_month}. Consider running promotions or discounts during this period.")
-    
+    st.write(f"Highest predicted value in month: {extremes['peak_month'].iloc[0]}. Consider ramping up production or stock in this period.")
+    st.write(f"Lowest predicted value in month: {extremes['trough_month'].iloc[0]}. Consider running promotions or discounts during this period.")
+
     # Detecting significant changes
-    forecast['yhat_diff'] = forecast['yhat'].diff()
-    significant_increase = forecast[forecast['yhat_diff'] > forecast['yhat_diff'].quantile(0.95)]
-    significant_decrease = forecast[forecast['yhat_diff'] < forecast['yhat_diff'].quantile(0.05)]
-    
-    if not significant_increase.empty:
-        st.write("Significant Increases Detected:")
-        st.dataframe(significant_increase[['ds', 'yhat', 'yhat_diff']], width=1200)
-    if not significant_decrease.empty:
-        st.write("Significant Decreases Detected:")
-        st.dataframe(significant_decrease[['ds', 'yhat', 'yhat_diff']],width=1200)
+    for direction, label in (('increase', "Significant Increases Detected:"), ('decrease', "Significant Decreases Detected:")):
+        selected = changes[changes['direction'] == direction]
+        if not selected.empty:
+            st.write(label)
+            st.dataframe(selected[['ds', 'yhat', 'yhat_diff']], width=1200)
 
     # Visualizing trends
     st.write("Trend and Seasonality Analysis:")
@@ -120,6 +126,44 @@ def recommend_actions(forecast):
 
     st.plotly_chart(fig)
 
+@st.cache_resource
+def get_history():
+    return ForecastHistory(os.path.join(os.getcwd(), '.history', 'history.db'))
+
+def show_history():
+    history = get_history()
+    series = history.series()
+    if series.empty:
+        st.info("No forecasts recorded yet. Runs from Auto Forecast appear here.")
+        return
+    series_id = st.selectbox("Series", series['series_id'])
+    runs = history.runs(series_id)
+    run_labels = {None: "Latest prediction for each date"}
+    run_labels.update({row.run_id: f"Run {row.run_id}: {row.run_at:%Y-%m-%d %H:%M:%S} ({row.model}, {row.horizon} periods)" for row in runs.itertuples()})
+    run_id = st.selectbox("Predictions from", list(run_labels), format_func=run_labels.get)
+    first, last = history.date_range(series_id)
+    if first is None:
+        st.info("No dates recorded for this series yet.")
+        return
+    date_range = st.date_input("Date range", value=(first.date(), last.date()), min_value=first.date(), max_value=last.date())
+    if len(date_range) != 2:
+        return
+    start = time.perf_counter()
+    # The end date is inclusive, including intraday points on it
+    df = history.actual_vs_predicted(series_id, date_range[0], pd.Timestamp(date_range[1]) + pd.Timedelta(days=1, seconds=-1),
+                                     run_id=run_id)
+    st.caption(f"{len(df)} dates read in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    fig = go.Figure()
+    predicted = df.dropna(subset=['yhat'])
+    fig.add_trace(go.Scatter(x=df['ds'], y=df['y'], mode='lines', name='Actual', line=dict(color='blue')))
+    fig.add_trace(go.Scatter(x=predicted['ds'], y=predicted['yhat'], mode='lines', name='Predicted', line=dict(color='red')))
+    fig.update_layout(title=f"Actual vs Predicted: {series_id}", xaxis_title="Date", yaxis_title="Values")
+    st.plotly_chart(fig)
+    st.dataframe(df, width=1200)
+    with st.expander(f"{len(runs)} runs of {series_id}"):
+        st.dataframe(runs, width=1200)
+
 def main():
     st.title("Forecast Dashboard")
 
@@ -137,10 +181,10 @@ def main():
         st.subheader("Auto Forecast with Prophet")
         uploaded_file = st.file_uploader("Upload CSV", type=["csv"])
         if uploaded_file is not None:
-            df = load_csv(uploaded_file)
-            st.write(df.head())
-            date_column = st.selectbox("Select date column", df.columns)
-            target_column = st.selectbox("Select column to forecast", df.columns)
+            sample, _ = profile_csv(uploaded_file)
+            st.write(sample.head())
+            date_column = st.selectbox("Select date column", sample.columns)
+            target_column = st.selectbox("Select column to forecast", sample.columns)
             period = st.number_input("Forecast Period (days)", min_value=1, value=30)
             seasonality = {
                 'yearly': st.checkbox("Yearly Seasonality", value=True),
@@ -148,9 +192,18 @@ def main():
                 'daily': st.checkbox("Daily Seasonality", value=False)
             }
             if st.button("Run Forecast"):
+                df, load_report = load_csv_projected(uploaded_file, [date_column, target_column],
+                                                     date_columns=[date_column], exact_columns=[target_column])
+                st.caption(f"Loaded {load_report['rows']} rows into {load_report['bytes_after'] / 1e6:.1f} MB "
+                           f"(~{load_report['bytes_before'] / 1e6:.1f} MB with a default read)")
                 cleaner = DataCleaner(df)
                 cleaned_df = cleaner.clean_data(date_column)
                 forecast, fig, fig_seasonality = forecast_with_prophet(cleaned_df, date_column, target_column, period, seasonality)
+                actuals = prepare_data(cleaned_df, date_column, target_column).groupby('ds', as_index=False)['y'].sum()
+                # Only the horizon is recorded; in-sample fitted values would win "latest prediction" over real forecasts
+                get_history().record_run(hashlib.sha256(uploaded_file.getbuffer()).hexdigest(), target_column,
+                                         forecast[forecast['ds'] > actuals['ds'].max()], actuals,
+                                         horizon=period, params={'seasonality': seasonality})
                 st.plotly_chart(fig)
                 st.plotly_chart(fig_seasonality)
                 recommend_actions(forecast)
@@ -164,18 +217,38 @@ def main():
         st.subheader("Compare Forecast")
         uploaded_file = st.file_uploader("Upload CSV", type=["csv"])
         if uploaded_file is not None:
-            df = load_csv(uploaded_file)
-            st.write(df.head())
-            date_column = st.selectbox("Select date column", df.columns)
-            target_column = st.selectbox("Select column to forecast", df.columns)
+            sample, _ = profile_csv(uploaded_file)
+            st.write(sample.head())
+            date_column = st.selectbox("Select date column", sample.columns)
+            target_column = st.selectbox("Select column to forecast", sample.columns)
             period = st.number_input("Forecast Period (days)", min_value=1, value=30)
-            model_choice = st.selectbox("Select Model", ["ARIMA", "CNN-QR", "DeepAR+", "ETS", "NPTS", "Prophet"])
-            if st.button("Run Forecast"):
-                # Add code to compare forecasts
-                pass
+            models_to_compare = st.multiselect("Select Models to Compare", MODELS, default=MODELS)
+            timeout = st.number_input("Per-model time limit (seconds)", min_value=1, value=120)
+            if models_to_compare and st.button("Run Forecast"):
+                df, _ = load_csv_projected(uploaded_file, [date_column, target_column],
+                                           date_columns=[date_column], exact_columns=[target_column])
+                cleaned_df = DataCleaner(df).clean_data(date_column)
+                df = prepare_data(cleaned_df, date_column, target_column).groupby('ds', as_index=False)['y'].sum()
+
+                # Models are fitted concurrently, each in its own process with its own time limit
+                with st.spinner("Fitting models..."):
+                    leaderboard, winning_forecast = compare_models(df, period, models_to_compare, timeout=timeout)
+                st.write("Leaderboard (holdout scores):")
+                st.dataframe(leaderboard, width=1200)
+                if winning_forecast is None:
+                    st.error("No model produced a forecast.")
+                else:
+                    winner = leaderboard['model'].iloc[0]
+                    fig = go.Figure()
+                    fig.add_trace(go.Scatter(x=df['ds'], y=df['y'], mode='lines', name='Actual', line=dict(color='blue')))
+                    fig.add_trace(go.Scatter(x=winning_forecast['ds'], y=winning_forecast['yhat'], mode='lines', name=winner, line=dict(color='red')))
+                    fig.update_layout(title=f"{winner} Forecast", xaxis_title="Date", yaxis_title="Values")
+                    st.plotly_chart(fig)
+                    st.dataframe(winning_forecast, width=1200)
 
     elif selected == "History":
-        st.subheader("History (Coming Soon)")
+        st.subheader("History")
+        show_history()
 
 if __name__ == '__main__':
     main()
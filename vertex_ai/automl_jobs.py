@@ -0,0 +1,198 @@
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'QUEUED'
+RUNNING = 'RUNNING'
+SUCCEEDED = 'SUCCEEDED'
+FAILED = 'FAILED'
+
+JOB_COLUMNS = ['id', 'user_id', 'display_name', 'state', 'created_at', 'started_at', 'finished_at', 'model_name', 'error']
+
+# Each process refreshes its unfinished jobs this often; jobs silent for ORPHAN_SECONDS lost their process
+HEARTBEAT_SECONDS = 30
+ORPHAN_SECONDS = 3 * HEARTBEAT_SECONDS
+
+
+class JobStore:
+    """SQLite table of AutoML jobs, so job state survives server restarts.
+
+    Every job records the process that owns it and a heartbeat that process keeps fresh, so
+    several server processes can share one database: only jobs whose owner stopped beating are
+    failed, never the ones another live process is running.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT,
+                    display_name TEXT,
+                    state TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    model_name TEXT,
+                    error TEXT
+                )""")
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, sql_type in (('owner', 'TEXT'), ('heartbeat_at', 'REAL')):
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {sql_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, created_at)")
+        self.fail_orphaned()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def create(self, user_id, display_name):
+        job_id = uuid.uuid4().hex
+        with self._lock, self._connect() as conn:
+            now = time.time()
+            conn.execute("INSERT INTO jobs (id, user_id, display_name, state, created_at, owner, heartbeat_at) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", (job_id, user_id, display_name, QUEUED, now, self.owner, now))
+        return job_id
+
+    def heartbeat(self):
+        """Mark this process's unfinished jobs as still owned."""
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND state IN (?, ?)",
+                         (time.time(), self.owner, QUEUED, RUNNING))
+
+    def fail_orphaned(self):
+        """Fail unfinished jobs whose owning process stopped heartbeating; they will never finish."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            failed = conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, finished_at = ? WHERE state IN (?, ?) "
+                "AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (FAILED, 'interrupted: the server running it stopped', now, QUEUED, RUNNING, now - ORPHAN_SECONDS)).rowcount
+        if failed:
+            logger.info("Failed %d AutoML jobs whose server stopped", failed)
+
+    def update(self, job_id, **fields):
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock, self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id, user_id):
+        """The job if user_id owns it, otherwise None."""
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ? AND user_id = ?",
+                               (job_id, user_id)).fetchone()
+        return dict(zip(JOB_COLUMNS, row)) if row else None
+
+    def list_for_user(self, user_id, limit=50):
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE user_id = ? "
+                                "ORDER BY created_at DESC LIMIT ?", (user_id, limit)).fetchall()
+        return [dict(zip(JOB_COLUMNS, row)) for row in rows]
+
+
+class VertexAutoMLBackend:
+    """Uploads the file to GCS (once per distinct content) and trains an AutoML tabular regression model on Vertex AI."""
+    requires_credentials = True
+
+    def __init__(self, project, location, bucket_name):
+        self.project = project
+        self.location = location
+        self.bucket_name = bucket_name
+
+    def run(self, spec, credentials):
+        from google.cloud import aiplatform
+        from gcs_upload import GCSUploader, storage_client
+
+        bucket = storage_client(credentials, self.project).bucket(self.bucket_name)
+        upload = GCSUploader(bucket, prefix='automl').upload(spec['file_path'])
+        logger.info("Dataset %s at %s (%s in %.1fs)", spec['display_name'], upload['uri'],
+                    f"{upload['parts']} part(s) uploaded" if upload['uploaded'] else "already uploaded",
+                    upload['seconds'])
+
+        aiplatform.init(project=self.project, location=self.location, credentials=credentials)
+        dataset = aiplatform.TabularDataset.create(
+            display_name=spec['display_name'],
+            gcs_source=[upload['uri']]
+        )
+        job = aiplatform.AutoMLTabularTrainingJob(
+            display_name=f"training_job_{spec['display_name']}",
+            optimization_prediction_type="regression",
+            optimization_objective="minimize-rmse"
+        )
+        model = job.run(
+            dataset=dataset,
+            target_column=spec['target_column'],
+            budget_milli_node_hours=spec.get('budget_milli_node_hours', 1000),
+            model_display_name=f"model_{spec['display_name']}",
+            disable_early_stopping=False
+        )
+        return model.resource_name
+
+
+class FakeAutoMLBackend:
+    """Stand-in for Vertex AI that sleeps instead of training, for local load tests."""
+    requires_credentials = False
+
+    def __init__(self, duration=5.0, failure_rate=0.0):
+        self.duration = duration
+        self.failure_rate = failure_rate
+
+    def run(self, spec, credentials):
+        time.sleep(random.uniform(0.5, 1.5) * self.duration)
+        if random.random() < self.failure_rate:
+            raise RuntimeError("fake AutoML training failure")
+        return f"projects/local/locations/local/models/fake_{spec['display_name']}"
+
+
+def backend_from_env(project, location, bucket_name):
+    """Select the training backend with AUTOML_BACKEND=vertex|fake (default vertex)."""
+    if os.environ.get('AUTOML_BACKEND', 'vertex') == 'fake':
+        return FakeAutoMLBackend(duration=float(os.environ.get('FAKE_AUTOML_SECONDS', 5)),
+                                 failure_rate=float(os.environ.get('FAKE_AUTOML_FAILURE_RATE', 0)))
+    return VertexAutoMLBackend(project, location, bucket_name)
+
+
+class JobExecutor:
+    """Runs AutoML jobs on background threads and records their progress in a JobStore."""
+
+    def __init__(self, store, backend, max_workers=4):
+        self.store = store
+        self.backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='automl')
+        threading.Thread(target=self._heartbeat, name='automl-heartbeat', daemon=True).start()
+
+    def _heartbeat(self):
+        # Keeps this process's jobs alive and fails those of processes that died
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            try:
+                self.store.heartbeat()
+                self.store.fail_orphaned()
+            except sqlite3.Error:
+                logger.exception("AutoML job heartbeat failed")
+
+    def submit(self, user_id, spec, credentials=None):
+        job_id = self.store.create(user_id, spec['display_name'])
+        self._executor.submit(self._run, job_id, spec, credentials)
+        return job_id
+
+    def _run(self, job_id, spec, credentials):
+        self.store.update(job_id, state=RUNNING, started_at=time.time())
+        try:
+            model_name = self.backend.run(spec, credentials)
+        except Exception as e:
+            logger.exception("AutoML job %s failed", job_id)
+            self.store.update(job_id, state=FAILED, finished_at=time.time(), error=str(e))
+        else:
+            self.store.update(job_id, state=SUCCEEDED, finished_at=time.time(), model_name=model_name)
@@ -0,0 +1,40 @@
+import io
+import json
+
+import pandas as pd
+import pyarrow as pa
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+
+def records_to_ndjson(records):
+    """Yield one JSON line per record so the response is encoded once and streamed."""
+    for record in records:
+        yield json.dumps(record, default=str) + '\n'
+
+
+def records_to_arrow(records):
+    table = pa.Table.from_pylist(records)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def read_page(response, output_format):
+    """Decode one /data page from a streamed requests response into a DataFrame."""
+    if output_format == 'arrow':
+        return pa.ipc.open_stream(response.raw).read_all().to_pandas()
+    return pd.read_json(response.raw, lines=True, dtype=False)
+
+
+def flatten_value_columns(df):
+    """Replace nested {'value': ...} record columns with their value, column by column."""
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        first = df[col].dropna().head(1)
+        if not first.empty and isinstance(first.iloc[0], dict):
+            df[col] = df[col].str.get('value')
+    return df
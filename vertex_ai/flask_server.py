@@ -1,13 +1,15 @@
 import os
-from flask import Flask, request, redirect, session, jsonify, render_template, url_for
+from flask import Flask, Response, g, request, redirect, session, jsonify, render_template, stream_with_context, url_for
 from requests_oauthlib import OAuth2Session
-from google.oauth2.credentials import Credentials
-from google.cloud import bigquery
-from google.auth.transport.requests import Request
-from google.cloud import storage, aiplatform
 import subprocess
+import threading
+import time
 import webbrowser
 import utils
+from utils.instrumentation import PROMETHEUS_CONTENT_TYPE, registry, span
+from automl_jobs import JobExecutor, JobStore, QUEUED, backend_from_env
+from gcp_clients import ClientPool
+from data_stream import ARROW_STREAM_MIMETYPE, NDJSON_MIMETYPE, records_to_arrow, records_to_ndjson
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your_default_secret_key')
 client_id = ''
@@ -16,6 +18,9 @@ authorization_base_url = "https://accounts.google.com/o/oauth2/auth"
 token_url = "https://oauth2.googleapis.com/token"
 redirect_uri = "http://localhost:5000/callback"
 bucket_name = ''
+history_table = ''  # project.dataset.table holding actual and predicted values
+DATA_PAGE_SIZE = 50000
+MAX_DATA_PAGE_SIZE = 200000
 user_info_url = "https://www.googleapis.com/oauth2/v1/userinfo"
 
 scope = [
@@ -28,9 +33,50 @@ scope = [
 
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
+# AutoML training jobs run in the background; set AUTOML_BACKEND=fake to exercise the flow locally.
+# Created on first use so importing this module does not touch the job table.
+automl_executor = None
+automl_executor_lock = threading.Lock()
+
+def get_automl_executor():
+    global automl_executor
+    with automl_executor_lock:
+        if automl_executor is None:
+            automl_jobs = JobStore(os.environ.get('AUTOML_JOBS_DB', 'automl_jobs.db'))
+            automl_executor = JobExecutor(automl_jobs, backend_from_env(project='', location='', bucket_name=bucket_name))
+    return automl_executor
+
 # Store the token in memory
 global_token = None
 global user_info
+user_info = None
+
+# Credentials and GCP clients are reused per user; tokens refresh only near expiry
+client_pool = ClientPool(token_url, client_id, client_secret)
+
+def current_user_id():
+    return user_info['id'] if user_info else 'default'
+
+def automl_user_id():
+    # Without a token, jobs run on the local fake backend and belong to 'local'
+    return current_user_id() if global_token else 'local'
+
+registry.describe('http_request_seconds', 'Time to build the response headers, by route')
+registry.describe('http_requests_total', 'Responses by route and status code')
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed bodies (/data) are still being sent here, so this is time to first byte for them
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    registry.observe('http_request_seconds', time.perf_counter() - g.request_start,
+                     method=request.method, endpoint=endpoint)
+    registry.inc('http_requests_total', method=request.method, endpoint=endpoint, status=response.status_code)
+    return response
+
 @app.route('/')
 def index():
     # global global_token
@@ -78,32 +124,54 @@ def get_data():
     if not global_token:
         return redirect('/login')
 
-    token = global_token
-    credentials = Credentials(
-        token=token['access_token'],
-        refresh_token=token['refresh_token'],
-        token_uri=token_url,
-        client_id=client_id,
-        client_secret=client_secret
-    )
-    credentials.refresh(Request())
-    client = bigquery.Client(credentials=credentials, project="")
+    try:
+        page_size = int(request.args.get('page_size', DATA_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'page_size must be an integer'}), 400
+    # Clamped to [1, MAX_DATA_PAGE_SIZE]; BigQuery rejects a zero or negative page size
+    page_size = min(max(page_size, 1), MAX_DATA_PAGE_SIZE)
+
+    client = client_pool.bigquery(current_user_id(), global_token, project="")
+
+    # Page through the table with the BigQuery page token as the cursor, reading only requested columns
+    cursor = request.args.get('cursor') or None
+    columns = [col for col in request.args.get('columns', '').split(',') if col]
+    output_format = request.args.get('format', 'ndjson')
+
+    with span('bigquery_page'):
+        table = client.get_table(history_table)
+        selected_fields = [field for field in table.schema if field.name in columns] if columns else None
+        rows = client.list_rows(table, selected_fields=selected_fields, page_size=page_size, page_token=cursor)
+        page = next(rows.pages, None)
+        records = [dict(row.items()) for row in page] if page is not None else []
+    headers = {'X-Next-Cursor': rows.next_page_token or ''}
 
-    query = """
-    SELECT *
-    FROM `` LIMIT 1000
-    """
-    df = client.query(query).to_dataframe()
-    data_json = df.to_json(orient='records')
+    if not records and cursor is None:
+        return '', 204
+    if output_format == 'arrow':
+        return Response(records_to_arrow(records), mimetype=ARROW_STREAM_MIMETYPE, headers=headers)
+    return Response(stream_with_context(records_to_ndjson(records)), mimetype=NDJSON_MIMETYPE, headers=headers)
 
-    return jsonify(data_json)
+
+@app.route('/metrics/clients')
+def client_pool_metrics():
+    return jsonify(client_pool.stats())
+
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus scrape endpoint: request latency, stage timings and the client pool's counters
+    for name, value in client_pool.stats().items():
+        registry.set(f'gcp_client_pool_{name}', value)
+    return Response(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
 
 
 @app.route('/automl',methods=['POST'])
 def automl():
     global user_info
     global global_token
-    if not global_token:
+    executor = get_automl_executor()
+    if not global_token and executor.backend.requires_credentials:
         return 'no global token', redirect('/login')
 
     file_path = request.form.get('file_path')
@@ -114,50 +182,35 @@ def automl():
     if not file_path or not os.path.exists(file_path):
         return "Invalid file path", 400
 
-    token = global_token
-    credentials = Credentials(
-        token=token['access_token'],
-        refresh_token=token['refresh_token'],
-        token_uri=token_url,
-        client_id=client_id,
-        client_secret=client_secret,
-    )
-    credentials.refresh(Request())
-    storage_client = storage.Client(credentials=credentials, project='')
-    bucket = storage_client.bucket(bucket_name)
-
-    # Upload the CSV file to the bucket
-    blob_name = f"{os.path.basename(file_path).split('.')[0]}_{user_info['id']}.csv"
-    blob = bucket.blob(blob_name)
-    blob.upload_from_filename(file_path)
-
-    # Initialize Vertex AI client
-    aiplatform.init(project='', location='', credentials=credentials)
-
-    # Create dataset
-    dataset = aiplatform.TabularDataset.create(
-        display_name=f"{os.path.basename(file_path).split('.')[0]}_{user_info['id']}",
-        gcs_source=[f"gs://{bucket_name}/{blob_name}"]
-    )
-
-    job = aiplatform.AutoMLTabularTrainingJob(
-            display_name=f"training_job_{os.path.basename(file_path).split('.')[0]}_{user_info['id']}",
-            optimization_prediction_type="regression",
-            optimization_objective="minimize-rmse"
-        )
-
-    # Train the model
-    model = job.run(
-        dataset=dataset,
-        target_column=target_column,
-        budget_milli_node_hours=1000,
-        model_display_name=f"model_{os.path.basename(file_path).split('.')[0]}_{user_info['id']}",
-        disable_early_stopping=False
-    )
-
-
-    return f"Successfully uploaded {os.path.basename(file_path)} to Google Cloud Storage and started AutoML training."
-    
+    user_id = automl_user_id()
+    credentials = client_pool.credentials(user_id, global_token) if global_token else None
+
+    name = f"{os.path.basename(file_path).split('.')[0]}_{user_id}"
+    spec = {
+        'file_path': file_path,
+        'display_name': name,
+        'target_column': target_column,
+        'budget_milli_node_hours': 1000,
+    }
+    # Training runs for the whole budget, so it happens on a background thread
+    job_id = executor.submit(user_id, spec, credentials)
+
+    return jsonify({
+        'job_id': job_id,
+        'state': QUEUED,
+        'status_url': url_for('automl_status', job_id=job_id),
+        'message': f"Queued AutoML training for {os.path.basename(file_path)}."
+    }), 202
+
+
+@app.route('/automl/<job_id>')
+def automl_status(job_id):
+    # Other users' jobs are reported as unknown, not forbidden, so their ids cannot be probed
+    job = get_automl_executor().store.get(job_id, automl_user_id())
+    if job is None:
+        return jsonify({'error': 'Unknown job id'}), 404
+    return jsonify(job)
+
 
 if __name__ == '__main__':
     app.debug = True
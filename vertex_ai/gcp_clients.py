@@ -0,0 +1,131 @@
+import datetime
+import logging
+import threading
+
+import requests
+from google.auth.transport.requests import Request
+from google.cloud import bigquery, storage
+from google.oauth2.credentials import Credentials
+
+logger = logging.getLogger(__name__)
+
+# Refresh access tokens this long before they expire rather than on every request
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class _UserClients:
+    def __init__(self, credentials, refresh_token):
+        self.credentials = credentials
+        self.refresh_token = refresh_token
+        self.lock = threading.Lock()
+        self.clients = {}
+
+
+class ClientPool:
+    """Per-user cache of OAuth credentials and BigQuery/Storage clients.
+
+    Tokens are refreshed only when missing or close to expiry, under a per-user lock so
+    concurrent requests share one refresh. Cached clients keep their HTTP sessions, so
+    connections are reused across requests.
+    """
+
+    def __init__(self, token_uri, client_id, client_secret, refresh_margin=REFRESH_MARGIN):
+        self.token_uri = token_uri
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_margin = refresh_margin
+        self._users = {}
+        self._lock = threading.Lock()
+        # Token refreshes go through one pooled session instead of a new connection each time
+        self._refresh_request = Request(session=requests.Session())
+        self._metrics = {
+            'credential_hits': 0,
+            'credential_misses': 0,
+            'client_hits': 0,
+            'client_misses': 0,
+            'refreshes': 0,
+            'refreshes_coalesced': 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._metrics[name] += 1
+
+    def _make_credentials(self, token):
+        credentials = Credentials(
+            token=token['access_token'],
+            refresh_token=token.get('refresh_token'),
+            token_uri=self.token_uri,
+            client_id=self.client_id,
+            client_secret=self.client_secret
+        )
+        if token.get('expires_at'):
+            # google-auth compares expiry as naive UTC
+            credentials.expiry = datetime.datetime.fromtimestamp(token['expires_at'], datetime.timezone.utc).replace(tzinfo=None)
+        return credentials
+
+    def _user(self, user_id, token):
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is not None and user.refresh_token == token.get('refresh_token'):
+                self._metrics['credential_hits'] += 1
+                return user
+            # New user or a new login: start over with fresh credentials and clients
+            user = _UserClients(self._make_credentials(token), token.get('refresh_token'))
+            self._users[user_id] = user
+            self._metrics['credential_misses'] += 1
+            return user
+
+    def _needs_refresh(self, credentials):
+        if not credentials.token or credentials.expiry is None:
+            return True
+        return credentials.expiry - self.refresh_margin <= _utcnow()
+
+    def _refreshed_user(self, user_id, token):
+        user = self._user(user_id, token)
+        needed_before_lock = self._needs_refresh(user.credentials)
+        with user.lock:
+            if self._needs_refresh(user.credentials):
+                user.credentials.refresh(self._refresh_request)
+                self._count('refreshes')
+                logger.info("Refreshed access token for user %s", user_id)
+            elif needed_before_lock:
+                # Another request refreshed the token while this one waited for the lock
+                self._count('refreshes_coalesced')
+        return user
+
+    def credentials(self, user_id, token):
+        return self._refreshed_user(user_id, token).credentials
+
+    def _client(self, kind, factory, user_id, token, project):
+        user = self._refreshed_user(user_id, token)
+        key = (kind, project)
+        with user.lock:
+            client = user.clients.get(key)
+            if client is None:
+                client = factory(credentials=user.credentials, project=project)
+                user.clients[key] = client
+                self._count('client_misses')
+            else:
+                self._count('client_hits')
+        return client
+
+    def bigquery(self, user_id, token, project):
+        return self._client('bigquery', bigquery.Client, user_id, token, project)
+
+    def storage(self, user_id, token, project):
+        return self._client('storage', storage.Client, user_id, token, project)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats['users'] = len(self._users)
+        credential_lookups = stats['credential_hits'] + stats['credential_misses']
+        client_lookups = stats['client_hits'] + stats['client_misses']
+        stats['credential_hit_rate'] = stats['credential_hits'] / credential_lookups if credential_lookups else 0.0
+        stats['client_hit_rate'] = stats['client_hits'] / client_lookups if client_lookups else 0.0
+        return stats
@@ -0,0 +1,187 @@
+"""Parallel, resumable, content-addressed uploads of datasets to Cloud Storage.
+
+Objects are named by the SHA-256 of their content, so an upload of a file that is already in
+the bucket is a single metadata lookup. Large files are uploaded as parts in parallel and
+composed into the final object; parts that reached the bucket before a failure are kept and
+skipped on the next attempt, so a retry resumes where the last one stopped.
+
+To try it against a local fake GCS server instead of a real bucket:
+    docker run -d -p 4443:4443 fsouza/fake-gcs-server -scheme http
+    STORAGE_EMULATOR_HOST=http://localhost:4443 python gcs_upload.py data.csv --bucket test --create-bucket
+"""
+import argparse
+import base64
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import google_crc32c
+from google.api_core.exceptions import PreconditionFailed
+from google.cloud import storage
+
+logger = logging.getLogger(__name__)
+
+PART_BYTES = 32 * 1024 * 1024
+# Files up to this size go up as one resumable upload instead of composed parts
+COMPOSITE_THRESHOLD = 2 * PART_BYTES
+# GCS composes at most 32 source objects per request
+MAX_COMPOSE_SOURCES = 32
+READ_BYTES = 1024 * 1024
+
+
+def storage_client(credentials=None, project=None):
+    """A storage client, or an anonymous one for the emulator when STORAGE_EMULATOR_HOST is set."""
+    if os.environ.get('STORAGE_EMULATOR_HOST'):
+        from google.auth.credentials import AnonymousCredentials
+        return storage.Client(credentials=AnonymousCredentials(), project=project or 'local')
+    return storage.Client(credentials=credentials, project=project)
+
+
+def _crc32c_b64(checksum):
+    return base64.b64encode(checksum.digest()).decode()
+
+
+def file_checksums(path, part_bytes=PART_BYTES):
+    """SHA-256 of the whole file and the CRC32C of each part, from one read of the file."""
+    sha256 = hashlib.sha256()
+    part_crcs = []
+    crc = google_crc32c.Checksum()
+    part_filled = 0
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(min(READ_BYTES, part_bytes - part_filled))
+            if not data:
+                break
+            sha256.update(data)
+            crc.update(data)
+            part_filled += len(data)
+            if part_filled == part_bytes:
+                part_crcs.append(_crc32c_b64(crc))
+                crc = google_crc32c.Checksum()
+                part_filled = 0
+    if part_filled or not part_crcs:
+        part_crcs.append(_crc32c_b64(crc))
+    return sha256.hexdigest(), part_crcs
+
+
+class GCSUploader:
+    """Uploads files to one bucket under prefix/<sha256><extension>, skipping content already there."""
+
+    def __init__(self, bucket, prefix='uploads', part_bytes=PART_BYTES, composite_threshold=COMPOSITE_THRESHOLD,
+                 max_workers=8):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.part_bytes = part_bytes
+        self.composite_threshold = composite_threshold
+        self.max_workers = max_workers
+
+    def object_name(self, digest, extension):
+        return f"{self.prefix}/{digest}{extension}"
+
+    def upload(self, path, content_type='text/csv'):
+        """Upload path unless its content is already in the bucket.
+
+        Returns a dict with the gs:// uri, whether bytes were sent ('uploaded'), the number of
+        parts sent (0 when deduplicated) and the elapsed seconds.
+        """
+        start = time.perf_counter()
+        size = os.path.getsize(path)
+        digest, part_crcs = file_checksums(path, self.part_bytes)
+        name = self.object_name(digest, os.path.splitext(path)[1])
+        result = {'uri': f"gs://{self.bucket.name}/{name}", 'bytes': size, 'uploaded': False, 'parts': 0}
+
+        if self.bucket.get_blob(name) is not None:
+            logger.info("Skipping upload of %s: %s already exists", path, result['uri'])
+        elif size <= self.composite_threshold:
+            self._upload_single(path, name, digest, content_type)
+            result.update(uploaded=True, parts=1)
+        else:
+            result.update(uploaded=True, parts=self._upload_composite(path, name, digest, part_crcs, content_type))
+        result['seconds'] = time.perf_counter() - start
+        return result
+
+    def _metadata(self, path, digest):
+        return {'sha256': digest, 'source_name': os.path.basename(path)}
+
+    def _upload_single(self, path, name, digest, content_type):
+        # A chunk size makes this a resumable upload, which the client retries chunk by chunk
+        blob = self.bucket.blob(name, chunk_size=8 * 1024 * 1024)
+        blob.metadata = self._metadata(path, digest)
+        # if_generation_match=0: a concurrent upload of the same content wins and this one is a no-op
+        try:
+            blob.upload_from_filename(path, content_type=content_type, if_generation_match=0)
+        except PreconditionFailed:
+            logger.info("%s was uploaded concurrently", name)
+
+    def _upload_part(self, path, name, index, expected_crc):
+        blob = self.bucket.get_blob(name)
+        if blob is not None and blob.crc32c == expected_crc:
+            return False  # Sent by an earlier attempt
+        offset = index * self.part_bytes
+        size = min(self.part_bytes, os.path.getsize(path) - offset)
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            self.bucket.blob(name).upload_from_file(f, size=size, checksum='crc32c')
+        return True
+
+    def _upload_composite(self, path, name, digest, part_crcs, content_type):
+        part_prefix = f"{self.prefix}/.parts/{digest}"
+        part_names = [f"{part_prefix}/{index:05d}" for index in range(len(part_crcs))]
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='gcs-part') as executor:
+            sent = list(executor.map(lambda args: self._upload_part(path, *args),
+                                     [(part_name, index, crc) for index, (part_name, crc)
+                                      in enumerate(zip(part_names, part_crcs))]))
+        logger.info("Uploaded %d of %d parts of %s (%d already present)",
+                    sum(sent), len(part_names), path, len(sent) - sum(sent))
+
+        # Compose in rounds of at most 32 sources until one object remains
+        sources = [self.bucket.blob(part_name) for part_name in part_names]
+        intermediates = []
+        level = 0
+        while len(sources) > MAX_COMPOSE_SOURCES:
+            grouped = []
+            for group_index in range(0, len(sources), MAX_COMPOSE_SOURCES):
+                target = self.bucket.blob(f"{part_prefix}/compose-{level}-{group_index // MAX_COMPOSE_SOURCES:05d}")
+                target.compose(sources[group_index:group_index + MAX_COMPOSE_SOURCES])
+                grouped.append(target)
+            intermediates.extend(grouped)
+            sources = grouped
+            level += 1
+        destination = self.bucket.blob(name)
+        destination.content_type = content_type
+        destination.metadata = self._metadata(path, digest)
+        destination.compose(sources)
+
+        for blob in [self.bucket.blob(part_name) for part_name in part_names] + intermediates:
+            try:
+                blob.delete()
+            except Exception as e:
+                logger.warning("Could not delete upload part %s: %s", blob.name, e)
+        return sum(sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--prefix', default='uploads')
+    parser.add_argument('--part-mb', type=int, default=PART_BYTES // (1024 * 1024))
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--create-bucket', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    client = storage_client()
+    bucket = client.bucket(args.bucket)
+    if args.create_bucket and not bucket.exists():
+        bucket = client.create_bucket(args.bucket)
+    part_bytes = args.part_mb * 1024 * 1024
+    uploader = GCSUploader(bucket, args.prefix, part_bytes=part_bytes, composite_threshold=2 * part_bytes,
+                           max_workers=args.workers)
+    print(uploader.upload(args.path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Submit many AutoML jobs concurrently and poll them to completion.
+
+Start the server with the fake backend first:
+    AUTOML_BACKEND=fake FAKE_AUTOML_SECONDS=2 python flask_server.py
+then run:
+    python load_test_automl.py --jobs 50
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def submit(server, file_path):
+    start = time.perf_counter()
+    response = requests.post(f"{server}/automl", data={'file_path': file_path, 'target_column': 'y'}, timeout=30)
+    response.raise_for_status()
+    return response.json()['job_id'], time.perf_counter() - start
+
+
+def wait_for(server, job_id, poll_seconds):
+    while True:
+        job = requests.get(f"{server}/automl/{job_id}", timeout=30).json()
+        if job['state'] in ('SUCCEEDED', 'FAILED'):
+            return job
+        time.sleep(poll_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', default='http://127.0.0.1:5000')
+    parser.add_argument('--jobs', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--poll-seconds', type=float, default=0.5)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+        f.write("ds,y\n2024-01-01,1\n2024-01-02,2\n")
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            submitted = list(executor.map(lambda _: submit(args.server, f.name), range(args.jobs)))
+            latencies = [latency for _, latency in submitted]
+            print(f"submitted {len(submitted)} jobs: median {statistics.median(latencies) * 1000:.1f} ms, "
+                  f"max {max(latencies) * 1000:.1f} ms per request")
+            jobs = list(executor.map(lambda job_id: wait_for(args.server, job_id, args.poll_seconds),
+                                     [job_id for job_id, _ in submitted]))
+    finally:
+        os.remove(f.name)
+
+    durations = [job['finished_at'] - job['created_at'] for job in jobs]
+    states = [job['state'] for job in jobs]
+    print(f"succeeded {states.count('SUCCEEDED')}, failed {states.count('FAILED')}, "
+          f"median time to finish {statistics.median(durations):.2f}s")
+
+
+if __name__ == '__main__':
+    main()
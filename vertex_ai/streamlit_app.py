@@ -1,62 +1,105 @@
 import streamlit as st
 import requests
 import pandas as pd
-import json
 from streamlit.components.v1 import iframe
 from streamlit_option_menu import option_menu
 from utils.data_loading import load_csv 
 from utils.data_cleaning import DataCleaner
+from utils.history import ForecastHistory
+from utils.upload_store import UploadStore
+from data_stream import flatten_value_columns, read_page
 import os
 import threading
+import time
 from flask_server import app
 
-def fetch_data():
+HISTORY_COLUMNS = ['PSData', 'predicted_PSData', 'Date', 'predicted_on_Date']
+
+@st.cache_resource
+def get_upload_store():
+    return UploadStore(os.path.join(os.getcwd(), 'uploads'))
+
+# Streamlit reruns the script on every interaction; hash and convert each upload once per session
+def stored_upload_key(upload_store, uploaded_file):
+    keys = st.session_state.setdefault('upload_keys', {})
+    marker = (uploaded_file.file_id, uploaded_file.name, uploaded_file.size)
+    if keys.get(marker) not in upload_store:
+        keys[marker] = upload_store.put(uploaded_file.getbuffer(), uploaded_file.name)
+    return keys[marker]
+
+@st.cache_resource
+def get_history():
+    return ForecastHistory(os.path.join(os.getcwd(), '.history', 'history.db'))
+
+def import_bigquery_history(history, df):
+    """Store the BigQuery history as one run per predicted_on_Date; re-importing replaces those runs."""
+    df = pd.DataFrame({
+        'ds': pd.to_datetime(df['Date'], dayfirst=True),
+        'run_date': pd.to_datetime(df['predicted_on_Date'], dayfirst=True),
+        'y': pd.to_numeric(df['PSData'], errors='coerce'),
+        'yhat': pd.to_numeric(df['predicted_PSData'], errors='coerce'),
+    }).dropna(subset=['ds', 'run_date'])
+    history.record_actuals('bigquery', 'PSData', df.dropna(subset=['y']).groupby('ds', as_index=False)['y'].last())
+    for run_date, run in df.groupby('run_date'):
+        history.record_run('bigquery', 'PSData', run[['ds', 'yhat']].dropna(), horizon=int((run['ds'] > run_date).sum()),
+                           model='vertex', run_at=run_date.timestamp())
+    return df['run_date'].nunique()
+
+def fetch_data(columns=None, page_size=50000, output_format='arrow'):
+    """Read the /data history page by page following the cursor, then flatten nested values."""
+    frames = []
+    cursor = None
+    progress = st.empty()
     try:
-
-        response = requests.get('http://localhost:5000/data')
-        st.write(f"Response status code: {response.status_code}")
-        st.write(f"Response headers: {response.headers}")
-        st.write(f"Response content preview: {response.text[:500]}")  # Display first 500 characters for preview
-
-        if response.status_code == 200:
-            try:
-                data = response.json()
-                st.write("Data successfully fetched from server:")
-                st.json(data)  # Display JSON data for debugging
-
-                # Ensure the JSON data is properly parsed into a list of dictionaries
-                if isinstance(data, str):
-                    data = json.loads(data)
-
-                # Flatten the JSON data manually
-                flat_data = []
-                for item in data:
-                    # Flatten the nested 'predicted_PSData' field
-                    if 'predicted_PSData' in item and isinstance(item['predicted_PSData'], dict):
-                        item['predicted_PSData'] = item['predicted_PSData']['value']
-                    flat_data.append(item)
-
-                # Convert the flattened data to a DataFrame
-                df = pd.DataFrame(flat_data)
-                st.write("DataFrame created from JSON data:")
-                # st.dataframe(df)  # Display DataFrame for debugging
-                return df
-            except ValueError as e:
-                st.error(f"Failed to decode JSON response: {e}")
-                return None
-        elif response.status_code == 204:
-            st.error("No data found.")
-            return None
-        else:
-            st.error(f"Failed to fetch data. Status code: {response.status_code}")
-            return None
+        with requests.Session() as session:
+            while True:
+                params = {'page_size': page_size, 'format': output_format}
+                if cursor:
+                    params['cursor'] = cursor
+                if columns:
+                    params['columns'] = ','.join(columns)
+                with session.get('http://localhost:5000/data', params=params, stream=True) as response:
+                    if response.status_code == 204:
+                        st.error("No data found.")
+                        return None
+                    if response.status_code != 200:
+                        st.error(f"Failed to fetch data. Status code: {response.status_code}")
+                        return None
+                    response.raw.decode_content = True
+                    frames.append(read_page(response, output_format))
+                    cursor = response.headers.get('X-Next-Cursor')
+                progress.caption(f"Fetched {sum(len(frame) for frame in frames)} rows")
+                if not cursor:
+                    break
     except requests.exceptions.RequestException as e:
         st.error(f"An error occurred while fetching data: {e}")
         return None
     except ValueError as e:
-        st.error(f"Failed to decode JSON response: {e}")
+        st.error(f"Failed to decode response: {e}")
         return None
 
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return flatten_value_columns(df)
+
+def show_automl_jobs():
+    job_ids = st.session_state.get('automl_jobs', [])
+    if not job_ids:
+        return
+    st.subheader("AutoML Jobs")
+    if st.button("Refresh job status"):
+        pass  # Any widget interaction reruns the script and re-polls below
+    jobs = []
+    for job_id in job_ids:
+        try:
+            response = requests.get(f'http://127.0.0.1:5000/automl/{job_id}', timeout=5)
+        except requests.exceptions.RequestException as e:
+            st.error(f"Could not fetch status of job {job_id}: {e}")
+            continue
+        if response.status_code == 200:
+            jobs.append(response.json())
+    if jobs:
+        st.dataframe(pd.DataFrame(jobs)[['id', 'display_name', 'state', 'model_name', 'error']])
+
 def main():
     st.title("BigQuery Data Visualization")
 
@@ -70,22 +113,16 @@ def main():
 
     if selected == "Auto Forecast":
         st.subheader("Auto Forecast")
-        specific_dir = os.path.join(os.getcwd(), 'uploads')
         uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
-        
-        if not os.path.exists(specific_dir):
-            os.makedirs(specific_dir)
 
         if uploaded_file is not None:
-            df = load_csv(uploaded_file)
+            upload_store = get_upload_store()
+            upload_key = stored_upload_key(upload_store, uploaded_file)
+            df = upload_store.read(upload_key)
             cleaner = DataCleaner(df)
             
             if df is not None:
-                file_path = os.path.join(specific_dir, uploaded_file.name)
-                cleaned_file_path = os.path.join(specific_dir, f"cleaned_{uploaded_file.name}")
-                df.to_csv(cleaned_file_path, index=False)
-                
-                st.write(f"Cleaned file saved to: {cleaned_file_path}")
+                st.write(f"Upload stored as: {upload_store.path(upload_key)}")
                 
                 date_column = st.selectbox("Select date column", df.columns)
                 target_column = st.selectbox("Select column to forecast", df.columns)
@@ -97,6 +134,8 @@ def main():
                 # budget_milli_node_hours = st.number_input("Budget (milli node hours)", min_value=100, step=100)
                 df = cleaner.clean_data(date_column)
                 if st.button('Start AutoML Training'):
+                    # AutoML reads CSV from GCS, so export the stored upload once
+                    cleaned_file_path = upload_store.export_csv(upload_key)
                     data = {
                         'file_path': cleaned_file_path,
                         'target_column': target_column,
@@ -110,45 +149,51 @@ def main():
 
                     response = requests.post('http://127.0.0.1:5000/automl', data=data)
 
-                    if response.status_code == 200:
-                        st.success(response.text)
+                    if response.status_code == 202:
+                        job = response.json()
+                        st.session_state.setdefault('automl_jobs', []).append(job['job_id'])
+                        st.success(f"{job['message']} Job id: {job['job_id']}")
                     else:
                         st.error(f"Error: {response.text}")   
 
+        show_automl_jobs()
+
     elif selected == "History":
-        df = fetch_data()
-        if df is not None:
-            st.write("Available columns:", df.columns.tolist())
-
-            required_columns = ['PSData', 'predicted_PSData', 'Date', 'predicted_on_Date']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-
-            if missing_columns:
-                st.error(f"Missing columns in the dataset: {', '.join(missing_columns)}. Please check the available columns above.")
-            else:
-                # Convert 'Date' column to datetime if it's not already
-                if not pd.api.types.is_datetime64_any_dtype(df['Date']):
-                    df['Date'] = pd.to_datetime(df['Date'], dayfirst=True)
-                    st.write("Converted 'Date' column to datetime")
-
-                # Convert 'predicted_on_Date' column to datetime if it's not already
-                if not pd.api.types.is_datetime64_any_dtype(df['predicted_on_Date']):
-                    df['predicted_on_Date'] = pd.to_datetime(df['predicted_on_Date'], dayfirst=True)
-                    st.write("Converted 'predicted_on_Date' column to datetime")
-
-                # Ensure PSData and predicted_PSData are numeric
-                df['PSData'] = pd.to_numeric(df['PSData'], errors='coerce')
-                df['predicted_PSData'] = pd.to_numeric(df['predicted_PSData'], errors='coerce')
-
-                # Set 'Date' column as the index
-                df.set_index('Date', inplace=True)
-                st.write("Set 'Date' column as index")
-
-                st.write("Actual vs Predicted Data")
-                st.line_chart(df[['PSData', 'predicted_PSData']])
-
-                st.write("Detailed Data")
-                st.dataframe(df)
+        st.subheader("History")
+        history = get_history()
+        # BigQuery is read only on request, or once per session into an empty store; reruns and offline
+        # use read the local store, even when that first import failed or returned nothing
+        sync = st.button("Sync from BigQuery")
+        if sync or (history.series().empty and not st.session_state.get('bigquery_import_attempted')):
+            st.session_state['bigquery_import_attempted'] = True
+            df = fetch_data(columns=HISTORY_COLUMNS)
+            if df is not None:
+                missing_columns = [col for col in HISTORY_COLUMNS if col not in df.columns]
+                if missing_columns:
+                    st.error(f"Missing columns in the dataset: {', '.join(missing_columns)}. Available columns: {df.columns.tolist()}")
+                else:
+                    st.success(f"Imported {import_bigquery_history(history, df)} forecast runs")
+        if history.series().empty:
+            st.info("No history stored yet. Use Sync from BigQuery to import it.")
+            return
+
+        series_id = st.selectbox("Series", history.series()['series_id'])
+        first, last = history.date_range(series_id)
+        date_range = None
+        if first is None:
+            st.info("No dates recorded for this series yet.")
+        else:
+            date_range = st.date_input("Date range", value=(first.date(), last.date()), min_value=first.date(), max_value=last.date())
+        if date_range is not None and len(date_range) == 2:
+            start = time.perf_counter()
+            df = history.actual_vs_predicted(series_id, date_range[0], pd.Timestamp(date_range[1]) + pd.Timedelta(days=1, seconds=-1))
+            st.caption(f"{len(df)} dates read in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+            st.write("Actual vs Predicted Data")
+            st.line_chart(df.set_index('ds')[['y', 'yhat']].rename(columns={'y': 'PSData', 'yhat': 'predicted_PSData'}))
+
+            st.write("Detailed Data")
+            st.dataframe(df)
 
 
 if __name__ == '__main__':